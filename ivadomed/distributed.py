@@ -0,0 +1,113 @@
+"""Distributed data-parallel training on the local machine, see the ``distributed`` training parameter.
+
+The training is run in several processes, one per GPU (or several on the CPU with the ``gloo`` backend). Each process
+trains a replica of the model on its shard of the dataset, and the gradients are averaged between the processes.
+"""
+import socket
+import sys
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from loguru import logger
+
+
+def is_initialized():
+    """Return True if the current process belongs to a distributed process group."""
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    """Return the rank of the current process, 0 if it is not distributed."""
+    return dist.get_rank() if is_initialized() else 0
+
+
+def get_world_size():
+    """Return the number of processes of the distributed training, 1 if it is not distributed."""
+    return dist.get_world_size() if is_initialized() else 1
+
+
+def is_main_process():
+    """Return True if the current process is the first one (rank 0), which logs and saves the training outputs."""
+    return get_rank() == 0
+
+
+def get_device():
+    """Return the device of the tensors exchanged between the processes: the GPU of the process with NCCL."""
+    if is_initialized() and dist.get_backend() == "nccl":
+        return torch.device("cuda", torch.cuda.current_device())
+    return torch.device("cpu")
+
+
+def average(total, count):
+    """Average a sum over all the processes.
+
+    Args:
+        total (Tensor or float): Sum of the current process, e.g. of the losses of its batches.
+        count (int): Number of terms of the sum of the current process.
+
+    Returns:
+        float: Sum of the totals divided by the sum of the counts of the processes.
+    """
+    if not is_initialized():
+        return float(total) / count
+    values = torch.stack([torch.as_tensor(total, dtype=torch.float64).to(get_device()).reshape(()),
+                          torch.tensor(count, dtype=torch.float64, device=get_device())])
+    dist.all_reduce(values)
+    return float(values[0]) / float(values[1])
+
+
+def wrap_model(model, cuda_available):
+    """Wrap a model in :class:`torch.nn.parallel.DistributedDataParallel`, on the GPU of the process if available.
+
+    The parameters of the first process are broadcast to the other ones.
+    """
+    device_ids = [torch.cuda.current_device()] if cuda_available else None
+    return torch.nn.parallel.DistributedDataParallel(model, device_ids=device_ids)
+
+
+def launch(fn, world_size, backend=None, gpu_ids=None, args=(), kwargs=None):
+    """Run a function in a distributed process group of ``world_size`` local processes.
+
+    Args:
+        fn (Callable): Function run by each process, which must be importable (defined at the top level of a module).
+        world_size (int): Number of processes.
+        backend (str): Backend of ``torch.distributed``. If None, ``nccl`` with GPUs, otherwise ``gloo``.
+        gpu_ids (list): GPU of each process. If None, the processes run on the CPU.
+        args (tuple): Positional arguments of fn, sent to each process.
+        kwargs (dict): Keyword arguments of fn, sent to each process.
+
+    Returns:
+        Result of fn in the first process (rank 0), which should be small.
+    """
+    if gpu_ids is not None and len(gpu_ids) < world_size:
+        raise ValueError(f"{world_size} processes need {world_size} gpu_ids, got {gpu_ids}.")
+    if backend is None:
+        backend = "nccl" if gpu_ids is not None else "gloo"
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        init_method = f"tcp://127.0.0.1:{s.getsockname()[1]}"
+
+    results = mp.get_context("spawn").SimpleQueue()
+    mp.spawn(_worker, args=(world_size, backend, init_method, gpu_ids, fn, args, kwargs or {}, results),
+             nprocs=world_size, join=True)
+    return results.get() if not results.empty() else None
+
+
+def _worker(rank, world_size, backend, init_method, gpu_ids, fn, args, kwargs, results):
+    if rank > 0:
+        # Only the first process logs its progress
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+    if gpu_ids is not None:
+        torch.cuda.set_device(int(gpu_ids[rank]))
+    else:
+        # The processes share the CPU cores
+        torch.set_num_threads(max(1, torch.get_num_threads() // world_size))
+    dist.init_process_group(backend, init_method=init_method, rank=rank, world_size=world_size)
+    try:
+        result = fn(*args, **kwargs)
+        if rank == 0:
+            results.put(result)
+    finally:
+        dist.destroy_process_group()
@@ -1,10 +1,19 @@
+from __future__ import annotations
 import nibabel as nib
 import numpy as np
 import onnxruntime
 import torch
 import imageio
 import joblib
-from typing import List
+import copy
+import functools
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from typing import Any, Callable, Dict, Iterator, List, Tuple
 from pathlib import Path
 
 from loguru import logger
@@ -25,27 +34,268 @@ from ivadomed.object_detection import utils as imed_obj_detect
 from ivadomed import utils as imed_utils
 from ivadomed import training as imed_training
 from ivadomed.keywords import ConfigKW, ModelParamsKW, ObjectDetectionParamsKW, TransformationKW, LoaderParamsKW, \
-    ROIParamsKW, SliceFilterParamsKW, TrainingParamsKW, MetadataKW, OptionKW
+    ROIParamsKW, SliceFilterParamsKW, TrainingParamsKW, MetadataKW, OptionKW, TestTimeAugmentationKW
 
 
-def onnx_inference(model_path: str, inputs: tensor) -> tensor:
+# Models and ONNX Runtime sessions already loaded, see get_model
+_model_cache: Dict[Tuple[str, str], Tuple[int, Any]] = {}
+_model_cache_lock = threading.Lock()
+
+ORT_GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+}
+
+
+class OnnxEngine(object):
+    """ONNX Runtime backend, called like a PyTorch model on a batch of inputs.
+
+    The session is configured once: thread pools, graph optimisation level, and optionally the path where ONNX Runtime
+    saves the optimised model, which can then be loaded with the optimisations disabled to skip them at start-up.
+    Inputs and outputs are bound to CPU memory (IO binding): the input tensor is shared with ONNX Runtime without copy,
+    and once the output shape of the model is known, the outputs are written directly in a preallocated tensor.
+
+    Args:
+        fname_model (str): Path to the ONNX model.
+        intra_op_num_threads (int): Number of threads used to parallelize the execution within nodes. 0: ONNX Runtime
+            default (one per physical core).
+        inter_op_num_threads (int): Number of threads used to run independent nodes in parallel. If greater than 1,
+            the graph is executed in parallel mode. 0: ONNX Runtime default.
+        graph_optimization_level (str): "disable", "basic", "extended" or "all".
+        optimized_model_path (str): If not None, the optimised model is saved to this path.
+
+    Attributes:
+        session (onnxruntime.InferenceSession): ONNX Runtime session.
+    """
+
+    def __init__(self, fname_model: str, intra_op_num_threads: int = 0, inter_op_num_threads: int = 0,
+                 graph_optimization_level: str = 'all', optimized_model_path: str = None) -> None:
+        if graph_optimization_level not in ORT_GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(f"Unknown graph optimization level: {graph_optimization_level}, choose between "
+                             f"{list(ORT_GRAPH_OPTIMIZATION_LEVELS)}.")
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = intra_op_num_threads
+        session_options.inter_op_num_threads = inter_op_num_threads
+        if inter_op_num_threads > 1:
+            session_options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+        session_options.graph_optimization_level = ORT_GRAPH_OPTIMIZATION_LEVELS[graph_optimization_level]
+        if optimized_model_path is not None:
+            session_options.optimized_model_filepath = str(optimized_model_path)
+        self.session = onnxruntime.InferenceSession(str(fname_model), session_options,
+                                                    providers=['CPUExecutionProvider'])
+        self._input_name = self.session.get_inputs()[0].name
+        self._output_name = self.session.get_outputs()[0].name
+        # Number of output channels of segmentation models (output of the same spatial size as the input)
+        self._n_output_channels = None
+
+    def __call__(self, inputs: tensor) -> tensor:
+        """Run the model on a batch.
+
+        Args:
+            inputs (tensor): Batch of inputs.
+
+        Returns:
+            tensor: Output of the model.
+        """
+        inputs = inputs.detach().cpu().float().contiguous()
+        io_binding = self.session.io_binding()
+        io_binding.bind_cpu_input(self._input_name, inputs.numpy())
+        preds = None
+        if self._n_output_channels is not None:
+            preds = torch.empty((inputs.shape[0], self._n_output_channels) + tuple(inputs.shape[2:]))
+            io_binding.bind_output(self._output_name, 'cpu', 0, np.float32, tuple(preds.shape), preds.data_ptr())
+        else:
+            io_binding.bind_output(self._output_name, 'cpu')
+        self.session.run_with_iobinding(io_binding)
+        if preds is None:
+            preds = torch.from_numpy(io_binding.copy_outputs_to_cpu()[0])
+            if preds.ndim == inputs.ndim and preds.shape[2:] == inputs.shape[2:] and preds.dtype == torch.float32:
+                self._n_output_channels = preds.shape[1]
+        return preds
+
+
+def get_model(fname_model: str, device: torch.device = None, onnx_options: dict = None) -> Any:
+    """Return the model of a file, loaded once and reused across batches and calls.
+
+    PyTorch models (``.pt``) are loaded on ``device`` and set in evaluation mode, other files are opened with an
+    OnnxEngine. Models are cached by path, device and ONNX Runtime options: a file modified since it was loaded
+    (different modification time) is loaded again. The cache is thread-safe, so that a server process can share the
+    models between threads.
+
+    Args:
+        fname_model (str): Path to the model.
+        device (torch.device): Device of PyTorch models.
+        onnx_options (dict): Keyword arguments of OnnxEngine (see the ``onnx_runtime`` parameters of the configuration
+            file), for ONNX models.
+
+    Returns:
+        torch.nn.Module or OnnxEngine: Model ready for inference.
+    """
+    path_model = str(Path(fname_model).resolve())
+    is_onnx = not path_model.lower().endswith('.pt')
+    onnx_options = onnx_options if onnx_options is not None else {}
+    key = (path_model, str(sorted(onnx_options.items())) if is_onnx else str(device))
+    mtime = os.stat(path_model).st_mtime_ns
+    with _model_cache_lock:
+        if key in _model_cache and _model_cache[key][0] == mtime:
+            return _model_cache[key][1]
+        if is_onnx:
+            logger.debug(f"Creating ONNX Runtime session for: {fname_model}")
+            model = OnnxEngine(path_model, **onnx_options)
+        else:
+            logger.debug(f"Loading model from: {fname_model}")
+            model = torch.load(path_model, map_location=device)
+            model.eval()
+        _model_cache[key] = (mtime, model)
+        return model
+
+
+def clear_model_cache() -> None:
+    """Release the models loaded by get_model."""
+    with _model_cache_lock:
+        _model_cache.clear()
+
+
+def onnx_inference(model_path: str, inputs: tensor, onnx_options: dict = None) -> tensor:
     """Run ONNX inference
 
     Args:
         model_path (str): Path to the ONNX model.
         inputs (Tensor): Batch of input image.
+        onnx_options (dict): Keyword arguments of OnnxEngine.
 
     Returns:
         Tensor: Network output.
     """
-    inputs = np.array(inputs.cpu())
-    ort_session = onnxruntime.InferenceSession(model_path)
-    ort_inputs = {ort_session.get_inputs()[0].name: inputs}
-    ort_outs = ort_session.run(None, ort_inputs)
-    return torch.tensor(ort_outs[0])
+    return get_model(model_path, onnx_options=onnx_options)(inputs)
 
 
-def get_preds(context: dict, fname_model: str, model_params: dict, cuda_available: bool, device: torch.device, batch: dict) -> tensor:
+class TestTimeAugmentation(object):
+    """Test-time augmentation (TTA): average the predictions of flipped and rotated copies of the inputs.
+
+    The augmented copies are stacked with the inputs as extra batch entries, so that all of them are predicted in the
+    same forward pass. The predictions of the copies are brought back to the space of the inputs with the
+    ``undo_transform`` of RandomReverse (flips) and RandomAffine (rotations), then averaged in memory. Rotations are
+    in the plane of the first two spatial axes; the parts of a rotated copy outside of the field of view of the input
+    are excluded from the average.
+
+    Args:
+        flip_axes (list): Spatial axes flipped, one augmented copy per axis.
+        rotation_degrees (list): Angles of the rotations in degrees, one augmented copy per angle.
+
+    Attributes:
+        augmentations (list): Transform and metadata of each augmented copy.
+    """
+
+    def __init__(self, flip_axes: list = (0, 1), rotation_degrees: list = ()) -> None:
+        self.augmentations = []
+        for axis in flip_axes:
+            if axis not in [0, 1, 2]:
+                raise ValueError(f"Unknown flip axis: {axis}, choose between 0, 1 and 2.")
+            self.augmentations.append((imed_transforms.RandomReverse(),
+                                       {MetadataKW.REVERSE: [i == axis for i in range(3)]}))
+        for degrees in rotation_degrees:
+            self.augmentations.append((imed_transforms.RandomAffine(),
+                                       {MetadataKW.ROTATION: [math.radians(degrees), [0, 1]],
+                                        MetadataKW.SCALE: [1., 1., 1.],
+                                        MetadataKW.TRANSLATION: [0, 0, 0]}))
+        # Field of view of each augmentation, by spatial shape
+        self._weights: Dict[Tuple[int, tuple], np.ndarray] = {}
+
+    def __len__(self) -> int:
+        """Number of predictions of each input: the input and its augmented copies."""
+        return len(self.augmentations) + 1
+
+    @staticmethod
+    def _apply(fn: Callable, batch: np.ndarray, metadata: dict) -> np.ndarray:
+        """Apply a transform (or its undo) to each channel of each sample of a batch."""
+        return np.stack([np.stack([fn(channel, dict(metadata))[0] for channel in sample]) for sample in batch])
+
+    def augment(self, inputs: tensor) -> tensor:
+        """Stack the inputs and their augmented copies.
+
+        Args:
+            inputs (tensor): Batch of inputs, of shape batch_size x n_channels x spatial dimensions.
+
+        Returns:
+            tensor: Batch of ``len(self) * batch_size`` inputs, the inputs first, then the copies of each augmentation.
+        """
+        inputs_npy = inputs.detach().cpu().numpy()
+        augmented = [inputs_npy] + [self._apply(transform, inputs_npy, metadata)
+                                    for transform, metadata in self.augmentations]
+        return torch.from_numpy(np.concatenate(augmented)).to(inputs.dtype)
+
+    def repeat(self, metadata: list) -> list:
+        """Repeat the metadata of a batch (e.g. FiLM metadata) for the augmented copies."""
+        return list(metadata) * len(self)
+
+    def _get_weights(self, index: int, shape: tuple) -> np.ndarray:
+        """Return the field of view of an augmentation, in the space of the inputs."""
+        if (index, shape) not in self._weights:
+            transform, metadata = self.augmentations[index]
+            if isinstance(transform, imed_transforms.RandomReverse):
+                weights = np.ones(shape, dtype=np.float32)
+            else:
+                weights = transform.undo_transform(np.ones(shape, dtype=np.float32), dict(metadata))[0]
+            self._weights[(index, shape)] = weights
+        return self._weights[(index, shape)]
+
+    def merge(self, preds: tensor) -> tensor:
+        """Average the predictions of the inputs and of their augmented copies.
+
+        Args:
+            preds (tensor): Predictions of a batch returned by ``augment``.
+
+        Returns:
+            tensor: Predictions of the inputs, of shape batch_size x n_labels x spatial dimensions.
+        """
+        preds = preds.detach().cpu().float()
+        preds = preds.reshape((len(self), -1) + tuple(preds.shape[1:]))
+        # Classification: the predictions do not depend on the position
+        if preds.ndim <= 3:
+            return preds.mean(dim=0)
+        preds_npy = preds.numpy()
+        total = preds_npy[0].copy()
+        weights = np.ones(preds_npy.shape[3:], dtype=np.float32)
+        for index, (transform, metadata) in enumerate(self.augmentations):
+            total += self._apply(transform.undo_transform, preds_npy[index + 1], metadata)
+            weights += self._get_weights(index, preds_npy.shape[3:])
+        return torch.from_numpy(total / weights)
+
+    def __call__(self, model_fn: Callable, inputs: tensor) -> tensor:
+        """Predict a batch with test-time augmentation.
+
+        Args:
+            model_fn (Callable): Model, called on the batch of the inputs and their augmented copies.
+            inputs (tensor): Batch of inputs.
+
+        Returns:
+            tensor: Averaged predictions, on CPU.
+        """
+        return self.merge(model_fn(self.augment(inputs)))
+
+
+def get_tta(params: dict) -> TestTimeAugmentation | None:
+    """Return the test-time augmentation of the ``test_time_augmentation`` parameters, if applied.
+
+    Args:
+        params (dict): Test-time augmentation parameters: ``applied``, ``flip_axes`` and ``rotation_degrees``.
+
+    Returns:
+        TestTimeAugmentation: None if the test-time augmentation is not applied.
+    """
+    if not params or not params.get(TestTimeAugmentationKW.APPLIED):
+        return None
+    tta = TestTimeAugmentation(flip_axes=params.get(TestTimeAugmentationKW.FLIP_AXES, [0, 1]),
+                               rotation_degrees=params.get(TestTimeAugmentationKW.ROTATION_DEGREES, []))
+    logger.info(f"Test-time augmentation: {len(tta) - 1} augmented copies of each sample.")
+    return tta
+
+
+def get_preds(context: dict, fname_model: str, model_params: dict, cuda_available: bool, device: torch.device,
+              batch: dict, onnx_options: dict = None, tta: TestTimeAugmentation = None) -> tensor:
     """Returns the predictions from the given model.
 
     Args:
@@ -55,6 +305,9 @@ def get_preds(context: dict, fname_model: str, model_params: dict, cuda_availabl
         cuda_available (bool): True if cuda is available.
         device (torch.device): Device used for prediction.
         batch (dict): dictionary containing input, gt and metadata
+        onnx_options (dict): Keyword arguments of OnnxEngine, for ONNX models.
+        tta (TestTimeAugmentation): If not None, the augmented copies of the inputs are predicted in the same batch
+            and averaged.
 
     Returns:
         tensor: predictions from the model.
@@ -63,22 +316,23 @@ def get_preds(context: dict, fname_model: str, model_params: dict, cuda_availabl
     with torch.no_grad():
 
         # Load the Input
-        img = imed_utils.cuda(batch['input'], cuda_available=cuda_available)
+        img = batch['input'] if tta is None else tta.augment(batch['input'])
+        img = imed_utils.cuda(img, cuda_available=cuda_available)
 
         # Load the PyTorch model and evaluate if model files exist.
         if fname_model.lower().endswith('.pt'):
             logger.debug(f"PyTorch model detected at: {fname_model}")
-            logger.debug(f"Loading model from: {fname_model}")
-            model = torch.load(fname_model, map_location=device)
+            model = get_model(fname_model, device)
             # Inference time
             logger.debug(f"Evaluating model: {fname_model}")
-            model.eval()
 
             # Films/Hemis based prediction require meta data load
             if (ConfigKW.FILMED_UNET in context and context[ConfigKW.FILMED_UNET].get(ModelParamsKW.APPLIED)) or \
                     (ConfigKW.HEMIS_UNET in context and context[ConfigKW.HEMIS_UNET].get(ModelParamsKW.APPLIED)):
                 # Load meta data before prediction
                 metadata = imed_training.get_metadata(batch[MetadataKW.INPUT_METADATA], model_params)
+                if tta is not None:
+                    metadata = tta.repeat(metadata)
                 preds = model(img, metadata)
             else:
                 preds = model(img)
@@ -86,15 +340,42 @@ def get_preds(context: dict, fname_model: str, model_params: dict, cuda_availabl
         else:
             logger.debug(f"Likely ONNX model detected at: {fname_model}")
             logger.debug(f"Conduct ONNX model inference... ")
-            preds = onnx_inference(fname_model, img)
+            preds = onnx_inference(fname_model, img, onnx_options)
 
         logger.debug("Sending predictions to CPU")
         # Move prediction to CPU
         preds = preds.cpu()
+        if tta is not None:
+            preds = tta.merge(preds)
 
     return preds
 
 
+def set_film_metadata(context: dict, metadata_dict: dict, options: dict | list, ds: Dataset) -> None:
+    """Add the FiLM metadata of the image to segment to the samples of the dataset.
+
+    Args:
+        context (dict): Configuration dict.
+        metadata_dict (dict): FiLM metadata values of the training, saved with the model.
+        options (dict or list): Contains film metadata information. If a list, the options of each subject, indexed by
+            the ``subject_index`` of the input metadata.
+        ds (Dataset): Dataset used for the segmentation, with its items in memory (``disk_cache=False``).
+    """
+    # (seg_pair, roi_pair) of each slice, or of each image from which the patches or subvolumes are extracted
+    for idx in (ds.handlers if ds.handlers else ds.indexes):
+        for i in range(len(idx)):
+            input_metadata = idx[i][MetadataKW.INPUT_METADATA][0]
+            subject_options = options[input_metadata[MetadataKW.SUBJECT_INDEX]] if isinstance(options, list) \
+                else options
+            input_metadata[context[ConfigKW.FILMED_UNET][ModelParamsKW.METADATA]] = subject_options.get(OptionKW.METADATA)
+            input_metadata[MetadataKW.METADATA_DICT] = metadata_dict
+
+    if ConfigKW.DEBUGGING in context and ConfigKW.FILMED_UNET in context and \
+            context[ConfigKW.FILMED_UNET].get(ModelParamsKW.METADATA):
+        imed_film.normalize_metadata(
+            ds, None, context[ConfigKW.DEBUGGING], context[ConfigKW.FILMED_UNET][ModelParamsKW.METADATA])
+
+
 def get_onehotencoder(context: dict, folder_model: str, options: dict, ds: Dataset) -> dict:
     """Returns one hot encoder which is needed to update the model parameters when FiLMedUnet is applied.
 
@@ -108,15 +389,7 @@ def get_onehotencoder(context: dict, folder_model: str, options: dict, ds: Datas
         dict: onehotencoder used in the model params.
     """
     metadata_dict = joblib.load(Path(folder_model, 'metadata_dict.joblib'))
-    for idx in ds.indexes:
-        for i in range(len(idx)):
-            idx[i][MetadataKW.INPUT_METADATA][0][context[ConfigKW.FILMED_UNET][ModelParamsKW.METADATA]] = options.get(OptionKW.METADATA)
-            idx[i][MetadataKW.INPUT_METADATA][0][MetadataKW.METADATA_DICT] = metadata_dict
-
-    if ConfigKW.DEBUGGING in context and ConfigKW.FILMED_UNET in context and \
-            context[ConfigKW.FILMED_UNET].get(ModelParamsKW.METADATA):
-        ds = imed_film.normalize_metadata(
-            ds, None, context[ConfigKW.DEBUGGING], context[ConfigKW.FILMED_UNET][ModelParamsKW.METADATA])
+    set_film_metadata(context, metadata_dict, options, ds)
 
     return joblib.load(Path(folder_model, 'one_hot_encoder.joblib'))
 
@@ -131,7 +404,8 @@ def pred_to_nib(data_lst: List[np.ndarray], z_lst: List[int], fname_ref: str, fn
     Args:
         data_lst (list of np arrays): Predictions, either 2D slices either 3D patches.
         z_lst (list of ints): Slice indexes to reconstruct a 3D volume for 2D slices.
-        fname_ref (str): Filename of the input image: its header is copied to the output nibabel object.
+        fname_ref (str): Filename of the input image (or the input nibabel object): its header is copied to the
+            output nibabel object.
         fname_out (str): If not None, then the generated nibabel object is saved with this filename.
         slice_axis (int): Indicates the axis used for the 2D slice extraction: Sagittal: 0, Coronal: 1, Axial: 2.
         debug (bool): If True, extended verbosity and intermediate outputs.
@@ -145,70 +419,124 @@ def pred_to_nib(data_lst: List[np.ndarray], z_lst: List[int], fname_ref: str, fn
         nibabel.Nifti1Image: NiBabel object containing the Network prediction.
     """
 
-    # Check fname_ref extention and update path if not NifTI
-    fname_ref = imed_loader_utils.update_filename_to_nifti(fname_ref)
-
-    # Load reference nibabel object
-    nib_ref = nib.load(fname_ref)
-    nib_ref_can = nib.as_closest_canonical(nib_ref)
+    if kernel_dim == '2d' and debug:
+        logger.debug(f"Len {len(data_lst)}")
+        for arr in data_lst:
+            logger.debug(f"Shape element lst {arr.shape}")
 
+    dtype = np.float32 if data_lst[0].dtype.kind == 'f' else data_lst[0].dtype
+    writer = NiftiPredictionWriter(fname_ref, slice_axis, bin_thr=bin_thr, discard_noise=discard_noise, dtype=dtype)
     if kernel_dim == '2d':
-        # complete missing z with zeros
-        tmp_lst = []
-        for z in range(nib_ref_can.header.get_data_shape()[slice_axis]):
-            if z not in z_lst:
-                tmp_lst.append(np.zeros(data_lst[0].shape))
-            else:
-                tmp_lst.append(data_lst[z_lst.index(z)])
+        # missing slices are left to zero
+        for z, arr in zip(z_lst, data_lst):
+            writer.write_slice(z, arr)
+    else:
+        writer.write_volume(data_lst[0])
 
-        if debug:
-            logger.debug(f"Len {len(tmp_lst)}")
-            for arr in tmp_lst:
-                logger.debug(f"Shape element lst {arr.shape}")
+    return writer.get_nib(fname_out, postprocessing=postprocessing)
 
-        # create data and stack on depth dimension
-        arr_pred_ref_space = np.stack(tmp_lst, axis=-1)
 
-    else:
-        arr_pred_ref_space = data_lst[0]
-
-    n_channel = arr_pred_ref_space.shape[0]
-    oriented_volumes = []
-    if len(arr_pred_ref_space.shape) == 4:
-        for i in range(n_channel):
-            oriented_volumes.append(
-                imed_loader_utils.reorient_image(arr_pred_ref_space[i, ], slice_axis, nib_ref, nib_ref_can))
-        # transpose to locate the channel dimension at the end to properly see image on viewer
-        arr_pred_ref_space = np.asarray(oriented_volumes).transpose((1, 2, 3, 0))
-    else:
-        arr_pred_ref_space = imed_loader_utils.reorient_image(arr_pred_ref_space, slice_axis, nib_ref, nib_ref_can)
-
-    if bin_thr >= 0:
-        arr_pred_ref_space = imed_postpro.threshold_predictions(arr_pred_ref_space, thr=bin_thr)
-    elif discard_noise:  # discard noise
-        arr_pred_ref_space[arr_pred_ref_space <= 1e-2] = 0
-
-    # create nibabel object
-    if postprocessing:
-        fname_prefix = fname_out.split("_pred.nii.gz")[0] if fname_out is not None else None
-        postpro = imed_postpro.Postprocessing(postprocessing,
-                                              arr_pred_ref_space,
-                                              nib_ref.header['pixdim'][1:4],
-                                              fname_prefix)
-        arr_pred_ref_space = postpro.apply()
-
-    # Here we prefer to copy the header (rather than just the affine matrix), in order to preserve the qform_code.
-    # See: https://github.com/ivadomed/ivadomed/issues/711
-    nib_pred = nib.Nifti1Image(
-        dataobj=arr_pred_ref_space,
-        affine=nib_ref.header.get_best_affine(),
-        header=nib_ref.header.copy()
-    )
-    # save as NifTI file
-    if fname_out is not None:
-        nib.save(nib_pred, fname_out)
-
-    return nib_pred
+class NiftiPredictionWriter(object):
+    """Assemble a prediction in the space of a reference image, as its slices (or its volume) arrive.
+
+    The prediction is written in place in a single array, preallocated in the orientation of the reference image and
+    written through a view in the orientation of the predictions (see get_hwd_view). It is binarized or denoised as it
+    is written, and kept in float32 or, once binarized, in uint8: the peak memory is about one output volume, whatever
+    the number of slices and classes.
+
+    Args:
+        fname_ref (str): Filename of the input image (or the input nibabel object): its header is copied to the
+            output nibabel object.
+        slice_axis (int): Indicates the axis used for the 2D slice extraction: Sagittal: 0, Coronal: 1, Axial: 2.
+        bin_thr (float): If positive, then the segmentation is binarized with this given threshold. Otherwise, a soft
+            segmentation is output.
+        discard_noise (bool): If True, predictions that are lower than 0.01 are set to zero.
+        dtype (np.dtype): Data type of the soft segmentation.
+
+    Attributes:
+        nib_ref (nib.Nifti1Image): Reference nibabel object, its data is not loaded.
+        data (ndarray): Prediction in the orientation of the reference image, with the classes as last dimension.
+            Allocated at the first write.
+    """
+
+    def __init__(self, fname_ref: str | nib.Nifti1Image, slice_axis: int, bin_thr: float = -1,
+                 discard_noise: bool = True, dtype: np.dtype = np.float32) -> None:
+        if isinstance(fname_ref, nib.Nifti1Image):
+            self.nib_ref = fname_ref
+        else:
+            # Check fname_ref extention and update path if not NifTI
+            self.nib_ref = nib.load(imed_loader_utils.update_filename_to_nifti(fname_ref))
+        self.slice_axis = slice_axis
+        self.bin_thr = bin_thr
+        self.discard_noise = discard_noise
+        self.dtype = np.uint8 if bin_thr >= 0 else dtype
+        self.data = None
+        self._view = None
+
+    def _write(self, index: tuple, pred: np.ndarray, n_spatial_dims: int) -> None:
+        pred = np.asarray(pred)
+        if self.data is None:
+            # One dimension per class, after the spatial dimensions of the reference image
+            shape = tuple(self.nib_ref.header.get_data_shape()[:3]) + tuple(pred.shape[:-n_spatial_dims])
+            self.data = np.zeros(shape, dtype=self.dtype)
+            self._view = imed_loader_utils.get_hwd_view(self.data, self.slice_axis, self.nib_ref.affine)
+        if self.bin_thr >= 0:
+            self._view[index] = pred >= self.bin_thr
+        elif self.discard_noise:
+            self._view[index] = np.where(pred > 1e-2, pred, 0)
+        else:
+            self._view[index] = pred
+
+    def write_slice(self, z: int, pred: np.ndarray | list) -> None:
+        """Write the prediction of a slice.
+
+        Args:
+            z (int): Index of the slice along slice_axis.
+            pred (ndarray or list): Prediction of shape (n_class, height, width), or list of the prediction of each
+                class.
+        """
+        self._write((Ellipsis, z), pred, n_spatial_dims=2)
+
+    def write_volume(self, pred: np.ndarray | list) -> None:
+        """Write the prediction of the whole volume.
+
+        Args:
+            pred (ndarray or list): Prediction of shape (n_class, height, width, depth) or (height, width, depth), or
+                list of the prediction of each class.
+        """
+        self._write((Ellipsis,), pred, n_spatial_dims=3)
+
+    def get_nib(self, fname_out: str = None, postprocessing: dict = None) -> nib.Nifti1Image:
+        """Return the prediction as a nibabel object.
+
+        Args:
+            fname_out (str): If not None, then the generated nibabel object is saved with this filename.
+            postprocessing (dict): Contains postprocessing steps to be applied.
+
+        Returns:
+            nibabel.Nifti1Image: NiBabel object containing the Network prediction.
+        """
+        arr_pred_ref_space = self.data
+        if postprocessing:
+            fname_prefix = fname_out.split("_pred.nii.gz")[0] if fname_out is not None else None
+            postpro = imed_postpro.Postprocessing(postprocessing,
+                                                  arr_pred_ref_space,
+                                                  self.nib_ref.header['pixdim'][1:4],
+                                                  fname_prefix)
+            arr_pred_ref_space = postpro.apply()
+
+        # Here we prefer to copy the header (rather than just the affine matrix), in order to preserve the qform_code.
+        # See: https://github.com/ivadomed/ivadomed/issues/711
+        nib_pred = nib.Nifti1Image(
+            dataobj=arr_pred_ref_space,
+            affine=self.nib_ref.header.get_best_affine(),
+            header=self.nib_ref.header.copy()
+        )
+        # save as NifTI file
+        if fname_out is not None:
+            nib.save(nib_pred, fname_out)
+
+        return nib_pred
 
 
 def pred_to_png(pred_list: list, target_list: list, subj_path: str, suffix: str = '', max_value: int = 1):
@@ -354,6 +682,17 @@ def segment_volume(folder_model: str, fname_images: list, gpu_id: int = 0, optio
                           This option may not be suitable with large images depending on computer RAM capacity.
             * 'overlap_2D': (list of int) List of overlaps in pixels for 2D patching. Length equals 2 [OverlapX, OverlapY], \
                             where X is the width and Y the height of the image.
+            * 'window_importance': (str) Blending of the overlapping 2D patches or 3D subvolumes: "gaussian" (default) \
+                                   weighs the center of each patch more than its borders, "constant" averages them.
+            * 'fp16_reconstruction': (bool) Accumulate the patches or subvolumes in float16, which halves the memory of \
+                                     the reconstruction buffers of large volumes.
+            * 'onnx_runtime': (dict) Options of the ONNX Runtime session of ONNX models, with the keys \
+                              "intra_op_num_threads", "inter_op_num_threads", "graph_optimization_level" and \
+                              "optimized_model_path" (see OnnxEngine).
+            * 'test_time_augmentation': (dict) Test-time augmentation, with the keys "applied", "flip_axes" and \
+                                        "rotation_degrees" (see TestTimeAugmentation). The augmented copies are \
+                                        predicted in the same batches as the images, which multiplies the memory of \
+                                        the inference by the number of copies.
             * 'metadata': (str) Film metadata.
             * 'fname_prior': (str) An image filename (e.g., .nii.gz) containing processing information \
                 (e.g., spinal cord segmentation, spinal location or MS lesion classification, spinal cord centerline), \
@@ -366,157 +705,473 @@ def segment_volume(folder_model: str, fname_images: list, gpu_id: int = 0, optio
 
     """
 
-    # Define device
-    cuda_available, device = imed_utils.define_device(gpu_id)
+    return Segmenter(folder_model, gpu_id=gpu_id, options=options).segment(fname_images)
 
-    # Check if model folder exists and get filenames to be stored as string
-    fname_model: str
-    fname_model_metadata: str
-    fname_model, fname_model_metadata = imed_models.get_model_filenames(folder_model)
 
-    # Load model training config
-    context = imed_config_manager.ConfigurationManager(fname_model_metadata).get_config()
+class Segmenter(object):
+    """Segmentation model kept loaded to segment a stream of images.
 
-    postpro_list = ['binarize_prediction', 'binarize_maxpooling', 'keep_largest', ' fill_holes',
-                    'remove_small']
-    if options is not None and any(pp in options for pp in postpro_list):
-        set_postprocessing_options(options, context)
+    Each call to segment_volume parses the model configuration, composes the transforms, initializes the device and
+    loads the model (and the FiLM one-hot encoder). A Segmenter does it once, so that a long-lived process (e.g. the
+    ``ivadomed_segment_daemon`` command or a server) only pays this cold start once: each request then only loads its
+    images, runs the inference and reconstructs the prediction. The latency of each stage is measured for each request.
 
-    # LOADER
-    loader_params = context[ConfigKW.LOADER_PARAMETERS]
-    slice_axis = imed_utils.AXIS_DCT[loader_params[LoaderParamsKW.SLICE_AXIS]]
-    metadata = {}
-    fname_roi = None
+    Args:
+        folder_model (str): Folder which contains the model and its configuration file, see segment_volume.
+        gpu_id (int): Number representing gpu number if available.
+        options (dict): Options of segment_volume. The postprocessing options, ``no_patch``, ``overlap_2D``,
+            ``window_importance``, ``fp16_reconstruction``, ``onnx_runtime`` and ``test_time_augmentation`` are set
+            once for all requests. The other options (``fname_prior``, ``metadata``, ``pixel_size`` and
+            ``pixel_size_units``) are defaults which can be overridden for each request.
+
+    Attributes:
+        context (dict): Configuration of the model, with the postprocessing options applied.
+        metrics (list): Latencies of each request in seconds, with keys "load", "inference", "reconstruction",
+            "write" and "total".
+    """
 
-    if (options is not None) and (OptionKW.FNAME_PRIOR in options):
-        fname_prior = options.get(OptionKW.FNAME_PRIOR)
-    else:
-        fname_prior = None
-
-    if fname_prior is not None:
-        if LoaderParamsKW.ROI_PARAMS in loader_params and loader_params[LoaderParamsKW.ROI_PARAMS][ROIParamsKW.SUFFIX] is not None:
-            fname_roi = fname_prior
-        # TRANSFORMATIONS
-        metadata = process_transformations(context, fname_roi, fname_prior, metadata, slice_axis, fname_images)
-
-    # Compose transforms
-    _, _, transform_test_params = imed_transforms.get_subdatasets_transforms(context[ConfigKW.TRANSFORMATION])
-
-    tranform_lst, undo_transforms = imed_transforms.prepare_transforms(transform_test_params)
-
-    # Force filter_empty_mask to False if fname_roi = None
-    if fname_roi is None and SliceFilterParamsKW.FILTER_EMPTY_MASK in loader_params[LoaderParamsKW.SLICE_FILTER_PARAMS]:
-        logger.warning("fname_roi has not been specified, then the entire volume is processed.")
-        loader_params[LoaderParamsKW.SLICE_FILTER_PARAMS][SliceFilterParamsKW.FILTER_EMPTY_MASK] = False
-
-    kernel_3D = bool(ConfigKW.MODIFIED_3D_UNET in context and context[ConfigKW.MODIFIED_3D_UNET][ModelParamsKW.APPLIED]) or \
-                not context[ConfigKW.DEFAULT_MODEL][ModelParamsKW.IS_2D]
-
-    if (options is not None) and (OptionKW.NO_PATCH in options) and kernel_3D:
-        logger.warning(f"The 'no-patch' option is provided but is not available for 3D models. "
-                       f"'no-patch' is ignored.")
-    if (options is not None) and (OptionKW.OVERLAP_2D in options) and kernel_3D:
-        logger.warning(f"The 'overlap-2d' option is provided but is not available for 3D models. "
-                       f"'overlap-2d' is ignored.")
-
-    # Assign length_2D and stride_2D for 2D patching
-    length_2D = context[ConfigKW.DEFAULT_MODEL][ModelParamsKW.LENGTH_2D] if \
-        ModelParamsKW.LENGTH_2D in context[ConfigKW.DEFAULT_MODEL] else []
-    stride_2D = context[ConfigKW.DEFAULT_MODEL][ModelParamsKW.STRIDE_2D] if \
-        ModelParamsKW.STRIDE_2D in context[ConfigKW.DEFAULT_MODEL] else []
-
-    is_2d_patch = bool(length_2D)
-    if (options is not None) and (OptionKW.NO_PATCH in options) and not kernel_3D:
-        if is_2d_patch:
-            is_2d_patch = not options.get(OptionKW.NO_PATCH)
-            length_2D = []
-            stride_2D = []
-        else:
-            logger.warning(f"The 'no-patch' option is provided but the model has no 'length_2D' and "
-                           f"'stride_2D' parameters in its configuration file "
-                           f"'{fname_model_metadata.split('/')[-1]}'. 2D patching is ignored, the segmentation "
-                           f"is done on the entire image without patches.")
-        if OptionKW.OVERLAP_2D in options:
-            logger.warning(f"The 'no-patch' option is provided along with the 'overlap-2D' option. "
-                           f"2D patching is ignored, the segmentation is done on the entire image without patches.")
-    else:
-        if (options is not None) and (OptionKW.OVERLAP_2D in options) and not kernel_3D:
-            if (length_2D and stride_2D):
-                overlap_2D = options.get(OptionKW.OVERLAP_2D)
-                # Swap OverlapX and OverlapY resulting in an array in order [OverlapY, OverlapX]
-                # to match length_2D and stride_2D in [Height, Width] orientation.
-                overlap_2D[1], overlap_2D[0] = overlap_2D[0], overlap_2D[1]
-                # Adjust stride_2D with overlap_2D
-                stride_2D = [x1 - x2 for (x1, x2) in zip(length_2D, overlap_2D)]
+    def __init__(self, folder_model: str, gpu_id: int = 0, options: dict = None) -> None:
+        time_start = time.perf_counter()
+        self.folder_model = folder_model
+        self.options = dict(options) if options is not None else {}
+
+        # Define device
+        self.cuda_available, self.device = imed_utils.define_device(gpu_id)
+
+        # Check if model folder exists and get filenames to be stored as string
+        self.fname_model, self.fname_model_metadata = imed_models.get_model_filenames(folder_model)
+
+        # Load model training config
+        self.context = imed_config_manager.ConfigurationManager(self.fname_model_metadata).get_config()
+
+        postpro_list = ['binarize_prediction', 'binarize_maxpooling', 'keep_largest', ' fill_holes',
+                        'remove_small']
+        if any(pp in self.options for pp in postpro_list):
+            set_postprocessing_options(self.options, self.context)
+
+        loader_params = self.context[ConfigKW.LOADER_PARAMETERS]
+        self.slice_axis = imed_utils.AXIS_DCT[loader_params[LoaderParamsKW.SLICE_AXIS]]
+
+        # Compose transforms
+        _, _, transform_test_params = imed_transforms.get_subdatasets_transforms(self.context[ConfigKW.TRANSFORMATION])
+        self.transforms, self.undo_transforms = imed_transforms.prepare_transforms(transform_test_params)
+
+        self._set_patch_params()
+
+        # Slice filters, by value of filter_empty_mask
+        self._slice_filters: Dict[bool, SliceFilter] = {}
+
+        # FiLM metadata and one-hot encoder
+        self.model_params = {}
+        self.metadata_dict = None
+        if ConfigKW.FILMED_UNET in self.context and self.context[ConfigKW.FILMED_UNET][ModelParamsKW.APPLIED]:
+            self.metadata_dict = joblib.load(Path(folder_model, 'metadata_dict.joblib'))
+            onehotencoder = joblib.load(Path(folder_model, 'one_hot_encoder.joblib'))
+            self.model_params.update({ModelParamsKW.NAME: ConfigKW.FILMED_UNET,
+                                      ModelParamsKW.FILM_ONEHOTENCODER: onehotencoder,
+                                      ModelParamsKW.N_METADATA: len([ll for l in onehotencoder.categories_
+                                                                     for ll in l])})
+
+        # Load the model (or the ONNX Runtime session) now rather than at the first request
+        self.onnx_options = self.options.get(OptionKW.ONNX_RUNTIME)
+        get_model(self.fname_model, self.device, onnx_options=self.onnx_options)
+        self.tta = get_tta(self.options.get(OptionKW.TEST_TIME_AUGMENTATION))
+
+        self.metrics: List[Dict[str, float]] = []
+        logger.debug(f"Segmenter ready in {time.perf_counter() - time_start:.2f} s.")
+
+    def _set_patch_params(self) -> None:
+        """Set kernel_3D, is_2d_patch, length_2D and stride_2D from the configuration and the patching options."""
+        options = self.options
+        context = self.context
+        self.kernel_3D = bool(ConfigKW.MODIFIED_3D_UNET in context and
+                              context[ConfigKW.MODIFIED_3D_UNET][ModelParamsKW.APPLIED]) or \
+            not context[ConfigKW.DEFAULT_MODEL][ModelParamsKW.IS_2D]
+
+        if OptionKW.NO_PATCH in options and self.kernel_3D:
+            logger.warning(f"The 'no-patch' option is provided but is not available for 3D models. "
+                           f"'no-patch' is ignored.")
+        if OptionKW.OVERLAP_2D in options and self.kernel_3D:
+            logger.warning(f"The 'overlap-2d' option is provided but is not available for 3D models. "
+                           f"'overlap-2d' is ignored.")
+
+        # Assign length_2D and stride_2D for 2D patching
+        length_2D = context[ConfigKW.DEFAULT_MODEL][ModelParamsKW.LENGTH_2D] if \
+            ModelParamsKW.LENGTH_2D in context[ConfigKW.DEFAULT_MODEL] else []
+        stride_2D = context[ConfigKW.DEFAULT_MODEL][ModelParamsKW.STRIDE_2D] if \
+            ModelParamsKW.STRIDE_2D in context[ConfigKW.DEFAULT_MODEL] else []
+
+        is_2d_patch = bool(length_2D)
+        if OptionKW.NO_PATCH in options and not self.kernel_3D:
+            if is_2d_patch:
+                is_2d_patch = not options.get(OptionKW.NO_PATCH)
+                length_2D = []
+                stride_2D = []
             else:
-                logger.warning(f"The 'overlap-2d' option is provided but the model has no 'length_2D' and "
+                logger.warning(f"The 'no-patch' option is provided but the model has no 'length_2D' and "
                                f"'stride_2D' parameters in its configuration file "
-                               f"'{fname_model_metadata.split('/')[-1]}'. 2D patching is ignored, the segmentation "
-                               f"is done on the entire image without patches.")
-
-    # Add microscopy pixel size and pixel size units from options to metadata for filenames_pairs
-    if (options is not None) and (OptionKW.PIXEL_SIZE in options):
-        metadata[MetadataKW.PIXEL_SIZE] = options.get(OptionKW.PIXEL_SIZE)
-    if (options is not None) and (OptionKW.PIXEL_SIZE_UNITS in options):
-        metadata[MetadataKW.PIXEL_SIZE_UNITS] = options.get(OptionKW.PIXEL_SIZE_UNITS)
-
-    filename_pairs = [(fname_images, None, fname_roi, metadata if isinstance(metadata, list) else [metadata])]
-
-    if kernel_3D:
-        ds = MRI3DSubVolumeSegmentationDataset(filename_pairs,
-                                               transform=tranform_lst,
-                                               length=context[ConfigKW.MODIFIED_3D_UNET][ModelParamsKW.LENGTH_3D],
-                                               stride=context[ConfigKW.MODIFIED_3D_UNET][ModelParamsKW.STRIDE_3D],
-                                               slice_axis=slice_axis)
-        logger.info(f"Loaded {len(ds)} {loader_params[LoaderParamsKW.SLICE_AXIS]} volumes of shape "
-                    f"{context[ConfigKW.MODIFIED_3D_UNET][ModelParamsKW.LENGTH_3D]}.")
-    else:
-        ds = MRI2DSegmentationDataset(filename_pairs,
-                                      length=length_2D,
-                                      stride=stride_2D,
-                                      slice_axis=slice_axis,
-                                      nibabel_cache=True,
-                                      transform=tranform_lst,
-                                      slice_filter_fn=SliceFilter(
-                                          **loader_params[LoaderParamsKW.SLICE_FILTER_PARAMS]))
-        ds.load_filenames()
-        if is_2d_patch:
-            logger.info(f"Loaded {len(ds)} {loader_params[LoaderParamsKW.SLICE_AXIS]} patches of shape {length_2D}.")
+                               f"'{self.fname_model_metadata.split('/')[-1]}'. 2D patching is ignored, the "
+                               f"segmentation is done on the entire image without patches.")
+            if OptionKW.OVERLAP_2D in options:
+                logger.warning(f"The 'no-patch' option is provided along with the 'overlap-2D' option. "
+                               f"2D patching is ignored, the segmentation is done on the entire image without patches.")
         else:
-            logger.info(f"Loaded {len(ds)} {loader_params[LoaderParamsKW.SLICE_AXIS]} slices.")
-
-    model_params = {}
-    if ConfigKW.FILMED_UNET in context and context[ConfigKW.FILMED_UNET][ModelParamsKW.APPLIED]:
-        onehotencoder = get_onehotencoder(context, folder_model, options, ds)
-        model_params.update({ModelParamsKW.NAME: ConfigKW.FILMED_UNET,
-                             ModelParamsKW.FILM_ONEHOTENCODER: onehotencoder,
-                             ModelParamsKW.N_METADATA: len([ll for l in onehotencoder.categories_ for ll in l])})
-
-    # Data Loader
-    data_loader = DataLoader(ds, batch_size=context[ConfigKW.TRAINING_PARAMETERS][TrainingParamsKW.BATCH_SIZE],
-                             shuffle=False, pin_memory=True,
-                             collate_fn=imed_loader_utils.imed_collate,
-                             num_workers=0)
-
-    # Loop across batches
-    preds_list, slice_idx_list = [], []
-    last_sample_bool, weight_matrix, volume, image = False, None, None, None
-    for i_batch, batch in enumerate(data_loader):
-        preds = get_preds(context, fname_model, model_params, cuda_available, device, batch)
-
-        # Set datatype to gt since prediction should be processed the same way as gt
-        for b in batch[MetadataKW.INPUT_METADATA]:
-            for modality in b:
-                modality['data_type'] = 'gt'
-
-        # Reconstruct 3D object
-        pred_list, target_list, last_sample_bool, weight_matrix, volume, image = reconstruct_3d_object(
-            context, batch, undo_transforms, preds, preds_list, kernel_3D, is_2d_patch, slice_axis,
-            slice_idx_list, data_loader, fname_images, i_batch, last_sample_bool, weight_matrix,
-            volume, image
-        )
+            if OptionKW.OVERLAP_2D in options and not self.kernel_3D:
+                if length_2D and stride_2D:
+                    # Swap OverlapX and OverlapY resulting in an array in order [OverlapY, OverlapX]
+                    # to match length_2D and stride_2D in [Height, Width] orientation.
+                    overlap_2D = list(reversed(options.get(OptionKW.OVERLAP_2D)))
+                    # Adjust stride_2D with overlap_2D
+                    stride_2D = [x1 - x2 for (x1, x2) in zip(length_2D, overlap_2D)]
+                else:
+                    logger.warning(f"The 'overlap-2d' option is provided but the model has no 'length_2D' and "
+                                   f"'stride_2D' parameters in its configuration file "
+                                   f"'{self.fname_model_metadata.split('/')[-1]}'. 2D patching is ignored, the "
+                                   f"segmentation is done on the entire image without patches.")
+
+        self.is_2d_patch = is_2d_patch
+        self.length_2D = length_2D
+        self.stride_2D = stride_2D
+
+        # Blending of the overlapping patches or subvolumes
+        self.window_importance = options.get(OptionKW.WINDOW_IMPORTANCE, 'gaussian')
+        self.reconstruction_dtype = torch.float16 if options.get(OptionKW.FP16_RECONSTRUCTION) else torch.float32
+
+    def _get_slice_filter(self, has_roi: bool) -> SliceFilter:
+        """Return the slice filter of a request, created once (it may load a classifier)."""
+        slice_filter_params = dict(self.context[ConfigKW.LOADER_PARAMETERS][LoaderParamsKW.SLICE_FILTER_PARAMS])
+        # Force filter_empty_mask to False if fname_roi = None
+        if not has_roi and slice_filter_params.get(SliceFilterParamsKW.FILTER_EMPTY_MASK):
+            logger.warning("fname_roi has not been specified, then the entire volume is processed.")
+            slice_filter_params[SliceFilterParamsKW.FILTER_EMPTY_MASK] = False
+        filter_empty_mask = bool(slice_filter_params.get(SliceFilterParamsKW.FILTER_EMPTY_MASK))
+        if filter_empty_mask not in self._slice_filters:
+            self._slice_filters[filter_empty_mask] = SliceFilter(**slice_filter_params)
+        return self._slice_filters[filter_empty_mask]
+
+    def _get_dataset(self, images_list: List[list], options_list: List[dict]) -> Dataset:
+        """Load and preprocess the images of the subjects of a request, in a single dataset.
+
+        The index of the subject of each sample is stored in its input metadata (``subject_index``).
+        """
+        context = self.context
+        loader_params = context[ConfigKW.LOADER_PARAMETERS]
+        filename_pairs = []
+        for subject_index, (images, options) in enumerate(zip(images_list, options_list)):
+            metadata = {}
+            fname_roi = None
+            fname_prior = options.get(OptionKW.FNAME_PRIOR)
+            if fname_prior is not None:
+                if LoaderParamsKW.ROI_PARAMS in loader_params and \
+                        loader_params[LoaderParamsKW.ROI_PARAMS][ROIParamsKW.SUFFIX] is not None:
+                    fname_roi = fname_prior
+                # TRANSFORMATIONS
+                metadata = process_transformations(context, fname_roi, fname_prior, metadata, self.slice_axis, images)
+
+            # With object detection, there is one metadata per image
+            metadata_list = metadata if isinstance(metadata, list) else [metadata]
+            for metadata in metadata_list:
+                # Add microscopy pixel size and pixel size units from options to metadata for filenames_pairs
+                if OptionKW.PIXEL_SIZE in options:
+                    metadata[MetadataKW.PIXEL_SIZE] = options.get(OptionKW.PIXEL_SIZE)
+                if OptionKW.PIXEL_SIZE_UNITS in options:
+                    metadata[MetadataKW.PIXEL_SIZE_UNITS] = options.get(OptionKW.PIXEL_SIZE_UNITS)
+                metadata[MetadataKW.SUBJECT_INDEX] = subject_index
+            filename_pairs.append((images, None, fname_roi, metadata_list))
+
+        # The subjects of a request are kept in memory, without disk cache nor memory planner
+        if self.kernel_3D:
+            ds = MRI3DSubVolumeSegmentationDataset(filename_pairs,
+                                                   transform=self.transforms,
+                                                   length=context[ConfigKW.MODIFIED_3D_UNET][ModelParamsKW.LENGTH_3D],
+                                                   stride=context[ConfigKW.MODIFIED_3D_UNET][ModelParamsKW.STRIDE_3D],
+                                                   slice_axis=self.slice_axis,
+                                                   disk_cache=False)
+            logger.info(f"Loaded {len(ds)} {loader_params[LoaderParamsKW.SLICE_AXIS]} volumes of shape "
+                        f"{context[ConfigKW.MODIFIED_3D_UNET][ModelParamsKW.LENGTH_3D]}.")
+        else:
+            # Slices without ROI are only filtered out if all the subjects have an ROI
+            has_roi = all(filename_pair[2] is not None for filename_pair in filename_pairs)
+            ds = MRI2DSegmentationDataset(filename_pairs,
+                                          length=self.length_2D,
+                                          stride=self.stride_2D,
+                                          slice_axis=self.slice_axis,
+                                          nibabel_cache=True,
+                                          transform=self.transforms,
+                                          slice_filter_fn=self._get_slice_filter(has_roi),
+                                          disk_cache=False)
+            ds.load_filenames()
+            if self.is_2d_patch:
+                logger.info(f"Loaded {len(ds)} {loader_params[LoaderParamsKW.SLICE_AXIS]} patches of shape "
+                            f"{self.length_2D}.")
+            else:
+                logger.info(f"Loaded {len(ds)} {loader_params[LoaderParamsKW.SLICE_AXIS]} slices.")
+
+        if self.metadata_dict is not None:
+            set_film_metadata(context, self.metadata_dict, options_list, ds)
+        return ds
+
+    def segment(self, images: list, options: dict = None) -> Tuple[list, list]:
+        """Segment an image.
+
+        Args:
+            images (list): Image of each channel, either a filename (e.g. .nii.gz) or an in-memory image: a
+                ``nibabel.Nifti1Image``, or a numpy array (identity affine).
+            options (dict): Options of this request (``fname_prior``, ``metadata``, ``pixel_size``,
+                ``pixel_size_units``), overriding the options of the Segmenter.
+
+        Returns:
+            list, list: List of nibabel objects containing the soft segmentation(s), one per prediction class, \
+                List of target suffix associated with each prediction in `pred_list`
+        """
+        [(_, pred_list, target_list)] = list(self.segment_subjects([images], [options]))
+        return pred_list, target_list
+
+    def segment_subjects(self, images_list: List[list], options_list: List[dict] = None,
+                         subjects_per_dataset: int = None, num_workers: int = 0,
+                         write_fn: Callable[[int, list, list], Any] = None) -> Iterator[Tuple[int, list, list]]:
+        """Segment the images of several subjects in a single pass.
+
+        The slices, patches or subvolumes of the subjects are loaded in common datasets, so that the batches are filled
+        across subject boundaries: small volumes do not leave the device idle with partial batches.
+
+        The segmentation is a pipeline of stages, connected by bounded queues:
+
+        * read and preprocess: a thread loads the dataset of the next ``subjects_per_dataset`` subjects while the
+          current dataset is segmented;
+        * inference, on the calling thread;
+        * reconstruction (undo transforms, reorientation and postprocessing) and writing of the predictions: as soon
+          as the last sample of a subject is predicted, its prediction is reconstructed, then passed to ``write_fn``,
+          by a pool of ``num_workers`` threads.
+
+        The busy time and the throughput of each stage are logged at the end of the pass.
+
+        Args:
+            images_list (list): Images of each subject, see ``segment``.
+            options_list (list): Options of each subject, see ``segment``. If None, the options of the Segmenter.
+            subjects_per_dataset (int): Number of subjects loaded in each dataset. If None, all the subjects are loaded
+                in one dataset before the inference starts.
+            num_workers (int): Number of threads reconstructing and writing the predictions. If 0, this is done on the
+                calling thread, between batches.
+            write_fn (callable): Function called with (subject index, pred_list, target_list) once the prediction of a
+                subject is reconstructed, e.g. to save it.
+
+        Returns:
+            iterator: (subject index, pred_list, target_list) of each subject, in the order of their completion. See
+                ``segment`` for pred_list and target_list.
+        """
+        if not images_list:
+            return
+        time_start = time.perf_counter()
+        if options_list is None:
+            options_list = [None] * len(images_list)
+        options_list = [{**self.options, **(options if options is not None else {})} for options in options_list]
+        images_list = [[nib.Nifti1Image(image, np.eye(4)) if isinstance(image, np.ndarray) else image
+                        for image in images] for images in images_list]
+        n_subjects = len(images_list)
+        subjects_per_dataset = subjects_per_dataset if subjects_per_dataset else n_subjects
+        chunks = [list(range(start, min(start + subjects_per_dataset, n_subjects)))
+                  for start in range(0, n_subjects, subjects_per_dataset)]
+
+        metrics = {'load': 0., 'inference': 0., 'reconstruction': 0., 'write': 0.}
+        metrics_lock = threading.Lock()
+
+        # Read and preprocess stage: the next dataset is loaded while the current one is segmented
+        datasets = queue.Queue(maxsize=1)
+        stop = threading.Event()
+
+        def _put(item) -> bool:
+            # Wait for room in the queue unless the segmentation is stopped, e.g. if the generator is closed early
+            while not stop.is_set():
+                try:
+                    datasets.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def _load_datasets():
+            for chunk in chunks:
+                if stop.is_set():
+                    return
+                time_load = time.perf_counter()
+                try:
+                    ds = self._get_dataset([images_list[i] for i in chunk], [options_list[i] for i in chunk])
+                except Exception as err:
+                    _put(err)
+                    return
+                with metrics_lock:
+                    metrics['load'] += time.perf_counter() - time_load
+                if not _put((chunk, ds)):
+                    return
+            _put(None)
+
+        loader = threading.Thread(target=_load_datasets, daemon=True)
+        loader.start()
+
+        # Reconstruction and write stage
+        def _reconstruct(subject_index: int, parts: list) -> Tuple[int, list, list]:
+            time_reconstruction = time.perf_counter()
+            pred_list, target_list = self._reconstruct_subject(images_list[subject_index], parts)
+            time_write = time.perf_counter()
+            if write_fn is not None:
+                write_fn(subject_index, pred_list, target_list)
+            with metrics_lock:
+                metrics['reconstruction'] += time_write - time_reconstruction
+                metrics['write'] += time.perf_counter() - time_write
+            return subject_index, pred_list, target_list
+
+        pool = ThreadPoolExecutor(max_workers=num_workers) if num_workers else None
+        futures = set()
+        completed = set()
+        try:
+            while True:
+                item = datasets.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                chunk, ds = item
+                for subject_index, parts in self._predict(ds, metrics):
+                    subject_index = chunk[subject_index]
+                    if pool is None:
+                        completed.add(subject_index)
+                        yield _reconstruct(subject_index, parts)
+                        continue
+                    # Bounded number of subjects waiting for the reconstruction
+                    if len(futures) >= 2 * num_workers:
+                        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            completed.add(future.result()[0])
+                            yield future.result()
+                    futures.add(pool.submit(_reconstruct, subject_index, parts))
+
+            for future in as_completed(futures):
+                completed.add(future.result()[0])
+                yield future.result()
+        finally:
+            stop.set()
+            loader.join()
+            if pool is not None:
+                pool.shutdown(wait=True)
+
+        # Subjects without any sample to segment (e.g. all slices filtered out)
+        for subject_index in range(n_subjects):
+            if subject_index not in completed:
+                yield _reconstruct(subject_index, [])
+
+        metrics['total'] = time.perf_counter() - time_start
+        self.metrics.append(metrics)
+        # Single requests (e.g. segment) are only reported in debug mode
+        log = logger.info if n_subjects > 1 else logger.debug
+        log(f"Segmented {n_subjects} subject(s) in {metrics['total']:.2f} s ({n_subjects / metrics['total']:.2f} "
+            f"subjects/s). Busy time and throughput of each stage:")
+        for stage in ['load', 'inference', 'reconstruction', 'write']:
+            if metrics[stage]:
+                log(f"\t{stage}: {metrics[stage]:.2f} s, {n_subjects / metrics[stage]:.2f} subjects/s.")
+
+    def _predict(self, ds: Dataset, metrics: dict) -> Iterator[Tuple[int, list]]:
+        """Run the inference on a dataset, and yield the predicted samples of each subject once it is completed.
+
+        Args:
+            ds (Dataset): Dataset of the subjects, with the subject of each sample in its input metadata.
+            metrics (dict): Latencies, the inference time is added to "inference".
+
+        Returns:
+            iterator: (subject index in the dataset, list of (batch, preds) of the samples of the subject).
+        """
+        data_loader = DataLoader(ds, batch_size=self.context[ConfigKW.TRAINING_PARAMETERS][TrainingParamsKW.BATCH_SIZE],
+                                 shuffle=False, pin_memory=True,
+                                 collate_fn=imed_loader_utils.imed_collate,
+                                 **imed_loader_utils.get_dataloader_params(
+                                     self.context[ConfigKW.TRAINING_PARAMETERS]))
+
+        # Predicted samples of the subjects not completed yet
+        parts = {}
+        # Each batch is processed once the next one is loaded, to know if its last subject continues in the next batch
+        batches = iter(data_loader)
+        next_batch = next(batches, None)
+        while next_batch is not None:
+            batch = next_batch
+            next_batch = next(batches, None)
+
+            time_inference = time.perf_counter()
+            preds = get_preds(self.context, self.fname_model, self.model_params, self.cuda_available, self.device,
+                              batch, onnx_options=self.onnx_options, tta=self.tta)
+            metrics['inference'] += time.perf_counter() - time_inference
+
+            # Set datatype to gt since prediction should be processed the same way as gt
+            for b in batch[MetadataKW.INPUT_METADATA]:
+                for modality in b:
+                    modality['data_type'] = 'gt'
+
+            # Split the batch by subject
+            subject_indices = [metadata[0][MetadataKW.SUBJECT_INDEX] for metadata in batch[MetadataKW.INPUT_METADATA]]
+            next_subject_index = next_batch[MetadataKW.INPUT_METADATA][0][0][MetadataKW.SUBJECT_INDEX] \
+                if next_batch is not None else None
+            start = 0
+            while start < len(subject_indices):
+                subject_index = subject_indices[start]
+                end = start + 1
+                while end < len(subject_indices) and subject_indices[end] == subject_index:
+                    end += 1
+                parts.setdefault(subject_index, []).append((get_batch_samples(batch, start, end), preds[start:end]))
+                if end < len(subject_indices) or next_subject_index != subject_index:
+                    yield subject_index, parts.pop(subject_index)
+                start = end
+
+    def _reconstruct_subject(self, images: list, parts: list) -> Tuple[list, list]:
+        """Reconstruct the prediction of a subject from its predicted samples.
+
+        Args:
+            images (list): Images of the subject.
+            parts (list): (batch, preds) of the samples of the subject, in order.
+
+        Returns:
+            list, list: See ``segment``.
+        """
+        # Undo transforms may be adjusted to the sample (bounding box), each thread works on its own copy
+        undo_transforms = copy.deepcopy(self.undo_transforms)
+        preds_list, slice_idx_list, pred_list, target_list = [], [], [], []
+        last_sample_bool, weight_matrix, volume, image = False, None, None, None
+        # The slices are written in the output volume as they are reconstructed
+        writer = NiftiPredictionWriter(images[0], self.slice_axis)
+        for i_part, (batch, preds) in enumerate(parts):
+            pred_list, target_list, last_sample_bool, weight_matrix, volume, image = reconstruct_3d_object(
+                self.context, batch, undo_transforms, preds, preds_list, self.kernel_3D, self.is_2d_patch,
+                self.slice_axis, slice_idx_list, None, images, i_part, last_sample_bool, weight_matrix, volume,
+                image, last_batch=i_part == len(parts) - 1, importance=self.window_importance,
+                dtype=self.reconstruction_dtype, writer=writer
+            )
+        return pred_list, target_list
+
+    def get_metrics_summary(self) -> Dict[str, Dict[str, float]]:
+        """Return the mean, median and 95th percentile of the latency of each stage over the requests.
+
+        Returns:
+            dict: For each stage ("load", "inference", "reconstruction", "write", "total"), the statistics in
+                seconds.
+        """
+        if not self.metrics:
+            return {}
+        return {stage: {'mean': float(np.mean([m[stage] for m in self.metrics])),
+                        'median': float(np.median([m[stage] for m in self.metrics])),
+                        'p95': float(np.percentile([m[stage] for m in self.metrics], 95))}
+                for stage in self.metrics[0]}
+
+
+def get_batch_samples(batch: dict, start: int, end: int) -> dict:
+    """Return the samples start to end (excluded) of a collated batch.
 
-    return pred_list, target_list
+    Args:
+        batch (dict): Dictionary containing input, gt and metadata, each with one element per sample.
+        start (int): Index of the first sample.
+        end (int): Index after the last sample.
+
+    Returns:
+        dict: Batch of the selected samples.
+    """
+    return {key: value[start:end] if value is not None else None for key, value in batch.items()}
 
 
 def split_classes(nib_prediction):
@@ -527,7 +1182,8 @@ def split_classes(nib_prediction):
     Returns:
         list of nibabelObject.
      """
-    pred = nib_prediction.get_fdata()
+    # The classes are converted one at a time, rather than the whole prediction to float64
+    pred = np.asanyarray(nib_prediction.dataobj)
     pred_list = []
     for c in range(pred.shape[-1]):
         class_pred = nib.Nifti1Image(pred[..., c].astype('float32'), nib_prediction.header.get_best_affine(),
@@ -539,7 +1195,9 @@ def split_classes(nib_prediction):
 def reconstruct_3d_object(context: dict, batch: dict, undo_transforms: UndoCompose, preds: torch.tensor,
                           preds_list: list, kernel_3D: bool, is_2d_patch: bool, slice_axis: int, slice_idx_list: list,
                           data_loader: DataLoader, fname_images: list, i_batch: int, last_sample_bool: bool,
-                          weight_matrix: tensor, volume: tensor, image: tensor):
+                          weight_matrix: tensor, volume: tensor, image: tensor, last_batch: bool = None,
+                          importance: str = 'gaussian', dtype: torch.dtype = torch.float32,
+                          writer: NiftiPredictionWriter = None):
     """Reconstructs the 3D object from the current batch, and returns the list of predictions and targets.
 
     Args:
@@ -557,8 +1215,15 @@ def reconstruct_3d_object(context: dict, batch: dict, undo_transforms: UndoCompo
         i_batch (int): index of current batch.
         last_sample_bool (bool) : flag to indicate whether this is the last sample in the 3D volume
         weight_matrix (tensor): the weight matrix
-        volume (tensor): the volume tensor that is being partially reconstructed through the loop
-        image (tensor): the image tensor that is being partially reconstructed through the loop
+        volume (SlidingWindowAccumulator): the volume that is being partially reconstructed through the loop
+        image (SlidingWindowAccumulator): the image that is being partially reconstructed through the loop
+        last_batch (bool): True if batch holds the last samples of the 3D object. If None, the 3D object is reconstructed
+            after the last batch of data_loader.
+        importance (str): Importance of the voxels of a patch or subvolume when blending the overlapping predictions,
+            "gaussian" or "constant", see get_importance_map.
+        dtype (torch.dtype): Data type of the buffers of the patch and subvolume reconstruction.
+        writer (NiftiPredictionWriter): If not None, the slices (or the volume) are written in the writer as they are
+            reconstructed, instead of being stored in preds_list until the 3D object is complete.
 
     Returns:
         pred_list (list): list of predictions
@@ -572,6 +1237,8 @@ def reconstruct_3d_object(context: dict, batch: dict, undo_transforms: UndoCompo
     """
     pred_list = []
     target_list = []
+    if last_batch is None:
+        last_batch = i_batch == len(data_loader) - 1
     for i_slice in range(len(preds)):
         if "bounding_box" in batch[MetadataKW.INPUT_METADATA][i_slice][0]:
             imed_obj_detect.adjust_undo_transforms(undo_transforms.transforms, batch, i_slice)
@@ -579,41 +1246,45 @@ def reconstruct_3d_object(context: dict, batch: dict, undo_transforms: UndoCompo
         batch[MetadataKW.GT_METADATA] = [[metadata[0]] * preds.shape[1] for metadata in batch[MetadataKW.INPUT_METADATA]]
         if kernel_3D:
             preds_undo, metadata, last_sample_bool, volume, weight_matrix = \
-                volume_reconstruction(batch, preds, undo_transforms, i_slice, volume, weight_matrix)
+                volume_reconstruction(batch, preds, undo_transforms, i_slice, volume, weight_matrix,
+                                      importance=importance, dtype=dtype)
             if last_sample_bool:
-                preds_list = [np.array(preds_undo)]
+                if writer is not None:
+                    writer.write_volume(preds_undo)
+                else:
+                    preds_list = [np.array(preds_undo)]
         else:
             if is_2d_patch:
                 # undo transformations for patch and reconstruct slice
                 preds_i_undo, metadata_idx, last_patch_bool, image, weight_matrix = \
-                    image_reconstruction(batch, preds, undo_transforms, i_slice, image, weight_matrix)
+                    image_reconstruction(batch, preds, undo_transforms, i_slice, image, weight_matrix,
+                                         importance=importance, dtype=dtype)
                 # If last patch of the slice
                 if last_patch_bool:
-                    # Add new segmented slice to preds_list
-                    preds_list.append(np.array(preds_i_undo))
-                    # Store the slice index of preds_i_undo in the original 3D image
-                    slice_idx_list.append(int(batch[MetadataKW.INPUT_METADATA][i_slice][0]['slice_index']))
+                    _store_slice(preds_i_undo, int(batch[MetadataKW.INPUT_METADATA][i_slice][0]['slice_index']),
+                                 preds_list, slice_idx_list, writer)
             else:
                 # undo transformations for slice
                 preds_i_undo, metadata_idx = undo_transforms(preds[i_slice],
                                                              batch[MetadataKW.GT_METADATA][i_slice],
                                                              data_type='gt')
-                # Add new segmented slice to preds_list
-                preds_list.append(np.array(preds_i_undo))
-                # Store the slice index of preds_i_undo in the original 3D image
-                slice_idx_list.append(int(batch[MetadataKW.INPUT_METADATA][i_slice][0]['slice_index']))
+                _store_slice(preds_i_undo, int(batch[MetadataKW.INPUT_METADATA][i_slice][0]['slice_index']),
+                             preds_list, slice_idx_list, writer)
 
         # If last batch and last sample of this batch, then reconstruct 3D object
-        if (i_batch == len(data_loader) - 1 and i_slice == len(batch['gt']) - 1) or last_sample_bool:
-            pred_nib = pred_to_nib(data_lst=preds_list,
-                                   fname_ref=fname_images[0],
-                                   fname_out=None,
-                                   z_lst=slice_idx_list,
-                                   slice_axis=slice_axis,
-                                   kernel_dim='3d' if kernel_3D else '2d',
-                                   debug=False,
-                                   bin_thr=-1,
-                                   postprocessing=context[ConfigKW.POSTPROCESSING])
+        if (last_batch and i_slice == len(batch['gt']) - 1) or last_sample_bool:
+            if writer is not None:
+                pred_nib = writer.get_nib(postprocessing=context[ConfigKW.POSTPROCESSING])
+            else:
+                pred_nib = pred_to_nib(data_lst=preds_list,
+                                       fname_ref=fname_images[0],
+                                       fname_out=None,
+                                       z_lst=slice_idx_list,
+                                       slice_axis=slice_axis,
+                                       kernel_dim='3d' if kernel_3D else '2d',
+                                       debug=False,
+                                       bin_thr=-1,
+                                       postprocessing=context[ConfigKW.POSTPROCESSING])
 
             pred_list = split_classes(pred_nib)
             target_list = context[ConfigKW.LOADER_PARAMETERS][LoaderParamsKW.TARGET_SUFFIX]
@@ -621,8 +1292,101 @@ def reconstruct_3d_object(context: dict, batch: dict, undo_transforms: UndoCompo
     return pred_list, target_list, last_sample_bool, weight_matrix, volume, image
 
 
+# Minimum weight of a voxel of a window, see get_importance_map
+IMPORTANCE_MIN = 1e-3
+
+
+@functools.lru_cache(maxsize=16)
+def get_importance_map(length: tuple, importance: str = 'gaussian', dtype: torch.dtype = torch.float32) -> tensor:
+    """Return the weight of each voxel of a window when its prediction is blended with the overlapping windows.
+
+    With the "gaussian" importance, the predictions at the center of the windows, which have the most context, weigh
+    more than the predictions at their borders, which removes the seams between windows. The map is normalised to a
+    maximum of 1 and floored at ``IMPORTANCE_MIN``, which is a normal float16 number: every voxel covered by a window
+    gets a prediction, even when the windows are blended in float16.
+
+    Args:
+        length (tuple): Window size along each dimension.
+        importance (str): "gaussian" (sigma of 1/8 of the window size) or "constant" (plain average).
+        dtype (torch.dtype): Data type of the map.
+
+    Returns:
+        tensor: Importance map, of shape ``length``. It is cached and must not be modified.
+    """
+    if importance == 'constant':
+        return torch.ones(length, dtype=dtype)
+    if importance != 'gaussian':
+        raise ValueError(f"Unknown window importance: {importance}, choose between 'gaussian' and 'constant'.")
+    importance_map = np.ones(length, dtype=np.float64)
+    for axis, window_length in enumerate(length):
+        sigma = max(0.125 * window_length, 1e-3)
+        coords = np.arange(window_length) - (window_length - 1) / 2
+        profile = np.exp(-coords ** 2 / (2 * sigma ** 2))
+        importance_map *= profile.reshape([-1 if i == axis else 1 for i in range(len(length))])
+    importance_map /= importance_map.max()
+    importance_map = np.maximum(importance_map, IMPORTANCE_MIN)
+    return torch.from_numpy(importance_map).to(dtype)
+
+
+class SlidingWindowAccumulator(object):
+    """Blend the predictions of overlapping windows into a single preallocated buffer.
+
+    Each window is accumulated in place, weighted by the importance map (see get_importance_map), and the blended
+    prediction is the weighted sum divided by the sum of the weights.
+
+    Args:
+        n_channels (int): Number of predicted classes.
+        shape (tuple): Spatial shape of the reconstructed image or volume.
+        importance (str): Importance of the voxels of a window, "gaussian" or "constant".
+        dtype (torch.dtype): Data type of the output buffer, e.g. torch.float16 to halve its memory.
+
+    Attributes:
+        output (tensor): Weighted sum of the predictions, of shape (n_channels, \*shape).
+        weights (tensor): Sum of the weights of the predictions, of shape ``shape``, in float32.
+    """
+
+    def __init__(self, n_channels: int, shape: tuple, importance: str = 'gaussian',
+                 dtype: torch.dtype = torch.float32) -> None:
+        self.importance = importance
+        self.dtype = dtype
+        self.output = torch.zeros((n_channels, *shape), dtype=dtype)
+        # The weights have no channel dimension, they are kept in float32 for the precision of the division
+        self.weights = torch.zeros(tuple(shape), dtype=torch.float32)
+
+    def add(self, pred: tensor, starts: list) -> None:
+        """Accumulate the prediction of a window.
+
+        Args:
+            pred (tensor): Prediction of the window, of shape (n_channels, \*length).
+            starts (list): Lower coordinates of the window.
+        """
+        length = tuple(pred.shape[1:])
+        window = tuple(slice(start, start + window_length) for start, window_length in zip(starts, length))
+        self.output[(slice(None),) + window].addcmul_(pred.to(self.dtype),
+                                                      get_importance_map(length, self.importance, self.dtype))
+        self.weights[window].add_(get_importance_map(length, self.importance))
+
+    def get_result(self) -> tensor:
+        """Return the blended prediction, in float32. The buffers are modified in place."""
+        output = self.output.float()
+        return output.div_(self.weights.clamp_(min=torch.finfo(torch.float32).tiny))
+
+
+def _store_slice(pred: list, slice_index: int, preds_list: list, slice_idx_list: list,
+                 writer: NiftiPredictionWriter = None) -> None:
+    """Write a reconstructed slice in the writer if any, otherwise add it to preds_list."""
+    if writer is not None:
+        writer.write_slice(slice_index, pred)
+    else:
+        # Add new segmented slice to preds_list
+        preds_list.append(np.array(pred))
+    # Store the slice index of the slice in the original 3D image
+    slice_idx_list.append(slice_index)
+
+
 def volume_reconstruction(batch: dict, pred: tensor, undo_transforms: UndoCompose, smp_idx: int,
-                          volume: tensor = None, weight_matrix: tensor = None):
+                          volume: SlidingWindowAccumulator = None, weight_matrix: tensor = None,
+                          importance: str = 'gaussian', dtype: torch.dtype = torch.float32):
     """
     Reconstructs volume prediction from subvolumes used during training
     Args:
@@ -630,15 +1394,17 @@ def volume_reconstruction(batch: dict, pred: tensor, undo_transforms: UndoCompos
         pred (tensor): Subvolume prediction
         undo_transforms (UndoCompose): Undo transforms so prediction match original image resolution and shap
         smp_idx (int): Batch index
-        volume (tensor): Reconstructed volume
-        weight_matrix (tensor): Weights containing the number of predictions for each voxel
+        volume (SlidingWindowAccumulator): Volume being reconstructed, None for the first subvolume
+        weight_matrix (tensor): Unused, the weights are held by ``volume``
+        importance (str): Importance of the voxels of a subvolume, "gaussian" or "constant", see get_importance_map
+        dtype (torch.dtype): Data type of the reconstruction buffers
 
     Returns:
         pred_undo (tensor): undone subvolume,
         metadata (dict): metadata,
         last_sample_bool (bool): boolean representing if its the last sample of the volume
-        volume (tensor): representing the volume reconstructed
-        weight_matrix (tensor): weight matrix
+        volume (SlidingWindowAccumulator): representing the volume reconstructed
+        weight_matrix (tensor): Sum of the weights of the predictions for each voxel
     """
     pred_undo, metadata = None, None
     x_min, x_max, y_min, y_max, z_min, z_max = batch[MetadataKW.INPUT_METADATA][smp_idx][0]['coord']
@@ -651,27 +1417,25 @@ def volume_reconstruction(batch: dict, pred: tensor, undo_transforms: UndoCompos
     # Get the Dimension
     x, y, z = batch[MetadataKW.INPUT_METADATA][smp_idx][0]['index_shape']
 
-    # If this is the first sample, instantiate a ZERO tensor based on the dimension
+    # If this is the first sample, preallocate the buffers based on the dimension
     if first_sample:
-        volume = torch.zeros((num_pred, x, y, z))
-        weight_matrix = torch.zeros((num_pred, x, y, z))
+        volume = SlidingWindowAccumulator(num_pred, (x, y, z), importance=importance, dtype=dtype)
 
     last_sample_bool = x_max == x and y_max == y and z_max == z
 
-    # Average predictions
-    volume[:, x_min:x_max, y_min:y_max, z_min:z_max] += pred[smp_idx]
-    weight_matrix[:, x_min:x_max, y_min:y_max, z_min:z_max] += 1
+    # Blend predictions
+    volume.add(pred[smp_idx], [x_min, y_min, z_min])
 
     if last_sample_bool:
-        volume /= weight_matrix
-        pred_undo, metadata = undo_transforms(volume,
+        pred_undo, metadata = undo_transforms(volume.get_result(),
                                               batch[MetadataKW.GT_METADATA][smp_idx],
                                               data_type='gt')
-    return pred_undo, metadata, last_sample_bool, volume, weight_matrix
+    return pred_undo, metadata, last_sample_bool, volume, volume.weights
 
 
 def image_reconstruction(batch: dict, pred: tensor, undo_transforms: UndoCompose, smp_idx: int,
-                        image: tensor = None, weight_matrix: tensor = None):
+                         image: SlidingWindowAccumulator = None, weight_matrix: tensor = None,
+                         importance: str = 'gaussian', dtype: torch.dtype = torch.float32):
     """
     Reconstructs image prediction from patches used during training
     Args:
@@ -679,15 +1443,17 @@ def image_reconstruction(batch: dict, pred: tensor, undo_transforms: UndoCompose
         pred (tensor): Patch prediction
         undo_transforms (UndoCompose): Undo transforms so prediction match original image resolution and shape
         smp_idx (int): Batch index
-        image (tensor): Reconstructed image
-        weight_matrix (tensor): Weights containing the number of predictions for each pixel
+        image (SlidingWindowAccumulator): Image being reconstructed, None for the first patch
+        weight_matrix (tensor): Unused, the weights are held by ``image``
+        importance (str): Importance of the pixels of a patch, "gaussian" or "constant", see get_importance_map
+        dtype (torch.dtype): Data type of the reconstruction buffers
 
     Returns:
         pred_undo (tensor): undone image
         metadata (dict): metadata
         last_patch_bool (bool): boolean representing if its the last patch of the image
-        image (tensor): representing the image reconstructed
-        weight_matrix (tensor): weight matrix
+        image (SlidingWindowAccumulator): representing the image reconstructed
+        weight_matrix (tensor): Sum of the weights of the predictions for each pixel
     """
     pred_undo, metadata = None, None
     x_min, x_max, y_min, y_max = batch[MetadataKW.INPUT_METADATA][smp_idx][0]['coord']
@@ -700,18 +1466,16 @@ def image_reconstruction(batch: dict, pred: tensor, undo_transforms: UndoCompose
     # Get the Dimension
     x, y = batch[MetadataKW.INPUT_METADATA][smp_idx][0]['index_shape']
 
-    # If this is the first sample, instantiate a ZERO tensor based on the dimension
+    # If this is the first sample, preallocate the buffers based on the dimension
     if first_patch:
-        image = torch.zeros((num_pred, x, y))
-        weight_matrix = torch.zeros((num_pred, x, y))
+        image = SlidingWindowAccumulator(num_pred, (x, y), importance=importance, dtype=dtype)
 
     last_patch_bool = x_max == x and y_max == y
 
-    # Average predictions
-    image[:, x_min:x_max, y_min:y_max] += pred[smp_idx]
-    weight_matrix[:, x_min:x_max, y_min:y_max] += 1
+    # Blend predictions
+    image.add(pred[smp_idx], [x_min, y_min])
     if last_patch_bool:
-        image /= weight_matrix
-        pred_undo, metadata = undo_transforms(image, batch[MetadataKW.GT_METADATA][smp_idx], data_type='gt')
+        pred_undo, metadata = undo_transforms(image.get_result(), batch[MetadataKW.GT_METADATA][smp_idx],
+                                              data_type='gt')
 
-    return pred_undo, metadata, last_patch_bool, image, weight_matrix
+    return pred_undo, metadata, last_patch_bool, image, image.weights
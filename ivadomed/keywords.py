@@ -25,6 +25,9 @@ class ConfigKW:
     HEMIS_UNET = "HeMISUnet"
     SPLIT_PATH = "split_path"
     TRAINING_SHA256 = "training_sha256"
+    ONNX_RUNTIME = "onnx_runtime"
+    TEST_TIME_AUGMENTATION = "test_time_augmentation"
+    SEGMENT_PIPELINE = "segment_pipeline"
 
 
 @dataclass
@@ -53,6 +56,21 @@ class LoaderParamsKW:
     IS_INPUT_DROPOUT: str = "is_input_dropout"
     SLICE_FILTER_PARAMS: str = "slice_filter_params"
     SUBJECT_SELECTION: str = "subject_selection"
+    PREPROCESSING_CACHE: str = "preprocessing_cache"
+    LAZY_LOADING: str = "lazy_loading"
+    MAX_CACHE_GB: str = "max_cache_gb"
+
+
+@dataclass
+class PreprocessingCacheKW:
+    PATH: str = "path"
+    MAX_SIZE_GB: str = "max_size_gb"
+
+
+@dataclass
+class LazyLoadingKW:
+    APPLIED: str = "applied"
+    MAX_CACHED_SUBJECTS: str = "max_cached_subjects"
 
 
 @dataclass
@@ -76,6 +94,35 @@ class DataTestingKW:
 class TrainingParamsKW:
     BALANCE_SAMPLES: str = "balance_samples"
     BATCH_SIZE: str = "batch_size"
+    NUM_WORKERS: str = "num_workers"
+    PREFETCH_FACTOR: str = "prefetch_factor"
+    PERSISTENT_WORKERS: str = "persistent_workers"
+    WORKER_SEED: str = "worker_seed"
+    AMP: str = "amp"
+    GRADIENT_ACCUMULATION_STEPS: str = "gradient_accumulation_steps"
+    ACTIVATION_CHECKPOINTING: str = "activation_checkpointing"
+    LOG_DICE_LOSS: str = "log_dice_loss"
+    METRICS_SYNC_STEPS: str = "metrics_sync_steps"
+    VALIDATION_FREQUENCY: str = "validation_frequency"
+    VALIDATION_MAX_BATCHES: str = "validation_max_batches"
+    VALIDATION_SUBSET: str = "validation_subset"
+    ASYNC_CHECKPOINT: str = "async_checkpoint"
+    CHECKPOINT_KEEP_LAST: str = "checkpoint_keep_last"
+    DISTRIBUTED: str = "distributed"
+
+
+@dataclass
+class AmpKW:
+    APPLIED: str = "applied"
+    DTYPE: str = "dtype"
+    CHANNELS_LAST: str = "channels_last"
+
+
+@dataclass
+class DistributedKW:
+    APPLIED: str = "applied"
+    WORLD_SIZE: str = "world_size"
+    BACKEND: str = "backend"
 
 
 @dataclass
@@ -92,6 +139,14 @@ class BalanceSamplesKW:
     TYPE: str = "type"
 
 
+@dataclass
+class ValidationSubsetKW:
+    APPLIED: str = "applied"
+    N_SAMPLES: str = "n_samples"
+    TYPE: str = "type"
+    RANDOM_SEED: str = "random_seed"
+
+
 @dataclass
 class ContrastParamsKW:
     CONTRAST_LST: str = "contrast_lst"  # The list help determine the number of model parameter inputs.
@@ -154,6 +209,24 @@ class OptionKW:
     PIXEL_SIZE: str = "pixel_size"
     PIXEL_SIZE_UNITS: str = "pixel_size_units"
     NO_PATCH: str = "no_patch"
+    WINDOW_IMPORTANCE: str = "window_importance"
+    FP16_RECONSTRUCTION: str = "fp16_reconstruction"
+    ONNX_RUNTIME: str = "onnx_runtime"
+    TEST_TIME_AUGMENTATION: str = "test_time_augmentation"
+
+
+@dataclass
+class OnnxRuntimeKW:
+    INTRA_OP_NUM_THREADS: str = "intra_op_num_threads"
+    INTER_OP_NUM_THREADS: str = "inter_op_num_threads"
+    GRAPH_OPTIMIZATION_LEVEL: str = "graph_optimization_level"
+    OPTIMIZED_MODEL_PATH: str = "optimized_model_path"
+
+
+@dataclass
+class SegmentPipelineKW:
+    SUBJECTS_PER_DATASET: str = "subjects_per_dataset"
+    NUM_WORKERS: str = "num_workers"
 
 
 @dataclass
@@ -209,6 +282,7 @@ class MetadataKW:
     ROI_METADATA: str = "roi_metadata"
     PIXEL_SIZE: str = "PixelSize"
     PIXEL_SIZE_UNITS: str = "PixelSizeUnits"
+    SUBJECT_INDEX: str = "subject_index"
 
 
 @dataclass
@@ -219,6 +293,13 @@ class ObjectDetectionParamsKW:
     SAFETY_FACTOR: str = "safety_factor"
 
 
+@dataclass
+class TestTimeAugmentationKW:
+    APPLIED: str = "applied"
+    FLIP_AXES: str = "flip_axes"
+    ROTATION_DEGREES: str = "rotation_degrees"
+
+
 @dataclass
 class UncertaintyKW:
     ALEATORIC: str = 'aleatoric'
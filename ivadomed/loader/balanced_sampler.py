@@ -1,4 +1,5 @@
 from __future__ import annotations
+import math
 import torch
 import numpy as np
 import typing
@@ -21,6 +22,7 @@ class BalancedSampler(torch.utils.data.sampler.Sampler):
     Attributes:
         indices (list): List from 0 to length of dataset (number of elements in the dataset).
         nb_samples (int): Number of elements in the dataset.
+        labels (list): Label (int) of each dataset element.
         weights (Tensor): Weight of each dataset element equal to 1 over the frequency of a
             given label (inverse of the frequency).
         metadata_dict (dict): Stores the mapping from metadata string to index (int).
@@ -34,16 +36,15 @@ class BalancedSampler(torch.utils.data.sampler.Sampler):
         self.metadata_dict = {}
         self.label_idx = 0
 
+        self.labels = [self._get_label(dataset, idx, metadata) for idx in self.indices]
         cmpt_label = {}
-        for idx in self.indices:
-            label = self._get_label(dataset, idx, metadata)
+        for label in self.labels:
             if label in cmpt_label:
                 cmpt_label[label] += 1
             else:
                 cmpt_label[label] = 1
 
-        weights = [1.0 / cmpt_label[self._get_label(dataset, idx, metadata)]
-                   for idx in self.indices]
+        weights = [1.0 / cmpt_label[label] for label in self.labels]
 
         self.weights = torch.DoubleTensor(weights)
 
@@ -76,5 +77,47 @@ class BalancedSampler(torch.utils.data.sampler.Sampler):
         return (self.indices[i] for i in torch.multinomial(
             self.weights, self.nb_samples, replacement=True))
 
+    def __len__(self):
+        return self.nb_samples
+
+
+class DistributedBalancedSampler(BalancedSampler):
+    """BalancedSampler sharded between the processes of a distributed training.
+
+    The processes draw the same weighted samples, with a seed shared by the processes and changed at each epoch (see
+    :meth:`set_epoch`), and each process keeps its share of them.
+
+    Args:
+        dataset (BidsDataset): Dataset containing input, gt and metadata.
+        metadata (str): Indicates which metadata to use to balance the sampler.
+        num_replicas (int): Number of processes. Default: world size of the process group.
+        rank (int): Rank of the current process. Default: rank in the process group.
+        seed (int): Seed shared by the processes.
+
+    Attributes:
+        num_samples (int): Number of samples of the current process, per epoch.
+        epoch (int): Epoch, which changes the samples.
+    """
+
+    def __init__(self, dataset: Union[BidsDataset, Bids3DDataset], metadata: str = 'gt', num_replicas: int = None,
+                 rank: int = None, seed: int = 0) -> None:
+        super().__init__(dataset, metadata)
+        self.num_replicas = torch.distributed.get_world_size() if num_replicas is None else num_replicas
+        self.rank = torch.distributed.get_rank() if rank is None else rank
+        self.seed = seed
+        self.epoch = 0
+        self.num_samples = math.ceil(self.nb_samples / self.num_replicas)
+
+    def __iter__(self):
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        samples = torch.multinomial(self.weights, self.num_samples * self.num_replicas, replacement=True,
+                                    generator=generator)
+        return (self.indices[i] for i in samples[self.rank::self.num_replicas])
+
     def __len__(self):
         return self.num_samples
+
+    def set_epoch(self, epoch: int) -> None:
+        """Set the epoch, to draw different samples at each epoch."""
+        self.epoch = epoch
@@ -10,6 +10,8 @@ from ivadomed.keywords import ModelParamsKW
 if typing.TYPE_CHECKING:
     from typing import List, Optional
     from ivadomed.loader.bids_dataframe import BidsDataframe
+    from ivadomed.loader.preprocessing_cache import PreprocessingCache
+    from ivadomed.loader.memory_planner import MemoryPlanner
 
 
 class Bids3DDataset(MRI3DSubVolumeSegmentationDataset):
@@ -31,6 +33,12 @@ class Bids3DDataset(MRI3DSubVolumeSegmentationDataset):
             contrast is processed individually (ie different sample / tensor).
         object_detection_params (dict): Object dection parameters.
         is_input_dropout (bool): Return input with missing modalities.
+        preprocessing_cache (PreprocessingCache): Persistent cache of the preprocessed volumes, shared between runs.
+        lazy (bool): If True, the volumes of a subject are loaded on first access.
+        max_cached_subjects (int): Number of subjects kept in memory in lazy mode.
+        disk_cache (bool): If True, the volumes are cached on disk, else in memory. If None, chosen for each subject by
+            the memory planner.
+        memory_planner (MemoryPlanner): Chooses where the volumes of each subject are kept if disk_cache is None.
     """
 
     def __init__(self,
@@ -48,7 +56,12 @@ class Bids3DDataset(MRI3DSubVolumeSegmentationDataset):
                  object_detection_params: dict = None,
                  task: str = "segmentation",
                  soft_gt: bool = False,
-                 is_input_dropout: bool = False):
+                 is_input_dropout: bool = False,
+                 preprocessing_cache: PreprocessingCache = None,
+                 lazy: bool = False,
+                 max_cached_subjects: int = 8,
+                 disk_cache: bool = True,
+                 memory_planner: MemoryPlanner = None):
 
         dataset = BidsDataset(bids_df=bids_df,
                               subject_file_lst=subject_file_lst,
@@ -70,4 +83,9 @@ class Bids3DDataset(MRI3DSubVolumeSegmentationDataset):
                          slice_axis=slice_axis,
                          task=task,
                          soft_gt=soft_gt,
-                         is_input_dropout=is_input_dropout)
+                         is_input_dropout=is_input_dropout,
+                         preprocessing_cache=preprocessing_cache,
+                         lazy=lazy,
+                         max_cached_subjects=max_cached_subjects,
+                         disk_cache=disk_cache,
+                         memory_planner=memory_planner)
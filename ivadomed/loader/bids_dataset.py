@@ -10,6 +10,8 @@ if typing.TYPE_CHECKING:
     from ivadomed.loader.bids_dataframe import BidsDataframe
     from ivadomed.loader.slice_filter import SliceFilter
     from ivadomed.loader.patch_filter import PatchFilter
+    from ivadomed.loader.preprocessing_cache import PreprocessingCache
+    from ivadomed.loader.memory_planner import MemoryPlanner
     import pandas as pd
 
 
@@ -40,6 +42,10 @@ class BidsDataset(MRI2DSegmentationDataset):
         soft_gt (bool): If True, ground truths are not binarized before being fed to the network. Otherwise, ground
         truths are thresholded (0.5) after the data augmentation operations.
         is_input_dropout (bool): Return input with missing modalities.
+        preprocessing_cache (PreprocessingCache): Persistent cache of the preprocessed slices, shared between runs.
+        lazy (bool): If True, the slices of a subject are loaded on first access.
+        max_cached_subjects (int): Number of subjects kept in memory in lazy mode.
+        memory_planner (MemoryPlanner): Chooses where the slices of each subject are kept.
 
     Attributes:
         filename_pairs (list): A list of tuples in the format (input filename list containing all modalities,ground \
@@ -55,7 +61,9 @@ class BidsDataset(MRI2DSegmentationDataset):
                  model_params: dict, slice_axis: int = 2, nibabel_cache: bool = True, transform: list = None,
                  metadata_choice: str = False, slice_filter_fn: SliceFilter = None, patch_filter_fn: PatchFilter = None,
                  roi_params: dict = None, multichannel: bool = False, object_detection_params: dict = None,
-                 task: str = "segmentation", soft_gt: bool = False, is_input_dropout: bool = False):
+                 task: str = "segmentation", soft_gt: bool = False, is_input_dropout: bool = False,
+                 preprocessing_cache: PreprocessingCache = None, lazy: bool = False, max_cached_subjects: int = 8,
+                 memory_planner: MemoryPlanner = None):
 
         self.roi_params = roi_params if roi_params is not None else \
             {ROIParamsKW.SUFFIX: None, ROIParamsKW.SLICE_FILTER_ROI: None}
@@ -137,7 +145,8 @@ class BidsDataset(MRI2DSegmentationDataset):
         stride = model_params[ModelParamsKW.STRIDE_2D] if ModelParamsKW.STRIDE_2D in model_params else []
 
         super().__init__(self.filename_pairs, length, stride, slice_axis, nibabel_cache, transform, slice_filter_fn, patch_filter_fn,
-                         task, self.roi_params, self.soft_gt, is_input_dropout)
+                         task, self.roi_params, self.soft_gt, is_input_dropout, preprocessing_cache=preprocessing_cache,
+                         lazy=lazy, max_cached_subjects=max_cached_subjects, memory_planner=memory_planner)
 
     def get_target_filename(self, target_suffix: any, target_filename: any, derivative: any) -> None:
         for idx, suffix_list in enumerate(target_suffix):
@@ -6,9 +6,12 @@ from ivadomed import utils as imed_utils
 from ivadomed.loader.bids3d_dataset import Bids3DDataset
 from ivadomed.loader.bids_dataframe import BidsDataframe
 from ivadomed.loader.bids_dataset import BidsDataset
-from ivadomed.keywords import ROIParamsKW, TransformationKW, ModelParamsKW, ConfigKW
+from ivadomed.keywords import ROIParamsKW, TransformationKW, ModelParamsKW, ConfigKW, PreprocessingCacheKW, \
+    LazyLoadingKW
 from ivadomed.loader.slice_filter import SliceFilter
 from ivadomed.loader.patch_filter import PatchFilter
+from ivadomed.loader.preprocessing_cache import PreprocessingCache
+from ivadomed.loader.memory_planner import MemoryPlanner
 import torch
 
 
@@ -31,6 +34,11 @@ def load_dataset(bids_df: BidsDataframe,
                  device: torch.device = None,
                  cuda_available: bool = None,
                  is_input_dropout: bool = False,
+                 preprocessing_cache: dict = None,
+                 lazy_loading: dict = None,
+                 max_cache_gb: float = None,
+                 num_workers: int = 0,
+                 memory_planner: MemoryPlanner = None,
                  **kwargs) -> Bids3DDataset:
     """Get loader appropriate loader according to model type. Available loaders are Bids3DDataset for 3D data,
     BidsDataset for 2D data and HDF5Dataset for HeMIS.
@@ -60,6 +68,13 @@ def load_dataset(bids_df: BidsDataframe,
         device (torch.device): Device to use for the model training.
         cuda_available (bool): If True, cuda is available.
         is_input_dropout (bool): Return input with missing modalities.
+        preprocessing_cache (dict): Persistent preprocessing cache parameters, with keys "path" (disabled if null) and
+            "max_size_gb".
+        lazy_loading (dict): Lazy mode parameters, with keys "applied" and "max_cached_subjects".
+        max_cache_gb (float): Memory budget of the preprocessed data. If None, default placement of the datasets.
+        num_workers (int): Number of DataLoader workers which will load the dataset, accounted in the memory budget.
+        memory_planner (MemoryPlanner): Planner shared by the splits, see get_memory_planner. If None, a planner of
+            ``max_cache_gb`` is created for this split only.
 
     Returns:
         BidsDataset
@@ -71,6 +86,27 @@ def load_dataset(bids_df: BidsDataframe,
     # Compose transforms
     tranform_lst, _ = imed_transforms.prepare_transforms(copy.deepcopy(transforms_params), requires_undo)
 
+    # Persistent cache of the preprocessed data, shared between runs
+    cache = None
+    if preprocessing_cache and preprocessing_cache.get(PreprocessingCacheKW.PATH):
+        cache = PreprocessingCache(preprocessing_cache[PreprocessingCacheKW.PATH],
+                                   preprocessing_cache.get(PreprocessingCacheKW.MAX_SIZE_GB, 20.))
+
+    # Lazy mode: only the index is built here, the subjects are loaded on first access
+    lazy_loading = lazy_loading if lazy_loading else {}
+    lazy = bool(lazy_loading.get(LazyLoadingKW.APPLIED, False))
+    max_cached_subjects = lazy_loading.get(LazyLoadingKW.MAX_CACHED_SUBJECTS, 8)
+    if lazy and cache is None:
+        logger.warning(f"Lazy mode without preprocessing_cache: all the subjects of the {dataset_type} set are still "
+                       f"decoded at startup to build its index, set the preprocessing_cache path to skip it in the "
+                       f"next runs.")
+
+    # Placement of the preprocessed data of each subject (RAM, disk cache or decoded on access)
+    if memory_planner is None:
+        memory_planner = get_memory_planner(max_cache_gb, num_workers)
+    if memory_planner is not None:
+        memory_planner.dataset_type = dataset_type
+
     # If ROICrop is not part of the transforms, then enforce no slice filtering based on ROI data.
     if TransformationKW.ROICROP not in transforms_params:
         roi_params[ROIParamsKW.SLICE_FILTER_ROI] = None
@@ -89,7 +125,12 @@ def load_dataset(bids_df: BidsDataframe,
                                 model_params=model_params,
                                 object_detection_params=object_detection_params,
                                 soft_gt=soft_gt,
-                                is_input_dropout=is_input_dropout)
+                                is_input_dropout=is_input_dropout,
+                                preprocessing_cache=cache,
+                                lazy=lazy,
+                                max_cached_subjects=max_cached_subjects,
+                                disk_cache=None if memory_planner else True,
+                                memory_planner=memory_planner)
     else:
         # Task selection
         task = imed_utils.get_task(model_params[ModelParamsKW.NAME])
@@ -111,7 +152,11 @@ def load_dataset(bids_df: BidsDataframe,
                               soft_gt=soft_gt,
                               object_detection_params=object_detection_params,
                               task=task,
-                              is_input_dropout=is_input_dropout)
+                              is_input_dropout=is_input_dropout,
+                              preprocessing_cache=cache,
+                              lazy=lazy,
+                              max_cached_subjects=max_cached_subjects,
+                              memory_planner=memory_planner)
         dataset.load_filenames()
 
     if model_params[ModelParamsKW.NAME] == ConfigKW.MODIFIED_3D_UNET:
@@ -122,3 +167,18 @@ def load_dataset(bids_df: BidsDataframe,
         logger.info(f"Loaded {len(dataset)} {slice_axis} slices for the { dataset_type} set.")
 
     return dataset
+
+
+def get_memory_planner(max_cache_gb: float = None, num_workers: int = 0) -> MemoryPlanner:
+    """Create the memory planner shared by the datasets of all the splits.
+
+    Args:
+        max_cache_gb (float): Memory budget of the preprocessed data. If None, no planner is created.
+        num_workers (int): Number of DataLoader workers which will load each dataset.
+
+    Returns:
+        MemoryPlanner: The planner, None if ``max_cache_gb`` is None.
+    """
+    if max_cache_gb is None:
+        return None
+    return MemoryPlanner(max_cache_gb, num_workers=num_workers)
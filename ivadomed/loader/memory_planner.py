@@ -0,0 +1,123 @@
+from __future__ import annotations
+import multiprocessing
+import shutil
+import tempfile
+
+import numpy as np
+from loguru import logger
+
+from ivadomed.utils import get_system_memory
+import typing
+if typing.TYPE_CHECKING:
+    from typing import Any, Dict
+
+RAM = "ram"
+MEMMAP = "memmap"
+DECODE = "decode"
+
+
+class MemoryPlanner(object):
+    """Choose where the preprocessed data of each subject is kept, given a memory budget.
+
+    Subjects are kept in RAM while their cumulated size (measured with ``ndarray.nbytes``) fits in the budget. The
+    following subjects are spilled to the memory-mapped disk cache (see SampleStore) or, if there is not enough free
+    disk space, decoded and preprocessed again when accessed (see the lazy mode of the datasets).
+
+    The budget is shared by the main process and, unless they are forked, by the DataLoader workers which each get a
+    copy of the dataset. A single planner is shared by the datasets of all the splits (training, validation, testing),
+    so that their data fits in the budget together.
+
+    Args:
+        max_cache_gb (float): Memory budget in GB. If None, half of the system memory.
+        num_workers (int): Number of DataLoader workers.
+        dataset_type (str): Name of the split being loaded, used in the logs. Updated by load_dataset for each split.
+        path_disk (str): Folder of the memory-mapped disk cache, used to check the free disk space. If None, the
+            system temporary folder.
+
+    Attributes:
+        max_cache_gb (float): Memory budget in GB.
+        budget (float): Memory budget in bytes for the data of the main process.
+        dataset_type (str): Name of the split being loaded.
+        ram_nbytes (int): Size of the data kept in RAM by all the splits, in bytes.
+        footprints (dict): Footprint of each split, see footprint.
+    """
+
+    def __init__(self, max_cache_gb: float = None, num_workers: int = 0, dataset_type: str = "",
+                 path_disk: str = None) -> None:
+        self.max_cache_gb = max_cache_gb if max_cache_gb is not None else get_system_memory() * 0.5
+        self.dataset_type = dataset_type
+        self.path_disk = path_disk if path_disk is not None else tempfile.gettempdir()
+        # Forked workers share the memory of the main process (copy-on-write), other workers get a copy of the data.
+        # The start method is not set before the workers are started, None stands for the platform default.
+        start_method = multiprocessing.get_start_method(allow_none=True) or multiprocessing.get_all_start_methods()[0]
+        n_copies = 1 if start_method == "fork" else 1 + num_workers
+        self.budget = self.max_cache_gb * 1024 ** 3 / n_copies
+        self.ram_nbytes = 0
+        self.footprints: Dict[str, Dict[str, list]] = {}
+
+    @property
+    def footprint(self) -> Dict[str, list]:
+        """dict: Number of subjects and bytes of the current split for each placement ("ram", "memmap", "decode")."""
+        return self.footprints.setdefault(self.dataset_type, {placement: [0, 0] for placement in [RAM, MEMMAP, DECODE]})
+
+    def place(self, nbytes: int, subject: str = "") -> str:
+        """Choose the placement of the data of a subject.
+
+        Args:
+            nbytes (int): Size of the preprocessed data of the subject in bytes, see get_nbytes.
+            subject (str): Subject name, used in the logs.
+
+        Returns:
+            str: "ram", "memmap" or "decode".
+        """
+        if self.ram_nbytes + nbytes <= self.budget:
+            placement = RAM
+            self.ram_nbytes += nbytes
+        elif shutil.disk_usage(self.path_disk).free > nbytes:
+            placement = MEMMAP
+            logger.debug(f"Memory budget exceeded: {subject} ({nbytes / 1024 ** 2:.1f} MB) spilled to the disk cache.")
+        else:
+            placement = DECODE
+            logger.debug(f"Memory budget exceeded and not enough disk space: {subject} "
+                         f"({nbytes / 1024 ** 2:.1f} MB) will be decoded on access.")
+        self.footprint[placement][0] += 1
+        self.footprint[placement][1] += nbytes
+        return placement
+
+    def report(self) -> None:
+        """Log the footprint of the current split for each placement."""
+        n_subjects = sum(n for n, _ in self.footprint.values())
+        total_gb = sum(size for _, size in self.footprint.values()) / 1024 ** 3
+        logger.info(f"Preprocessed {self.dataset_type} data: {total_gb:.2f} GB for {n_subjects} subjects, memory "
+                    f"budget {self.max_cache_gb:.2f} GB ({self.ram_nbytes / 1024 ** 3:.2f} GB used by all the splits).")
+        n_ram, size_ram = self.footprint[RAM]
+        logger.info(f"\t{n_ram} subjects ({size_ram / 1024 ** 3:.2f} GB) kept in RAM.")
+        n_memmap, size_memmap = self.footprint[MEMMAP]
+        if n_memmap:
+            logger.info(f"\t{n_memmap} subjects ({size_memmap / 1024 ** 3:.2f} GB) spilled to the memory-mapped disk "
+                        f"cache.")
+        n_decode, size_decode = self.footprint[DECODE]
+        if n_decode:
+            logger.warning(f"\t{n_decode} subjects ({size_decode / 1024 ** 3:.2f} GB) spilled and decoded again on "
+                           f"access: not enough free disk space in {self.path_disk}.")
+
+
+def get_nbytes(obj: Any) -> int:
+    """Return the size of the numpy arrays of an object (e.g. a (seg_pair, roi_pair) tuple), in bytes.
+
+    Arrays referenced several times (e.g. the input of seg_pair and roi_pair) are counted once.
+    """
+    arrays = {}
+
+    def _collect(o):
+        if isinstance(o, np.ndarray):
+            arrays[id(o)] = o.nbytes
+        elif isinstance(o, (list, tuple)):
+            for item in o:
+                _collect(item)
+        elif isinstance(o, dict):
+            for item in o.values():
+                _collect(item)
+
+    _collect(obj)
+    return sum(arrays.values())
@@ -1,8 +1,6 @@
 from __future__ import annotations
-import copy
 import random
 from pathlib import Path
-import pickle
 
 from typing import Tuple
 
@@ -14,8 +12,11 @@ from loguru import logger
 
 from ivadomed import transforms as imed_transforms, postprocessing as imed_postpro
 from ivadomed.loader import utils as imed_loader_utils
-from ivadomed.loader.utils import dropout_input, get_obj_size, create_temp_directory
+from ivadomed.loader.utils import dropout_input, LazyHandle
 from ivadomed.loader.segmentation_pair import SegmentationPair
+from ivadomed.loader.sample_store import SampleStore
+from ivadomed.loader.memory_planner import MemoryPlanner, get_nbytes, RAM, MEMMAP
+from ivadomed.loader.preprocessing_cache import PreprocessingCache, get_transforms_params
 from ivadomed.object_detection import utils as imed_obj_detect
 from ivadomed.keywords import ROIParamsKW, MetadataKW
 import typing
@@ -23,9 +24,7 @@ import typing
 if typing.TYPE_CHECKING:
     from ivadomed.loader.slice_filter import SliceFilter
     from ivadomed.loader.patch_filter import PatchFilter
-    from typing import List, Dict, Optional
-
-from ivadomed.utils import get_timestamp, get_system_memory
+    from typing import List, Dict, Optional, Iterator
 
 
 class MRI2DSegmentationDataset(Dataset):
@@ -48,9 +47,20 @@ class MRI2DSegmentationDataset(Dataset):
         soft_gt (bool): If True, ground truths are not binarized before being fed to the network. Otherwise, ground
         truths are thresholded (0.5) after the data augmentation operations.
         is_input_dropout (bool): Return input with missing modalities.
+        disk_cache (bool): If True, the preprocessed items are cached on disk, else in memory. If None, chosen for each
+            subject by the memory planner.
+        preprocessing_cache (PreprocessingCache): Persistent cache of the preprocessed slices of each subject, shared
+            between runs. If None, the slices are preprocessed at each run.
+        lazy (bool): If True, only the index of the slices or patches is built by load_filenames: the slices of a
+            subject are loaded and preprocessed when first accessed, and kept in a cache of max_cached_subjects
+            subjects.
+        max_cached_subjects (int): Number of subjects kept in memory in lazy mode, per DataLoader worker.
+        memory_planner (MemoryPlanner): Chooses where the items of each subject are kept (RAM, memory-mapped disk
+            cache or decoded on access) if disk_cache is None. If None, a planner with the default budget is used.
 
     Attributes:
-        indexes (list): List of indices corresponding to each slice or patch in the dataset.
+        indexes (list or ndarray): List of indices corresponding to each slice in the dataset or, with patches, structured
+            array of the patches coordinates and handler index.
         handlers (list): List of indices corresponding to each slice in the dataset, used for indexing patches.
         filename_pairs (list): List of tuples in the format (input filename list containing all modalities,ground \
             truth filename, ROI filename, metadata).
@@ -76,8 +86,14 @@ class MRI2DSegmentationDataset(Dataset):
             from the dataset.
         is_input_dropout (bool): Return input with missing modalities.
         disk_cache (bool): determines whether the items in the segmentation pairs for the entire dataset are cached on
-            disk (True) or in memory (False). Default to None to automatically determine based on guesstimated size of
-            the entire datasets naively assuming that first image in first volume is representative.
+            disk (True) or in memory (False). Default to None to choose for each subject with the memory planner.
+        sample_store (SampleStore): Memory-mapped disk cache of the items. Indexes and handlers contain the index in
+            the store of the items which are memory-mapped, the items which are kept in memory, and a LazyHandle for
+            the items which are decoded on access.
+        preprocessing_cache (PreprocessingCache): Persistent cache of the preprocessed slices of each subject.
+        lazy (bool): If True, the slices are loaded on first access. Indexes and handlers then contain LazyHandles.
+        max_cached_subjects (int): Number of subjects decoded on access kept in memory.
+        memory_planner (MemoryPlanner): Chooses where the items of each subject are kept if disk_cache is None.
 
     """
 
@@ -94,7 +110,11 @@ class MRI2DSegmentationDataset(Dataset):
                  roi_params: dict = None,
                  soft_gt: bool = False,
                  is_input_dropout: bool = False,
-                 disk_cache=None) -> None:
+                 disk_cache=None,
+                 preprocessing_cache: PreprocessingCache = None,
+                 lazy: bool = False,
+                 max_cached_subjects: int = 8,
+                 memory_planner: MemoryPlanner = None) -> None:
         if length is None:
             length = []
         if stride is None:
@@ -119,129 +139,275 @@ class MRI2DSegmentationDataset(Dataset):
         self.has_bounding_box = True
         self.task = task
         self.is_input_dropout = is_input_dropout
-        self.disk_cache: bool = disk_cache
+        self.lazy = lazy
+        # In lazy mode, the slices of the last accessed subjects are kept in memory instead
+        self.disk_cache: bool = False if lazy else disk_cache
+        self.sample_store: Optional[SampleStore] = None
+        self.preprocessing_cache = preprocessing_cache
+        self.max_cached_subjects = max_cached_subjects
+        self.memory_planner = memory_planner
+        if self.disk_cache is None and memory_planner is None:
+            self.memory_planner = MemoryPlanner()
+        # Filtered slices of the subjects decoded on access
+        self._slice_indices: Dict[int, list] = {}
+        self._subject_cache = imed_loader_utils.LRUCache(max_cached_subjects)
 
     def load_filenames(self):
         """Load preprocessed pair data (input and gt) in handler."""
-        for input_filenames, gt_filenames, roi_filename, metadata in self.filename_pairs:
-            roi_pair = SegmentationPair(input_filenames,
-                                        roi_filename,
-                                        metadata=metadata,
-                                        slice_axis=self.slice_axis,
-                                        cache=self.cache,
-                                        prepro_transforms=self.prepro_transforms)
-
-            seg_pair = SegmentationPair(input_filenames,
-                                        gt_filenames,
-                                        metadata=metadata,
-                                        slice_axis=self.slice_axis,
-                                        cache=self.cache,
-                                        prepro_transforms=self.prepro_transforms,
-                                        soft_gt=self.soft_gt)
-
-            input_data_shape, _ = seg_pair.get_pair_shapes()
-
-            path_temp = Path(create_temp_directory())
-
-            for idx_pair_slice in range(input_data_shape[-1]):
-                slice_seg_pair = seg_pair.get_pair_slice(idx_pair_slice, gt_type=self.task)
-                self.has_bounding_box = imed_obj_detect.verify_metadata(slice_seg_pair, self.has_bounding_box)
-
-                if self.has_bounding_box:
-                    self.prepro_transforms = imed_obj_detect.adjust_transforms(self.prepro_transforms, slice_seg_pair)
-
-                if self.slice_filter_fn and not self.slice_filter_fn(slice_seg_pair):
-                    continue
-
-                # Note: we force here gt_type=segmentation since ROI slice is needed to Crop the image
-                slice_roi_pair = roi_pair.get_pair_slice(idx_pair_slice, gt_type="segmentation")
-
-                if self.slice_filter_roi and imed_loader_utils.filter_roi(slice_roi_pair['gt'], self.roi_thr):
-                    continue
-
-                item: Tuple[dict, dict] = imed_transforms.apply_preprocessing_transforms(self.prepro_transforms,
-                                                                      slice_seg_pair,
-                                                                      slice_roi_pair)
-                # Run once code to keep track if disk cache is used
-                if self.disk_cache is None:
-                    self.determine_cache_need(item, input_data_shape[-1])
-
-                # If is_2d_patch, create handlers list for indexing patch
-                if self.is_2d_patch:
-                    for metadata in item[0][MetadataKW.INPUT_METADATA]:
-                        metadata[MetadataKW.INDEX_SHAPE] = item[0]['input'][0].shape
-                    if self.disk_cache:
-                        path_item = path_temp / f"item_{get_timestamp()}.pkl"
-                        with path_item.open(mode="wb") as f:
-                            pickle.dump(item, f)
-                        self.handlers.append((path_item))
-                    else:
-                        self.handlers.append((item))
-                # else, append the whole slice to self.indexes
-                else:
+        if self.lazy:
+            self._load_index()
+            return
+
+        for subject_index in range(len(self.filename_pairs)):
+            items = self._load_subject(subject_index)
+            handles = self._cache_items(subject_index, items)
+
+            # If is_2d_patch, create handlers list for indexing patch
+            if self.is_2d_patch:
+                self.handlers.extend(handles)
+            # else, append the whole slice to self.indexes
+            else:
+                self.indexes.extend(handles)
 
-                    if self.disk_cache:
-                        path_item = path_temp / f"item_{get_timestamp()}.pkl"
-                        with path_item.open(mode="wb") as f:
-                            pickle.dump(item, f)
-                        self.indexes.append(path_item)
-                    else:
-                        self.indexes.append(item)
+        if self.disk_cache is None:
+            self.memory_planner.report()
 
         # If is_2d_patch, prepare indices of patches
         if self.is_2d_patch:
             self.prepare_indices()
 
-    def prepare_indices(self) -> None:
-        """Stores coordinates of 2d patches for training."""
-        for i in range(0, len(self.handlers)):
+    def _load_subject(self, subject_index: int, slice_indices: list = None) -> List[Tuple[dict, dict]]:
+        """Return the preprocessed items (seg_pair, roi_pair) of the slices of a subject.
+
+        Args:
+            subject_index (int): Index of the subject in filename_pairs.
+            slice_indices (list): Slices to load, already filtered. If None, the slices are filtered.
+
+        Returns:
+            list: Preprocessed (seg_pair, roi_pair) of each slice which is not filtered out.
+        """
+        filename_pair = self.filename_pairs[subject_index]
+        # Skip decoding and preprocessing if the subject is in the persistent preprocessing cache
+        cache_key = self._get_preprocessing_cache_key(filename_pair)
+        items = self.preprocessing_cache.load(cache_key) if cache_key else None
+        if items is None:
+            items = list(self._preprocess_slices(*filename_pair, slice_indices=slice_indices))
+            if cache_key:
+                self.preprocessing_cache.save(cache_key, items)
+
+        if self.is_2d_patch:
+            for item in items:
+                for metadata in item[0][MetadataKW.INPUT_METADATA]:
+                    metadata[MetadataKW.INDEX_SHAPE] = item[0]['input'][0].shape
+        return items
+
+    def _load_index(self) -> None:
+        """Build the index of the slices or patches in lazy mode, without keeping the slices in memory.
 
-            if self.disk_cache:
-                with self.handlers[i].open(mode="rb") as f:
-                    item = pickle.load(f)
-                    primary_handle = item[0]
+        The index of a subject (kept slices and patches) is read from the preprocessing cache if available. Otherwise,
+        the subject is loaded once to filter its slices and patches.
+        """
+        indexes = []
+        for subject_index, filename_pair in enumerate(self.filename_pairs):
+            index_key = self._get_preprocessing_cache_key(filename_pair, index=[self.length, self.stride,
+                                                                                self._get_patch_filter_params()])
+            subject_index_data = self.preprocessing_cache.load(index_key) if index_key else None
+            if subject_index_data is not None:
+                slice_indices, patch_starts = subject_index_data[0]
             else:
-                primary_handle = self.handlers[i][0]
-
-            input_img = primary_handle.get('input')
-            gt_img = primary_handle.get('gt')
-            input_metadata = primary_handle.get('input_metadata')
-            gt_metadata = primary_handle.get('gt_metadata')
-
-            shape = input_img[0].shape
-
-            if len(self.length) != 2 or len(self.stride) != 2:
-                raise RuntimeError('"length_2D" and "stride_2D" must be of length 2.')
-            for length, stride, size in zip(self.length, self.stride, shape):
-                if stride > length or stride <= 0:
-                    raise RuntimeError('"stride_2D" must be greater than 0 and smaller or equal to "length_2D".')
-                if length > size:
-                    raise RuntimeError('"length_2D" must be smaller or equal to image dimensions after resampling.')
-
-            for x_min in range(0, (shape[0] - self.length[0] + self.stride[0]), self.stride[0]):
-                if x_min + self.length[0] > shape[0]:
-                    x_min = (shape[0] - self.length[0])
-                x_max = x_min + self.length[0]
-                for y_min in range(0, (shape[1] - self.length[1] + self.stride[1]), self.stride[1]):
-                    if y_min + self.length[1] > shape[1]:
-                        y_min = (shape[1] - self.length[1])
-                    y_max = y_min + self.length[1]
-
-                    # Extract patch from handlers for patch filter
-                    patch = {'input': list(np.asarray(input_img)[:, x_min:x_max, y_min:y_max]),
-                             'gt': list(np.asarray(gt_img)[:, x_min:x_max, y_min:y_max]) \
-                                   if gt_img else [],
-                             'input_metadata': input_metadata,
-                             'gt_metadata': gt_metadata}
-                    if self.patch_filter_fn and not self.patch_filter_fn(patch):
-                        continue
-
-                    self.indexes.append({
-                        'x_min': x_min,
-                        'x_max': x_max,
-                        'y_min': y_min,
-                        'y_max': y_max,
-                        'handler_index': i})
+                items = self._subject_cache.get(subject_index, self._load_subject)
+                slice_indices = np.array([item[0][MetadataKW.INPUT_METADATA][0][MetadataKW.SLICE_INDEX]
+                                          for item in items], dtype=np.int64)
+                # Patches of each slice, as (slice index within the subject, x_min, y_min)
+                patch_starts = np.zeros((0, 3), dtype=np.int64)
+                if self.is_2d_patch:
+                    patch_starts = np.concatenate([patch_starts] + [
+                        np.column_stack([np.full(len(starts), item_index), starts])
+                        for item_index, starts in enumerate(self._get_patch_starts(item) for item in items)])
+                if index_key:
+                    self.preprocessing_cache.save(index_key, [(slice_indices, patch_starts)])
+            self._slice_indices[subject_index] = slice_indices.tolist()
+
+            # Patches are sorted by slice
+            bounds = np.searchsorted(patch_starts[:, 0], np.arange(len(slice_indices) + 1))
+            for item_index in range(len(slice_indices)):
+                handle = LazyHandle(subject_index, item_index)
+                if self.is_2d_patch:
+                    starts = patch_starts[bounds[item_index]:bounds[item_index + 1], 1:]
+                    indexes.append(imed_loader_utils.get_patch_index(starts, self.length, len(self.handlers)))
+                    self.handlers.append(handle)
+                else:
+                    self.indexes.append(handle)
+
+        if self.is_2d_patch:
+            self.indexes = np.concatenate(indexes) if indexes else \
+                imed_loader_utils.get_patch_index([], self.length, 0)
+        logger.debug(f"Lazy dataset: indexed {len(self.indexes)} samples of {len(self.filename_pairs)} subjects.")
+
+    def _get_patch_filter_params(self) -> Optional[list]:
+        if not self.patch_filter_fn:
+            return None
+        return [self.patch_filter_fn.filter_empty_mask, self.patch_filter_fn.filter_absent_class,
+                self.patch_filter_fn.filter_empty_input, self.patch_filter_fn.is_train]
+
+    def _preprocess_slices(self, input_filenames: list, gt_filenames: list, roi_filename: list,
+                           metadata: list, slice_indices: list = None) -> Iterator[Tuple[dict, dict]]:
+        """Decode the images of a subject, filter its slices and apply the preprocessing transforms.
+
+        Args:
+            input_filenames (list): Input filenames, one per contrast.
+            gt_filenames (list): Ground truth filenames.
+            roi_filename (list): ROI filename.
+            metadata (list): Metadata, one per contrast.
+            slice_indices (list): Slices to preprocess, already filtered. If None, the slices are filtered with
+                slice_filter_fn and the ROI.
+
+        Yields:
+            tuple: Preprocessed (seg_pair, roi_pair) of each slice which is not filtered out.
+        """
+        roi_pair = SegmentationPair(input_filenames,
+                                    roi_filename,
+                                    metadata=metadata,
+                                    slice_axis=self.slice_axis,
+                                    cache=self.cache,
+                                    prepro_transforms=self.prepro_transforms)
+
+        seg_pair = SegmentationPair(input_filenames,
+                                    gt_filenames,
+                                    metadata=metadata,
+                                    slice_axis=self.slice_axis,
+                                    cache=self.cache,
+                                    prepro_transforms=self.prepro_transforms,
+                                    soft_gt=self.soft_gt)
+
+        # Volumes are decoded once, then filtered and sliced
+        for idx_pair_slice, slice_seg_pair in seg_pair.iter_pair_slices(gt_type=self.task,
+                                                                        slice_filter_fn=self.slice_filter_fn,
+                                                                        slice_indices=slice_indices):
+            self.has_bounding_box = imed_obj_detect.verify_metadata(slice_seg_pair, self.has_bounding_box)
+
+            if self.has_bounding_box:
+                self.prepro_transforms = imed_obj_detect.adjust_transforms(self.prepro_transforms, slice_seg_pair)
+
+            # Note: we force here gt_type=segmentation since ROI slice is needed to Crop the image
+            slice_roi_pair = roi_pair.get_pair_slice(idx_pair_slice, gt_type="segmentation")
+
+            if slice_indices is None and self.slice_filter_roi and \
+                    imed_loader_utils.filter_roi(slice_roi_pair['gt'], self.roi_thr):
+                continue
+
+            yield imed_transforms.apply_preprocessing_transforms(self.prepro_transforms,
+                                                                 slice_seg_pair,
+                                                                 slice_roi_pair)
+
+    def _get_preprocessing_cache_key(self, filename_pair: tuple, **params) -> Optional[str]:
+        """Return the key of a subject in the preprocessing cache, or None if the subject cannot be cached.
+
+        Subjects with bounding boxes are not cached, since their preprocessing transforms are adjusted on the fly.
+        Additional params are included in the key, e.g. to store the lazy index of the subject.
+        """
+        if self.preprocessing_cache is None:
+            return None
+        input_filenames, gt_filenames, roi_filename, metadata = filename_pair
+        if any(MetadataKW.BOUNDING_BOX in m for m in metadata):
+            return None
+
+        slice_filter_params, classifier_path = None, None
+        if self.slice_filter_fn:
+            slice_filter_params = [self.slice_filter_fn.filter_empty_mask, self.slice_filter_fn.filter_absent_class,
+                                   self.slice_filter_fn.filter_empty_input, self.slice_filter_fn.filter_classification]
+            if self.slice_filter_fn.filter_classification:
+                classifier_path = self.slice_filter_fn.classifier_path
+        return self.preprocessing_cache.get_key([input_filenames, gt_filenames, roi_filename, classifier_path],
+                                                dataset="2d",
+                                                slice_axis=self.slice_axis,
+                                                transforms=get_transforms_params(self.prepro_transforms),
+                                                task=self.task,
+                                                soft_gt=self.soft_gt,
+                                                slice_filter=slice_filter_params,
+                                                slice_filter_roi=[self.slice_filter_roi, self.roi_thr],
+                                                metadata=metadata,
+                                                **params)
+
+    def prepare_indices(self) -> None:
+        """Stores coordinates of 2d patches for training.
+
+        The coordinates are stored in a structured array (see `imed_loader_utils.get_patch_index`), and the patch
+        filter is evaluated on all the patches of a handler at once.
+        """
+        indexes = [imed_loader_utils.get_patch_index(self._get_patch_starts(self._get_cached_item(handle)),
+                                                     self.length, i)
+                   for i, handle in enumerate(self.handlers)]
+        self.indexes = np.concatenate(indexes) if indexes else imed_loader_utils.get_patch_index([], self.length, 0)
+
+    def _get_patch_starts(self, item: Tuple[dict, dict]) -> np.ndarray:
+        """Return the lower coordinates (x_min, y_min) of the 2d patches of a slice kept by the patch filter."""
+        if len(self.length) != 2 or len(self.stride) != 2:
+            raise RuntimeError('"length_2D" and "stride_2D" must be of length 2.')
+
+        primary_handle = item[0]
+        input_img = primary_handle.get('input')
+        gt_img = primary_handle.get('gt')
+
+        shape = input_img[0].shape
+
+        for length, stride, size in zip(self.length, self.stride, shape):
+            if stride > length or stride <= 0:
+                raise RuntimeError('"stride_2D" must be greater than 0 and smaller or equal to "length_2D".')
+            if length > size:
+                raise RuntimeError('"length_2D" must be smaller or equal to image dimensions after resampling.')
+
+        # The last patch along each dimension is shifted to end at the image border
+        starts = imed_loader_utils.get_window_starts(shape, self.length, self.stride)
+
+        if self.patch_filter_fn:
+            starts = starts[self.patch_filter_fn.filter_patches(input_img, gt_img or [], starts, self.length)]
+        return starts
+
+    def _cache_items(self, subject_index: int, items: List[Tuple[dict, dict]]) -> list:
+        """Return the handles to keep in indexes or handlers for the preprocessed items of a subject.
+
+        The items themselves if they are kept in memory, their index in the sample store if they are memory-mapped,
+        else LazyHandles to decode the subject again on access.
+        """
+        if self.disk_cache is None:
+            input_filename = self.filename_pairs[subject_index][0][0]
+            # Images given in memory have no filename
+            subject = Path(input_filename).name if isinstance(input_filename, str) else str(subject_index)
+            placement = self.memory_planner.place(get_nbytes(items), subject=subject)
+        else:
+            placement = MEMMAP if self.disk_cache else RAM
+
+        if placement == RAM:
+            return items
+        if placement == MEMMAP:
+            if self.sample_store is None:
+                self.sample_store = SampleStore()
+            return [self.sample_store.append(item) for item in items]
+        self._slice_indices[subject_index] = [item[0][MetadataKW.INPUT_METADATA][0][MetadataKW.SLICE_INDEX]
+                                              for item in items]
+        return [LazyHandle(subject_index, item_index) for item_index in range(len(items))]
+
+    def _get_cached_item(self, handle: Tuple[dict, dict] | int | LazyHandle) -> Tuple[dict, dict]:
+        """Return the preprocessed item corresponding to a handle returned by _cache_items or _load_index."""
+        if isinstance(handle, LazyHandle):
+            items = self._subject_cache.get(
+                handle.subject_index, lambda i: self._load_subject(i, slice_indices=self._slice_indices[i]))
+            return items[handle.item_index]
+        if isinstance(handle, int):
+            return self.sample_store[handle]
+        return handle
+
+    def __getstate__(self) -> dict:
+        # Sent to the DataLoader workers: the filters (which may hold a classifier on GPU) and the preprocessing cache
+        # are only needed to load the data. Each worker loads the subjects decoded on access it needs, already
+        # filtered, from the preprocessing cache if possible.
+        state = self.__dict__.copy()
+        state['slice_filter_fn'] = None
+        if not self._slice_indices:
+            state['preprocessing_cache'] = None
+        state['_subject_cache'] = imed_loader_utils.LRUCache(self.max_cached_subjects)
+        return state
 
     def set_transform(self, transform: List[Optional[Compose]]) -> None:
         self.transform = transform
@@ -256,22 +422,17 @@ class MRI2DSegmentationDataset(Dataset):
             index (int): Slice index.
         """
 
-        # copy.deepcopy is used to have different coordinates for reconstruction for a given handler with patch,
+        # Metadata are copied to have different coordinates for reconstruction for a given handler with patch,
         # to allow a different rater at each iteration of training, and to clean transforms params from previous
-        # transforms i.e. remove params from previous iterations so that the coming transforms are different
+        # transforms i.e. remove params from previous iterations so that the coming transforms are different.
+        # Pixel data are shared with the cached pair as read-only views: only the extracted slice or patch is copied.
         if self.is_2d_patch:
-            coord = self.indexes[index]
-            if self.disk_cache:
-                with self.handlers[coord['handler_index']].open(mode="rb") as f:
-                    seg_pair_slice, roi_pair_slice = pickle.load(f)
-            else:
-                seg_pair_slice, roi_pair_slice = copy.deepcopy(self.handlers[coord['handler_index']])
+            coord = imed_loader_utils.get_patch_coord(self.indexes[index])
+            seg_pair_slice, roi_pair_slice = self._get_cached_item(self.handlers[coord['handler_index']])
         else:
-            if self.disk_cache:
-                with self.indexes[index].open(mode="rb") as f:
-                    seg_pair_slice, roi_pair_slice = pickle.load(f)
-            else:
-                seg_pair_slice, roi_pair_slice = copy.deepcopy(self.indexes[index])
+            seg_pair_slice, roi_pair_slice = self._get_cached_item(self.indexes[index])
+        seg_pair_slice = imed_loader_utils.get_sample_view(seg_pair_slice)
+        roi_pair_slice = imed_loader_utils.get_sample_view(roi_pair_slice)
 
         # In case multiple raters
         if seg_pair_slice['gt'] and isinstance(seg_pair_slice['gt'][0], list):
@@ -309,13 +470,12 @@ class MRI2DSegmentationDataset(Dataset):
                                  coord["y_min"], coord["y_max"]]
 
         # Extract image and gt slices or patches from coordinates
-        stack_input = np.asarray(seg_pair_slice["input"])[:,
-                                 coord['x_min']:coord['x_max'],
-                                 coord['y_min']:coord['y_max']]
+        # Note: each channel is cropped before being stacked, so that only the slice or patch is copied
+        stack_input = np.stack([data[coord['x_min']:coord['x_max'], coord['y_min']:coord['y_max']]
+                                for data in seg_pair_slice["input"]])
         if seg_pair_slice["gt"]:
-            stack_gt = np.asarray(seg_pair_slice["gt"])[:,
-                                  coord['x_min']:coord['x_max'],
-                                  coord['y_min']:coord['y_max']]
+            stack_gt = np.stack([data[coord['x_min']:coord['x_max'], coord['y_min']:coord['y_max']]
+                                 for data in seg_pair_slice["gt"]])
         else:
             stack_gt = []
 
@@ -337,7 +497,7 @@ class MRI2DSegmentationDataset(Dataset):
             # Force no transformation on labels for classification task
             # stack_gt is a tensor of size 1x1, values: 0 or 1
             # "expand(1)" is necessary to be compatible with segmentation convention: n_labelxhxwxd
-            stack_gt = torch.from_numpy(seg_pair_slice["gt"][0]).expand(1)
+            stack_gt = torch.from_numpy(np.array(seg_pair_slice["gt"][0])).expand(1)
 
         data_dict = {
             'input': stack_input,
@@ -353,28 +513,3 @@ class MRI2DSegmentationDataset(Dataset):
             data_dict = dropout_input(data_dict)
 
         return data_dict
-
-    def determine_cache_need(self, item: tuple, n_slice: int):
-        """
-        When Cache flag is not explicitly set, determine whether to cache the data or not
-        Args:
-            item: an EXAMPLE, typical Tuple structure contain the main data.
-            n_slice: number of slice in one file_name_pairs.
-
-        Returns:
-
-        """
-        size_item_in_bytes = get_obj_size(item)
-
-        optimal_ram_limit = get_system_memory() * 0.5
-
-        # Size limit: 4GB GPU RAM, keep in mind tranform etc might take MORE!
-        size_estimated_dataset_GB = (size_item_in_bytes) * len(self.filename_pairs) * n_slice / 1024 ** 3
-        if size_estimated_dataset_GB > optimal_ram_limit:
-            logger.info(f"Estimated 2D dataset size is {size_estimated_dataset_GB} GB, which is larger than {optimal_ram_limit} GB. Auto "
-                        f"enabling disk cache.")
-            self.disk_cache = True
-        else:
-            logger.info(f"Estimated 2D dataset size is {size_estimated_dataset_GB} GB, which is smaller than {optimal_ram_limit} GB. File "
-                        f"cache will not be used")
-            self.disk_cache = False
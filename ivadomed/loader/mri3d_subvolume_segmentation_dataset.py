@@ -1,21 +1,20 @@
-import copy
 import random
 from pathlib import Path
-import pickle
 from typing import List, Optional
 
 import numpy as np
 
 from torch.utils.data import Dataset
-from loguru import logger
 
 from ivadomed import transforms as imed_transforms, postprocessing as imed_postpro
 from ivadomed.loader import utils as imed_loader_utils
-from ivadomed.loader.utils import dropout_input, create_temp_directory, get_obj_size
+from ivadomed.loader.utils import dropout_input, LazyHandle
 from ivadomed.loader.segmentation_pair import SegmentationPair
+from ivadomed.loader.sample_store import SampleStore
+from ivadomed.loader.memory_planner import MemoryPlanner, get_nbytes, RAM, MEMMAP
+from ivadomed.loader.preprocessing_cache import PreprocessingCache, get_transforms_params
 from ivadomed.object_detection import utils as imed_obj_detect
 from ivadomed.keywords import MetadataKW, SegmentationDatasetKW, SegmentationPairKW
-from ivadomed.utils import get_timestamp, get_system_memory
 from torchvision.transforms import Compose
 
 
@@ -39,7 +38,20 @@ class MRI3DSubVolumeSegmentationDataset(Dataset):
         truths are thresholded (0.5) after the data augmentation operations.
         is_input_dropout (bool): Return input with missing modalities.
         disk_cache (bool): set whether all input data should be cached in local folders to allow faster subsequent
-        reloading and bypass memory cap.
+        reloading and bypass memory cap. If None, chosen for each subject by the memory planner.
+        preprocessing_cache (PreprocessingCache): Persistent cache of the preprocessed volumes of each subject, shared
+            between runs. If None, the volumes are preprocessed at each run.
+        lazy (bool): If True, only the index of the subvolumes is built at initialization: the volumes of a subject are
+            loaded and preprocessed when first accessed, and kept in a cache of max_cached_subjects subjects.
+        max_cached_subjects (int): Number of subjects kept in memory in lazy mode, per DataLoader worker.
+        memory_planner (MemoryPlanner): Chooses where the volumes of each subject are kept (RAM, memory-mapped disk
+            cache or decoded on access) if disk_cache is None. If None, a planner with the default budget is used.
+
+    Attributes:
+        sample_store (SampleStore): Memory-mapped disk cache of the (seg_pair, roi_pair) tuples. Handlers contain the
+            index in the store of the memory-mapped tuples, the tuples kept in memory, and a LazyHandle for the
+            subjects decoded on access.
+        lazy (bool): If True, the volumes are loaded on first access.
     """
 
     def __init__(self,
@@ -51,7 +63,11 @@ class MRI3DSubVolumeSegmentationDataset(Dataset):
                  task: str = "segmentation",
                  soft_gt: bool = False,
                  is_input_dropout: bool = False,
-                 disk_cache: bool=True):
+                 disk_cache: bool=True,
+                 preprocessing_cache: PreprocessingCache = None,
+                 lazy: bool = False,
+                 max_cached_subjects: int = 8,
+                 memory_planner: MemoryPlanner = None):
         self.filename_pairs = filename_pairs
 
         # could be a list of tuple of objects OR path objects to the actual disk equivalent.
@@ -67,91 +83,166 @@ class MRI3DSubVolumeSegmentationDataset(Dataset):
         self.task = task
         self.soft_gt = soft_gt
         self.is_input_dropout = is_input_dropout
-        self.disk_cache: bool = disk_cache
+        self.lazy = lazy
+        # In lazy mode, the volumes of the last accessed subjects are kept in memory instead
+        self.disk_cache: bool = False if lazy else disk_cache
+        self.sample_store: Optional[SampleStore] = None
+        self.preprocessing_cache = preprocessing_cache
+        self.max_cached_subjects = max_cached_subjects
+        self.memory_planner = memory_planner
+        if self.disk_cache is None and memory_planner is None:
+            self.memory_planner = MemoryPlanner()
+        self._shapes: List[tuple] = []
+        self._subject_cache = imed_loader_utils.LRUCache(max_cached_subjects)
 
         self._load_filenames()
         self._prepare_indices()
 
     def _load_filenames(self) -> None:
-        """Load preprocessed pair data (input and gt) in handler."""
-        path_temp: Path = Path(create_temp_directory())
-
-        for input_filename, gt_filename, roi_filename, metadata in self.filename_pairs:
-            segpair = SegmentationPair(input_filename, gt_filename, metadata=metadata, slice_axis=self.slice_axis,
-                                       soft_gt=self.soft_gt)
-            input_data, gt_data = segpair.get_pair_data()
-            metadata = segpair.get_pair_metadata()
-            seg_pair = {
-                'input': input_data,
-                'gt': gt_data,
-                MetadataKW.INPUT_METADATA: metadata[MetadataKW.INPUT_METADATA],
-                MetadataKW.GT_METADATA: metadata[MetadataKW.GT_METADATA]
-            }
-
-            self.has_bounding_box = imed_obj_detect.verify_metadata(seg_pair, self.has_bounding_box)
-            if self.has_bounding_box:
-                self.prepro_transforms = imed_obj_detect.adjust_transforms(self.prepro_transforms, seg_pair,
-                                                                           length=self.length,
-                                                                           stride=self.stride)
-            seg_pair, roi_pair = imed_transforms.apply_preprocessing_transforms(self.prepro_transforms,
-                                                                                seg_pair=seg_pair)
-
-            for metadata in seg_pair[MetadataKW.INPUT_METADATA]:
-                metadata[MetadataKW.INDEX_SHAPE] = seg_pair['input'][0].shape
-
-            # First time detemine cache automatically IF not specified. Otherwise, use the cache specified.
+        """Load preprocessed pair data (input and gt) in handler.
+
+        In lazy mode, only the shape of the preprocessed volumes is kept, read from the preprocessing cache if
+        available.
+        """
+        for subject_index, (input_filename, gt_filename, _, metadata) in enumerate(self.filename_pairs):
+            if self.lazy:
+                index_key = self._get_preprocessing_cache_key(input_filename, gt_filename, metadata, index=True)
+                cached_shape = self.preprocessing_cache.load(index_key) if index_key else None
+                if cached_shape is not None:
+                    shape = tuple(cached_shape[0].tolist())
+                else:
+                    seg_pair, _ = self._subject_cache.get(subject_index, self._load_subject)
+                    shape = seg_pair['input'][0].shape
+                    if index_key:
+                        self.preprocessing_cache.save(index_key, [np.array(shape)])
+                self._shapes.append(shape)
+                self.handlers.append(LazyHandle(subject_index, 0))
+                continue
+
+            seg_pair, roi_pair = self._load_subject(subject_index)
+            self._shapes.append(seg_pair['input'][0].shape)
+
+            # Choose the placement of the subject if the cache is not specified
             if self.disk_cache is None:
-                self.disk_cache = self.determine_cache_need(seg_pair, roi_pair)
+                # Images given in memory have no filename
+                subject = Path(input_filename[0]).name if isinstance(input_filename[0], str) else str(subject_index)
+                placement = self.memory_planner.place(get_nbytes((seg_pair, roi_pair)), subject=subject)
+            else:
+                placement = MEMMAP if self.disk_cache else RAM
 
-            if self.disk_cache:
-                # Write SegPair and ROIPair to disk cache with timestamp to avoid collisions
-                path_cache_seg_pair = path_temp / f'seg_pair_{get_timestamp()}.pkl'
-                with path_cache_seg_pair.open(mode='wb') as f:
-                    pickle.dump(seg_pair, f)
+            if placement == RAM:
+                self.handlers.append((seg_pair, roi_pair))
+            elif placement == MEMMAP:
+                # Write SegPair and ROIPair to the memory-mapped disk cache, self.handlers only keeps their index
+                if self.sample_store is None:
+                    self.sample_store = SampleStore()
+                self.handlers.append(self.sample_store.append((seg_pair, roi_pair)))
+            else:
+                self.handlers.append(LazyHandle(subject_index, 0))
+
+        if self.disk_cache is None and not self.lazy:
+            self.memory_planner.report()
+
+    def _load_subject(self, subject_index: int) -> tuple:
+        """Return the preprocessed (seg_pair, roi_pair) of a subject, from the preprocessing cache if possible."""
+        input_filename, gt_filename, _, metadata = self.filename_pairs[subject_index]
+        # Skip decoding and preprocessing if the subject is in the persistent preprocessing cache
+        cache_key = self._get_preprocessing_cache_key(input_filename, gt_filename, metadata)
+        cached_pairs = self.preprocessing_cache.load(cache_key) if cache_key else None
+        if cached_pairs is not None:
+            seg_pair, roi_pair = cached_pairs[0]
+        else:
+            seg_pair, roi_pair = self._preprocess_volume(input_filename, gt_filename, metadata)
+            if cache_key:
+                self.preprocessing_cache.save(cache_key, [(seg_pair, roi_pair)])
 
-                path_cache_roi_pair = path_temp / f'roi_pair_{get_timestamp()}.pkl'
-                with path_cache_roi_pair.open(mode='wb') as f:
-                    pickle.dump(roi_pair, f)
-                self.handlers.append((path_cache_seg_pair, path_cache_roi_pair))
+        for metadata in seg_pair[MetadataKW.INPUT_METADATA]:
+            metadata[MetadataKW.INDEX_SHAPE] = seg_pair['input'][0].shape
+        return seg_pair, roi_pair
 
-            else:
-                # self.handler is now a list of a FILES instead of actual data to prevent this list from taking up too much
-                # memory
-                self.handlers.append((seg_pair, roi_pair))
+    def _preprocess_volume(self, input_filename: list, gt_filename: list, metadata: list) -> tuple:
+        """Decode the images of a subject and apply the preprocessing transforms.
+
+        Args:
+            input_filename (list): Input filenames, one per contrast.
+            gt_filename (list): Ground truth filenames.
+            metadata (list): Metadata, one per contrast.
+
+        Returns:
+            tuple: Preprocessed seg_pair and roi_pair.
+        """
+        segpair = SegmentationPair(input_filename, gt_filename, metadata=metadata, slice_axis=self.slice_axis,
+                                   soft_gt=self.soft_gt)
+        input_data, gt_data = segpair.get_pair_data()
+        metadata = segpair.get_pair_metadata()
+        seg_pair = {
+            'input': input_data,
+            'gt': gt_data,
+            MetadataKW.INPUT_METADATA: metadata[MetadataKW.INPUT_METADATA],
+            MetadataKW.GT_METADATA: metadata[MetadataKW.GT_METADATA]
+        }
+
+        self.has_bounding_box = imed_obj_detect.verify_metadata(seg_pair, self.has_bounding_box)
+        if self.has_bounding_box:
+            self.prepro_transforms = imed_obj_detect.adjust_transforms(self.prepro_transforms, seg_pair,
+                                                                       length=self.length,
+                                                                       stride=self.stride)
+        return imed_transforms.apply_preprocessing_transforms(self.prepro_transforms, seg_pair=seg_pair)
+
+    def _get_preprocessing_cache_key(self, input_filename: list, gt_filename: list, metadata: list,
+                                     **params) -> Optional[str]:
+        """Return the key of a subject in the preprocessing cache, or None if the subject cannot be cached.
+
+        Subjects with bounding boxes are not cached, since their preprocessing transforms are adjusted on the fly.
+        Additional params are included in the key, e.g. to store the lazy index of the subject.
+        """
+        if self.preprocessing_cache is None or any(MetadataKW.BOUNDING_BOX in m for m in metadata):
+            return None
+        return self.preprocessing_cache.get_key([input_filename, gt_filename],
+                                                dataset="3d",
+                                                slice_axis=self.slice_axis,
+                                                transforms=get_transforms_params(self.prepro_transforms),
+                                                soft_gt=self.soft_gt,
+                                                metadata=metadata,
+                                                **params)
 
     def _prepare_indices(self):
-        """Stores coordinates of subvolumes for training."""
+        """Stores coordinates of subvolumes for training, in a structured array (see
+        `imed_loader_utils.get_patch_index`)."""
+        indexes = []
         for i in range(0, len(self.handlers)):
 
-            if self.disk_cache:
-                with self.handlers[i][0].open(mode='rb') as f:
-                    segpair = pickle.load(f)
-            else:
-                segpair = self.handlers[i][0]
-
-            input_img = segpair.get('input')
-            shape = input_img[0].shape
-
-            if ((shape[0] - self.length[0]) % self.stride[0]) != 0 or self.length[0] % 16 != 0 or shape[0] < \
-                    self.length[0] \
-                    or ((shape[1] - self.length[1]) % self.stride[1]) != 0 or self.length[1] % 16 != 0 or shape[1] < \
-                    self.length[1] \
-                    or ((shape[2] - self.length[2]) % self.stride[2]) != 0 or self.length[2] % 16 != 0 or shape[2] < \
-                    self.length[2]:
-                raise RuntimeError('Input shape of each dimension should be a \
-                                    multiple of length plus 2 * padding and a multiple of 16.')
-
-            for x in range(0, (shape[0] - self.length[0]) + 1, self.stride[0]):
-                for y in range(0, (shape[1] - self.length[1]) + 1, self.stride[1]):
-                    for z in range(0, (shape[2] - self.length[2]) + 1, self.stride[2]):
-                        self.indexes.append({
-                            'x_min': x,
-                            'x_max': x + self.length[0],
-                            'y_min': y,
-                            'y_max': y + self.length[1],
-                            'z_min': z,
-                            'z_max': z + self.length[2],
-                            'handler_index': i})
+            shape = self._shapes[i]
+
+            for length, stride, size in zip(self.length, self.stride, shape):
+                if stride > length or stride <= 0:
+                    raise RuntimeError('"stride_3D" must be greater than 0 and smaller or equal to "length_3D".')
+                if length % 16 != 0:
+                    raise RuntimeError('"length_3D" must be a multiple of 16.')
+                if length > size:
+                    raise RuntimeError('"length_3D" must be smaller or equal to image dimensions after resampling.')
+
+            # The last subvolume along each dimension is shifted to end at the image border
+            starts = imed_loader_utils.get_window_starts(shape, self.length, self.stride)
+            indexes.append(imed_loader_utils.get_patch_index(starts, self.length, i))
+
+        self.indexes = np.concatenate(indexes) if indexes else imed_loader_utils.get_patch_index([], self.length, 0)
+
+    def _get_cached_pairs(self, handler_index: int) -> tuple:
+        """Return the preprocessed (seg_pair, roi_pair) of a handler, from memory, from the disk cache or decoded on
+        access."""
+        handle = self.handlers[handler_index]
+        if isinstance(handle, LazyHandle):
+            return self._subject_cache.get(handle.subject_index, self._load_subject)
+        if isinstance(handle, int):
+            return self.sample_store[handle]
+        return handle
+
+    def __getstate__(self) -> dict:
+        # Sent to the DataLoader workers: each worker keeps its own cache of the subjects decoded on access
+        state = self.__dict__.copy()
+        state['_subject_cache'] = imed_loader_utils.LRUCache(self.max_cached_subjects)
+        return state
 
     def __len__(self) -> int:
         """Return the dataset size. The number of subvolumes."""
@@ -165,7 +256,7 @@ class MRI3DSubVolumeSegmentationDataset(Dataset):
         """
 
         # Get the tuple that defines the boundaries for the subsample
-        coord: dict = self.indexes[subvolume_index]
+        coord: dict = imed_loader_utils.get_patch_coord(self.indexes[subvolume_index])
         x_min = coord.get(SegmentationDatasetKW.X_MIN)
         x_max = coord.get(SegmentationDatasetKW.X_MAX)
         y_min = coord.get(SegmentationDatasetKW.Y_MIN)
@@ -173,18 +264,13 @@ class MRI3DSubVolumeSegmentationDataset(Dataset):
         z_min = coord.get(SegmentationDatasetKW.Z_MIN)
         z_max = coord.get(SegmentationDatasetKW.Z_MAX)
 
-        # Obtain tuple reference to the pairs of file references
-        tuple_seg_roi_pair: tuple = self.handlers[coord.get(SegmentationDatasetKW.HANDLER_INDEX)]
-
-        # Disk Cache handling, either, load the seg_pair, not using ROI pair here.
-        # copy.deepcopy is used to have different coordinates for reconstruction for a given handler,
+        # Obtain the seg_pair (memory-mapped if disk cache is used), not using ROI pair here.
+        # Metadata are copied to have different coordinates for reconstruction for a given handler,
         # to allow a different rater at each iteration of training, and to clean transforms params from previous
-        # transforms i.e. remove params from previous iterations so that the coming transforms are different
-        if self.disk_cache:
-            with tuple_seg_roi_pair[0].open(mode='rb') as f:
-                seg_pair = pickle.load(f)
-        else:
-            seg_pair, _ = copy.deepcopy(tuple_seg_roi_pair)
+        # transforms i.e. remove params from previous iterations so that the coming transforms are different.
+        # Pixel data are shared with the cached volume as read-only views: only the subvolume is copied.
+        seg_pair, _ = self._get_cached_pairs(coord.get(SegmentationDatasetKW.HANDLER_INDEX))
+        seg_pair = imed_loader_utils.get_sample_view(seg_pair)
 
         # In case multiple raters
         if seg_pair[SegmentationPairKW.GT] and isinstance(seg_pair[SegmentationPairKW.GT][0], list):
@@ -207,20 +293,13 @@ class MRI3DSubVolumeSegmentationDataset(Dataset):
             metadata_gt = []
 
         # Extract subvolume and gt from coordinates
-        stack_input = np.asarray(seg_pair[SegmentationPairKW.INPUT])[
-                      :,
-                      x_min:x_max,
-                      y_min:y_max,
-                      z_min:z_max
-            ]
+        # Note: each channel is cropped before being stacked, so that only the subvolume is copied
+        stack_input = np.stack([data[x_min:x_max, y_min:y_max, z_min:z_max]
+                                for data in seg_pair[SegmentationPairKW.INPUT]])
 
         if seg_pair[SegmentationPairKW.GT]:
-            stack_gt = np.asarray(seg_pair[SegmentationPairKW.GT])[
-                       :,
-                       x_min:x_max,
-                       y_min:y_max,
-                       z_min:z_max
-            ]
+            stack_gt = np.stack([data[x_min:x_max, y_min:y_max, z_min:z_max]
+                                 for data in seg_pair[SegmentationPairKW.GT]])
         else:
             stack_gt = []
 
@@ -263,31 +342,3 @@ class MRI3DSubVolumeSegmentationDataset(Dataset):
             subvolumes = dropout_input(subvolumes)
 
         return subvolumes
-
-    def determine_cache_need(self, seg_pair: dict, roi_pair: dict):
-        """
-        When Cache flag is not explicitly set, determine whether to cache the data or not
-        Args:
-            seg_pair: an EXAMPLE, typical seg_pair object
-            roi_pair: an EXAMPLE, typical seg_pair object
-
-        Returns:
-
-        """
-        size_seg_pair_in_bytes = get_obj_size(seg_pair)
-        size_roi_pair_in_bytes = get_obj_size(roi_pair)
-
-        optimal_ram_limit = get_system_memory() * 0.5
-
-        # Size limit: 4GB GPU RAM, keep in mind tranform etc might take MORE!
-        size_estimated_dataset_GB = (size_seg_pair_in_bytes + size_roi_pair_in_bytes) * len(self.filename_pairs) / 1024 ** 3
-        if size_estimated_dataset_GB > optimal_ram_limit:
-            logger.info(f"Estimated 3D dataset size is {size_estimated_dataset_GB} GB, which is larger than {optimal_ram_limit} GB. Auto "
-                        f"enabling cache.")
-            self.disk_cache = True
-            return True
-        else:
-            logger.info(f"Estimated 3D dataset size is {size_estimated_dataset_GB} GB, which is smaller than {optimal_ram_limit} GB. File "
-                        f"cache will not be used")
-            self.disk_cache = False
-            return False
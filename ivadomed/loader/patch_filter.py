@@ -1,3 +1,5 @@
+import itertools
+
 import numpy as np
 
 
@@ -52,8 +54,97 @@ class PatchFilter(object):
                     return False
             if self.filter_empty_input:
                 # Discard set of 2D patches if one of them is empty or filled with constant value
-                # (i.e. std == 0) at training time
-                if np.any([img.std() == 0 for img in input_data]):
+                # (i.e. max == min, exact unlike std == 0 which is subject to rounding errors) at training time
+                if np.any([img.max() == img.min() for img in input_data]):
                     return False
 
         return True
+
+    def filter_patches(self, input_data: list, gt_data: list, starts: np.ndarray, length: list) -> np.ndarray:
+        """Evaluate the filter on all the candidate patches of an image at once.
+
+        Equivalent to calling the filter on each patch, without extracting the patches: the number of non-zero voxels
+        of each patch is read from summed-area tables, and a patch is constant (max == min) if it has no intensity
+        change between neighbouring voxels.
+
+        Args:
+            input_data (list): Input images, one per contrast.
+            gt_data (list): Ground truth masks, one per class. Each class may be a list of masks (one per rater).
+            starts (ndarray): Lower coordinates of the patches, of shape (n_patches, 2).
+            length (list): Size of the patches.
+
+        Returns:
+            ndarray: Boolean array of length n_patches, True for the patches to keep.
+        """
+        starts = np.asarray(starts).reshape(-1, len(length))
+        keep = np.ones(len(starts), dtype=bool)
+        if not self.is_train:
+            return keep
+
+        if self.filter_empty_mask or self.filter_absent_class:
+            # Number of non-zero voxels of each class (over all raters) in each patch
+            masks = [np.asarray(mask) for mask in gt_data]
+            counts = [get_window_sums(mask.reshape((-1,) + mask.shape[-len(length):]).any(axis=0), starts, length)
+                      for mask in masks]
+            if self.filter_empty_mask:
+                keep &= np.sum(counts, axis=0) > 0 if counts else False
+            if self.filter_absent_class:
+                keep &= np.all([count > 0 for count in counts], axis=0)
+        if self.filter_empty_input:
+            for img in input_data:
+                keep &= ~is_window_constant(np.asarray(img), starts, length)
+
+        return keep
+
+
+def get_window_sums(data: np.ndarray, starts: np.ndarray, length: list) -> np.ndarray:
+    """Sum data over windows of the same size, using a summed-area table.
+
+    Args:
+        data (ndarray): N-dimensional array. Boolean arrays are summed as integers.
+        starts (ndarray): Lower coordinates of the windows, of shape (n_windows, N).
+        length (list): Size of the windows along each dimension.
+
+    Returns:
+        ndarray: Sum of each window, of length n_windows.
+    """
+    data = np.asarray(data)
+    starts = np.asarray(starts).reshape(-1, data.ndim)
+    table = np.pad(data.astype(np.int64) if data.dtype == bool else data, [(1, 0)] * data.ndim)
+    for axis in range(data.ndim):
+        table = table.cumsum(axis=axis)
+
+    # Inclusion-exclusion over the 2^N corners of each window
+    ends = starts + np.asarray(length)
+    sums = np.zeros(len(starts), dtype=table.dtype)
+    for corner in itertools.product([False, True], repeat=data.ndim):
+        idx = tuple(np.where(is_end, ends[:, dim], starts[:, dim]) for dim, is_end in enumerate(corner))
+        sign = (-1) ** (data.ndim - sum(corner))
+        sums += sign * table[idx]
+    return sums
+
+
+def is_window_constant(data: np.ndarray, starts: np.ndarray, length: list) -> np.ndarray:
+    """Return True for the windows of data which are filled with a constant value.
+
+    A window is constant if no voxel differs from its neighbour along any dimension within the window.
+
+    Args:
+        data (ndarray): N-dimensional array.
+        starts (ndarray): Lower coordinates of the windows, of shape (n_windows, N).
+        length (list): Size of the windows along each dimension.
+
+    Returns:
+        ndarray: Boolean array of length n_windows.
+    """
+    starts = np.asarray(starts).reshape(-1, data.ndim)
+    is_constant = np.ones(len(starts), dtype=bool)
+    for axis in range(data.ndim):
+        if length[axis] < 2:
+            continue
+        changes = np.diff(data, axis=axis) != 0
+        # Differences within a window span length - 1 voxels along the axis
+        length_changes = list(length)
+        length_changes[axis] -= 1
+        is_constant &= get_window_sums(changes, starts, length_changes) == 0
+    return is_constant
@@ -0,0 +1,161 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from ivadomed import utils as imed_utils
+from ivadomed.loader.sample_store import SampleStore
+import typing
+if typing.TYPE_CHECKING:
+    from typing import List, Optional
+    from ivadomed.transforms import Compose
+
+
+class PreprocessingCache(object):
+    """Persistent cache of preprocessed samples, shared between runs.
+
+    Decoding the images and applying the preprocessing transforms (``Resample``, ``CenterCrop``, ``ROICrop``) is done
+    again at each training or testing, even when neither the data nor the preprocessing changed. This cache keeps the
+    preprocessed samples of each subject on disk, in an entry addressed by the sha256 of the files content, the
+    preprocessing parameters (slice axis, transforms, filters, etc.) and the ivadomed version. Each entry is a
+    SampleStore folder.
+
+    The cache size is capped: when it exceeds ``max_size_gb``, the least recently used entries are removed.
+
+    Args:
+        path (str): Folder of the cache.
+        max_size_gb (float): Maximum size of the cache in GB.
+
+    Attributes:
+        path (Path): Folder of the cache.
+        max_size_gb (float): Maximum size of the cache in GB.
+    """
+
+    def __init__(self, path: str, max_size_gb: float = 20.) -> None:
+        self.path = Path(path).expanduser()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size_gb = max_size_gb
+        self._file_hashes = {}
+
+    def get_key(self, filenames: list, **params) -> str:
+        """Compute the key of the entry of a subject.
+
+        Args:
+            filenames (list): Files of the subject (input, ground truth, ROI). Nested lists and None are allowed.
+            **params: Parameters which change the preprocessed samples. Values must be serializable in JSON (or have a
+                deterministic string representation).
+
+        Returns:
+            str: Hexadecimal sha256 of the files content, the parameters and the ivadomed version.
+        """
+        content = {
+            'files': self._hash_files(filenames),
+            'params': params,
+            'version': imed_utils.__version__
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def load(self, key: str) -> Optional[List]:
+        """Return the samples of an entry, or None if the entry is not in the cache.
+
+        The samples are loaded in memory, so that they stay valid if the entry is evicted afterwards.
+        """
+        path_entry = self.path / key
+        if not (path_entry / SampleStore.INDEX_FILENAME).is_file():
+            return None
+        try:
+            store = SampleStore(str(path_entry))
+            samples = [_load_arrays(store[idx]) for idx in range(len(store))]
+        except (OSError, ValueError, EOFError) as err:
+            # Entry evicted by another process while reading, or corrupted
+            logger.warning(f"Unable to read preprocessing cache entry {key}: {err}")
+            return None
+        # Mark the entry as recently used
+        os.utime(path_entry)
+        return samples
+
+    def save(self, key: str, samples: list) -> None:
+        """Save the samples of an entry, then evict the least recently used entries if the cache is too large.
+
+        The entry is written in a temporary folder and renamed once complete, so that concurrent runs never read a
+        partial entry.
+        """
+        path_entry = self.path / key
+        if path_entry.exists():
+            return
+        path_tmp = self.path / f".tmp_{key}_{uuid.uuid4().hex}"
+        store = SampleStore(str(path_tmp))
+        for sample in samples:
+            store.append(sample)
+        store.flush()
+        try:
+            path_tmp.rename(path_entry)
+        except OSError:
+            # Entry written in the meantime by another run
+            shutil.rmtree(path_tmp, ignore_errors=True)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache size is below max_size_gb."""
+        entries = []
+        for path_entry in self.path.iterdir():
+            if not path_entry.is_dir() or path_entry.name.startswith('.tmp_'):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in path_entry.iterdir())
+                entries.append((path_entry.stat().st_mtime, size, path_entry))
+            except OSError:
+                continue
+
+        size_cache = sum(size for _, size, _ in entries)
+        max_size = self.max_size_gb * 1024 ** 3
+        for _, size, path_entry in sorted(entries):
+            if size_cache <= max_size:
+                break
+            shutil.rmtree(path_entry, ignore_errors=True)
+            size_cache -= size
+            logger.debug(f"Removed preprocessing cache entry {path_entry.name}.")
+
+    def _hash_files(self, filenames: list) -> list:
+        """Return the sha256 of the files, computed once per file version (path, size and modification time)."""
+        if filenames is None:
+            return None
+        if isinstance(filenames, (list, tuple)):
+            return [self._hash_files(f) for f in filenames]
+        stat = os.stat(filenames)
+        key = (str(filenames), stat.st_size, stat.st_mtime_ns)
+        if key not in self._file_hashes:
+            self._file_hashes[key] = imed_utils.get_file_sha256(filenames)
+        return self._file_hashes[key]
+
+
+def get_transforms_params(transforms: Optional[Compose]) -> Optional[dict]:
+    """Describe a Compose object with the name and parameters of its transforms, to be used in a cache key.
+
+    Args:
+        transforms (Compose): Preprocessing transforms.
+
+    Returns:
+        dict: For each data type ("im", "gt", "roi"), the list of (transform name, parameters).
+    """
+    if transforms is None:
+        return None
+    return {data_type: [(tr.__class__.__name__, vars(tr)) for tr in compose.transforms]
+            for data_type, compose in transforms.transform.items()}
+
+
+def _load_arrays(obj):
+    """Copy the memory-mapped arrays of a sample in memory."""
+    if isinstance(obj, np.ndarray):
+        return np.array(obj)
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_load_arrays(o) for o in obj)
+    if isinstance(obj, dict):
+        return {key: _load_arrays(value) for key, value in obj.items()}
+    return obj
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import copy
 import typing
 if typing.TYPE_CHECKING:
     from typing import ItemsView
@@ -46,3 +47,14 @@ class SampleMetadata(object):
 
     def keys(self) -> KeysView:
         return self.metadata.keys()
+
+    def copy(self) -> SampleMetadata:
+        """Return an independent copy of the metadata.
+
+        Nested values (e.g. crop or transform parameters) are copied too, so that transforms applied on the copy do not
+        leak into the original metadata.
+
+        Returns:
+            SampleMetadata: Copied metadata.
+        """
+        return SampleMetadata(copy.deepcopy(self.metadata))
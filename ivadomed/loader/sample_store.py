@@ -0,0 +1,184 @@
+from __future__ import annotations
+import os
+import pickle
+import shutil
+import weakref
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from ivadomed.loader.utils import create_temp_directory
+import typing
+if typing.TYPE_CHECKING:
+    from typing import Any, Dict
+
+
+class ArrayRef(typing.NamedTuple):
+    """Location of an array stored in a SampleStore shard.
+
+    Attributes:
+        shard (int): Shard number.
+        offset (int): Offset of the array in the shard, in bytes.
+        shape (tuple): Array shape.
+        dtype (str): Array data type.
+    """
+    shard: int
+    offset: int
+    shape: tuple
+    dtype: str
+
+
+class SampleStore(object):
+    """Disk cache of preprocessed samples, stored in contiguous memory-mapped shards.
+
+    Each appended sample (typically a tuple (seg_pair, roi_pair)) is split in two parts:
+
+    * the numpy arrays, written one after the other in binary shard files (``shard_<n>.bin``) and read back as
+      read-only ``np.memmap`` views, so that extracting a slice, a patch or a subvolume does not read the rest of the
+      volume from the disk;
+    * the rest of the sample (metadata, nested lists and dicts), where each array is replaced by its ArrayRef
+      (shard, offset, shape, dtype). These skeletons are kept in memory and saved in the ``index.pkl`` sidecar by
+      ``flush``.
+
+    If no path is given, the store lives in a temporary folder which is deleted with the store (or at exit). If a path
+    is given, the store is kept on disk and an existing store in this folder is reopened, allowing to reuse it between
+    runs. The data appended after the last ``flush`` (e.g. by an interrupted run) is not indexed and is discarded when
+    the store is reopened.
+
+    Args:
+        path (str): Folder of the store. If None, a temporary folder is created and removed automatically.
+        shard_size (int): Maximum size of a shard in bytes. A sample is never split across two shards.
+
+    Attributes:
+        path (Path): Folder of the store.
+        index (list): Skeleton of each stored sample.
+        is_temporary (bool): True if the folder is removed with the store.
+    """
+
+    INDEX_FILENAME = "index.pkl"
+    ALIGNMENT = 64
+
+    def __init__(self, path: str = None, shard_size: int = 2 * 1024 ** 3) -> None:
+        self.is_temporary = path is None
+        self.path = Path(create_temp_directory() if path is None else path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self.index = []
+        self._shard = 0
+        self._shard_offset = 0
+        self._maps: Dict[int, np.memmap] = {}
+
+        path_index = self.path / self.INDEX_FILENAME
+        if not self.is_temporary and path_index.is_file():
+            with path_index.open(mode="rb") as f:
+                self.index, self._shard, self._shard_offset = pickle.load(f)
+            logger.debug(f"Reusing {len(self.index)} cached samples from {self.path}.")
+        if not self.is_temporary:
+            self._truncate()
+
+        if self.is_temporary:
+            self._finalizer = weakref.finalize(self, shutil.rmtree, str(self.path), ignore_errors=True)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, idx: int) -> Any:
+        """Return the sample idx, with arrays as read-only memory-mapped views."""
+        return self._load(self.index[idx])
+
+    def __getstate__(self) -> dict:
+        # Memory maps and the finalizer are specific to a process: workers only need the index
+        state = self.__dict__.copy()
+        state['_maps'] = {}
+        state.pop('_finalizer', None)
+        return state
+
+    def append(self, sample: Any) -> int:
+        """Write a sample in the store.
+
+        Arrays shared by several parts of the sample (e.g. the input stack of seg_pair and roi_pair) are written once.
+
+        Args:
+            sample: Sample to store, made of (nested) lists, tuples and dicts of numpy arrays and other picklable objects.
+
+        Returns:
+            int: Index of the sample in the store.
+        """
+        shard_offset = self._shard_offset
+        arrays = []
+        skeleton = self._dump(sample, arrays, {})
+        if shard_offset and self._shard_offset > self.shard_size:
+            # Start a new shard rather than splitting the sample
+            self._shard += 1
+            self._shard_offset = 0
+            arrays = []
+            skeleton = self._dump(sample, arrays, {})
+        # The shard is growing: a memory map opened before this write would not see the new data
+        self._maps.pop(self._shard, None)
+
+        with self._get_shard_path(self._shard).open(mode="ab") as f:
+            for ref, arr in arrays:
+                # Pad up to the aligned offset of the array
+                f.write(b"\0" * (ref.offset - f.tell()))
+                arr.tofile(f)
+        self.index.append(skeleton)
+        return len(self.index) - 1
+
+    def flush(self) -> None:
+        """Save the index and the metadata sidecar, to reopen the store later."""
+        with (self.path / self.INDEX_FILENAME).open(mode="wb") as f:
+            pickle.dump((self.index, self._shard, self._shard_offset), f)
+
+    def cleanup(self) -> None:
+        """Delete the store from the disk."""
+        self._maps.clear()
+        self.index = []
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _truncate(self) -> None:
+        """Remove the data written after the indexed samples, so that new arrays are written at their offset."""
+        for path_shard in self.path.glob("shard_*.bin"):
+            shard = int(path_shard.stem.split("_")[-1])
+            if shard > self._shard:
+                path_shard.unlink()
+            elif shard == self._shard and path_shard.stat().st_size > self._shard_offset:
+                logger.debug(f"Discarding the samples of {path_shard} which were not flushed.")
+                os.truncate(path_shard, self._shard_offset)
+
+    def _get_shard_path(self, shard: int) -> Path:
+        return self.path / f"shard_{shard}.bin"
+
+    def _aligned(self, nbytes: int) -> int:
+        return -(-nbytes // self.ALIGNMENT) * self.ALIGNMENT
+
+    def _dump(self, obj: Any, arrays: list, memo: dict) -> Any:
+        """Replace the arrays of obj by their ArrayRef and list the (ArrayRef, array) to write in arrays."""
+        if isinstance(obj, np.ndarray) and obj.dtype != object:
+            if id(obj) not in memo:
+                ref = ArrayRef(self._shard, self._shard_offset, obj.shape, obj.dtype.str)
+                arrays.append((ref, np.ascontiguousarray(obj)))
+                self._shard_offset += self._aligned(obj.nbytes)
+                memo[id(obj)] = ref
+            return memo[id(obj)]
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(self._dump(o, arrays, memo) for o in obj)
+        if isinstance(obj, dict):
+            return {key: self._dump(value, arrays, memo) for key, value in obj.items()}
+        return obj
+
+    def _load(self, obj: Any) -> Any:
+        """Replace the ArrayRef of obj by the corresponding memory-mapped arrays."""
+        if isinstance(obj, ArrayRef):
+            dtype = np.dtype(obj.dtype)
+            nbytes = int(np.prod(obj.shape)) * dtype.itemsize
+            if not nbytes:
+                return np.empty(obj.shape, dtype=dtype)
+            if obj.shard not in self._maps:
+                self._maps[obj.shard] = np.memmap(self._get_shard_path(obj.shard), dtype=np.uint8, mode="r")
+            return self._maps[obj.shard][obj.offset:obj.offset + nbytes].view(dtype).reshape(obj.shape)
+        if isinstance(obj, (list, tuple)):
+            return type(obj)(self._load(o) for o in obj)
+        if isinstance(obj, dict):
+            return {key: self._load(value) for key, value in obj.items()}
+        return obj
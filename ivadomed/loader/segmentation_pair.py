@@ -10,8 +10,9 @@ from ivadomed import postprocessing as imed_postpro
 from ivadomed.keywords import MetadataKW
 import typing
 if typing.TYPE_CHECKING:
-    from typing import List
+    from typing import List, Iterable, Iterator, Tuple
     import nibabel.nifti1
+    from ivadomed.loader.slice_filter import SliceFilter
 
 
 class SegmentationPair(object):
@@ -39,6 +40,8 @@ class SegmentationPair(object):
         prepro_transforms (dict): Transforms to be applied before training.
         input_handle (list): List of input NifTI data as 'nibabel.nifti1.Nifti1Image' object
         gt_handle (list): List of gt (ground truth) NifTI data as 'nibabel.nifti1.Nifti1Image' object
+        oriented_data (tuple): Cached (input, ground truth) arrays oriented in height, width, depth. Filled by the first
+            call to get_pair_data when cache is True, None otherwise.
     """
 
     def __init__(self, input_filenames: List[str], gt_filenames: List[str], metadata: list = None, slice_axis: int = 2,
@@ -51,6 +54,7 @@ class SegmentationPair(object):
         self.slice_axis = slice_axis
         self.soft_gt = soft_gt
         self.prepro_transforms = prepro_transforms
+        self.oriented_data = None
         # list of the images
         self.input_handle = []
 
@@ -131,7 +135,14 @@ class SegmentationPair(object):
         return input_shape[0], gt_shape[0] if len(gt_shape) else None
 
     def get_pair_data(self) -> (list, list):
-        """Return the tuple (input, ground truth) with the data content in numpy array."""
+        """Return the tuple (input, ground truth) with the data content in numpy array.
+
+        If cache is True, the volumes are decoded and oriented only once: the resulting arrays are kept in
+        `oriented_data` and returned as is by the following calls.
+        """
+        if self.oriented_data is not None:
+            return self.oriented_data
+
         cache_mode = 'fill' if self.cache else 'unchanged'
 
         input_data = []
@@ -158,6 +169,9 @@ class SegmentationPair(object):
                     np.zeros(imed_loader_utils.orient_shapes_hwd(self.input_handle[0].shape, self.slice_axis),
                              dtype=np.float32).astype(np.uint8))
 
+        if self.cache:
+            self.oriented_data = (input_data, gt_data)
+
         return input_data, gt_data
 
     def get_pair_metadata(self, slice_index: int = 0, coord: tuple | list = None) -> dict:
@@ -232,9 +246,53 @@ class SegmentationPair(object):
             gt_type (str): Choice between segmentation or classification, returns mask (array) or label (int) resp.
                 for the ground truth.
         """
+        input_dataobj, gt_dataobj = self.get_pair_data()
+        return self._extract_pair_slice(input_dataobj, gt_dataobj, slice_index, gt_type)
 
-        metadata = self.get_pair_metadata(slice_index)
+    def iter_pair_slices(self, gt_type: str = "segmentation", slice_filter_fn: SliceFilter = None,
+                         slice_indices: Iterable[int] = None) -> Iterator[Tuple[int, dict]]:
+        """Iterate over all the slices of (input, ground truth) along the depth dimension.
+
+        The volumes are decoded and oriented once for the whole iteration, each slice being a view of these arrays.
+        Loading a volume is therefore linear in its size, whatever the number of slices.
+
+        Args:
+            gt_type (str): Choice between segmentation or classification, returns mask (array) or label (int) resp.
+                for the ground truth.
+            slice_filter_fn (SliceFilter): If set, only the slices kept by the filter are returned. The filter is
+                evaluated on the whole volume at once, see `SliceFilter.filter_volume`.
+            slice_indices (Iterable): If set, only these slices are returned and slice_filter_fn is ignored, e.g. to
+                reload slices which were already filtered.
+
+        Yields:
+            int, dict: Slice index and the corresponding slice pair, see get_pair_slice.
+        """
         input_dataobj, gt_dataobj = self.get_pair_data()
+        if slice_indices is not None:
+            slice_indices = [int(slice_index) for slice_index in slice_indices]
+        elif slice_filter_fn:
+            slice_indices = np.flatnonzero(slice_filter_fn.filter_volume(input_dataobj, gt_dataobj)).tolist()
+        else:
+            input_shape, _ = self.get_pair_shapes()
+            slice_indices = range(input_shape[-1])
+        for slice_index in slice_indices:
+            yield slice_index, self._extract_pair_slice(input_dataobj, gt_dataobj, slice_index, gt_type)
+
+    def _extract_pair_slice(self, input_dataobj: list, gt_dataobj: list, slice_index: int,
+                            gt_type: str = "segmentation") -> dict:
+        """Extract a slice from already decoded (input, ground truth) arrays and attach its metadata.
+
+        Args:
+            input_dataobj (list): Input arrays oriented in height, width, depth, see get_pair_data.
+            gt_dataobj (list): Ground truth arrays oriented in height, width, depth, see get_pair_data.
+            slice_index (int): Slice number.
+            gt_type (str): Choice between segmentation or classification, returns mask (array) or label (int) resp.
+                for the ground truth.
+
+        Returns:
+            dict: Input and ground truth slices with their metadata.
+        """
+        metadata = self.get_pair_metadata(slice_index)
 
         if self.slice_axis not in [0, 1, 2]:
             raise RuntimeError("Invalid axis, must be between 0 and 2.")
@@ -277,12 +335,15 @@ class SegmentationPair(object):
         """Read file according to file extension and returns 'nibabel.nifti1.Nifti1Image' object.
 
         Args:
-            filename (str): Subject filename.
+            filename (str): Subject filename. An image already loaded ('nibabel.nifti1.Nifti1Image' object) is returned
+                as is.
             is_gt (bool): Indicate if the file is a ground-truth.
 
         Returns:
             'nibabel.nifti1.Nifti1Image' object
         """
+        if isinstance(filename, nib.Nifti1Image):
+            return filename
         extension = imed_loader_utils.get_file_extension(filename)
         # TODO: remove "ome" from condition when implementing OMETIFF support (#739)
         if (not extension) or ("ome" in extension):
@@ -14,6 +14,10 @@ class SliceFilter(object):
             discarded.
         filter_empty_input (bool): If True, slices where all voxel intensities are zeros are discarded.
         filter_classification (bool): If True, slices where all images fail a custom classifier filter are discarded.
+        classifier_path (str): Path to the saved PyTorch classifier used if filter_classification is True.
+        classifier_batch_size (int): Number of slices given at once to the classifier.
+        classifier_num_threads (int): Number of threads used by the classifier when running on CPU. If None, the
+            PyTorch default is used.
         device (torch.device): Indicates the CPU or GPU ID.
         cuda_available (bool): If True, CUDA is available.
 
@@ -24,6 +28,9 @@ class SliceFilter(object):
         filter_empty_input (bool): If True, slices where all voxel intensities are zeros are discarded. Default: True.
         filter_classification (bool): If True, slices where all images fail a custom classifier filter are discarded.
             Default: False.
+        classifier_path (str): Path to the saved PyTorch classifier used if filter_classification is True.
+        classifier_batch_size (int): Number of slices given at once to the classifier. Default: 64.
+        classifier_num_threads (int): Number of threads used by the classifier when running on CPU. Default: None.
         device (torch.device): Indicates the CPU or GPU ID.
         cuda_available (bool): If True, CUDA is available.
 
@@ -34,12 +41,17 @@ class SliceFilter(object):
                  filter_empty_input: bool = True,
                  filter_classification: bool = False,
                  classifier_path: any = None,
+                 classifier_batch_size: int = 64,
+                 classifier_num_threads: int = None,
                  device: torch.device = None,
                  cuda_available: bool = None):
         self.filter_empty_mask = filter_empty_mask
         self.filter_absent_class = filter_absent_class
         self.filter_empty_input = filter_empty_input
         self.filter_classification = filter_classification
+        self.classifier_path = classifier_path
+        self.classifier_batch_size = classifier_batch_size
+        self.classifier_num_threads = classifier_num_threads
         self.device = device
         self.cuda_available = cuda_available
 
@@ -48,6 +60,8 @@ class SliceFilter(object):
                 self.classifier = torch.load(classifier_path, map_location=device)
             else:
                 self.classifier = torch.load(classifier_path, map_location='cpu')
+            # Predictions must not depend on the other slices of the batch (e.g. batch normalization statistics)
+            self.classifier.eval()
 
     def __call__(self, sample: dict) -> bool:
         """Extract input_data and gt_data lists from sample dict and discard them if they don't match certain
@@ -65,14 +79,76 @@ class SliceFilter(object):
             if not np.all([np.any(mask) for mask in gt_data]):
                 return False
         if self.filter_empty_input:
-            # Discard set of images if one of them is empty or filled with constant value (i.e. std == 0)
-            if np.any([img.std() == 0 for img in input_data]):
+            # Discard set of images if one of them is empty or filled with constant value (i.e. max == min, exact
+            # unlike std == 0 which is subject to rounding errors)
+            if np.any([img.max() == img.min() for img in input_data]):
                 return False
         if self.filter_classification:
-            if not np.all([int(
-                    self.classifier(
-                        imed_utils.cuda(torch.from_numpy(img.copy()).unsqueeze(0).unsqueeze(0),
-                                        self.cuda_available))) for img in input_data]):
+            if not np.all(self._classify(np.stack(input_data))):
                 return False
 
         return True
+
+    def filter_volume(self, input_data: list, gt_data: list = None) -> np.ndarray:
+        """Evaluate the filter on all the slices of a volume at once.
+
+        Equivalent to calling the filter on each slice, with one reduction over the whole volume per criterion instead
+        of one call per slice. A slice is considered empty or filled with constant value if its minimum and maximum
+        intensities are equal. The classifier, if any, is only run on the slices kept by the other criteria, by
+        batches of classifier_batch_size slices.
+
+        Args:
+            input_data (list): Input volumes, one per contrast, with the slices along the last axis (see
+                `SegmentationPair.get_pair_data`).
+            gt_data (list): Ground truth volumes, one per class. Each class may be a list of volumes (one per rater).
+
+        Returns:
+            ndarray: Boolean array with one value per slice, True for the slices to keep.
+        """
+        input_data = [np.asarray(img) for img in input_data]
+        axes = tuple(range(input_data[0].ndim - 1))
+        keep = np.ones(input_data[0].shape[-1], dtype=bool)
+
+        if self.filter_empty_mask or self.filter_absent_class:
+            # Slices with at least one non-zero voxel, for each class (over all raters)
+            masks = [np.any([np.any(rater, axis=axes) for rater in mask], axis=0) if isinstance(mask, list)
+                     else np.any(mask, axis=axes) for mask in (gt_data or [])]
+            if self.filter_empty_mask:
+                keep &= np.any(masks, axis=0) if masks else False
+            if self.filter_absent_class:
+                keep &= np.all(masks, axis=0)
+        if self.filter_empty_input:
+            for img in input_data:
+                keep &= img.max(axis=axes) != img.min(axis=axes)
+        if self.filter_classification:
+            candidates = np.flatnonzero(keep)
+            for img in input_data:
+                # Slices of the candidates, along the first axis
+                keep[candidates] &= self._classify(np.moveaxis(img[..., candidates], -1, 0))
+
+        return keep
+
+    def _classify(self, images: np.ndarray) -> np.ndarray:
+        """Run the classifier on a stack of 2D images, by batches of classifier_batch_size images.
+
+        Args:
+            images (ndarray): Images, of shape (n_images, height, width).
+
+        Returns:
+            ndarray: Boolean array of length n_images, True if the classifier is positive for the image.
+        """
+        num_threads = torch.get_num_threads()
+        if self.classifier_num_threads and not self.cuda_available:
+            torch.set_num_threads(self.classifier_num_threads)
+        try:
+            preds = []
+            with torch.no_grad():
+                for i in range(0, len(images), self.classifier_batch_size):
+                    batch = np.ascontiguousarray(images[i:i + self.classifier_batch_size], dtype=np.float32)
+                    pred = self.classifier(imed_utils.cuda(torch.from_numpy(batch).unsqueeze(1),
+                                                           self.cuda_available))
+                    # One prediction per image, truncated to an int as for a single image
+                    preds.append(pred.reshape(len(batch), -1)[:, 0].int().cpu().numpy())
+        finally:
+            torch.set_num_threads(num_threads)
+        return np.concatenate(preds) != 0 if preds else np.zeros(0, dtype=bool)
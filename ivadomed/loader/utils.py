@@ -1,10 +1,9 @@
 from __future__ import annotations
+import collections
 import collections.abc
 import re
-import sys
 import os
 import joblib
-import gc
 from pathlib import Path
 from tempfile import mkdtemp
 
@@ -15,13 +14,14 @@ from loguru import logger
 from sklearn.model_selection import train_test_split
 from torch._six import string_classes
 from ivadomed import utils as imed_utils
-from ivadomed.keywords import SplitDatasetKW, LoaderParamsKW, ROIParamsKW, ContrastParamsKW
+from ivadomed.keywords import SplitDatasetKW, LoaderParamsKW, ROIParamsKW, ContrastParamsKW, TrainingParamsKW, \
+    SegmentationDatasetKW
 import nibabel as nib
 import random
 import typing
 if typing.TYPE_CHECKING:
     from typing import Union
-    from typing import Optional
+    from typing import Optional, Callable
 
 __numpy_type_map = {
     'float64': torch.DoubleTensor,
@@ -280,6 +280,50 @@ def imed_collate(batch: dict) -> dict | list | str | torch.Tensor:
     return batch
 
 
+def get_dataloader_params(training_params: dict) -> dict:
+    """Get the DataLoader parameters related to parallel data loading from the training parameters.
+
+    Args:
+        training_params (dict): Training parameters, see :doc:`configuration_file`. Missing keys (e.g. configuration
+            of a model trained with a previous version) are set to their default value: data is loaded in the main
+            process.
+
+    Returns:
+        dict: Keyword arguments for torch.utils.data.DataLoader.
+    """
+    num_workers = training_params.get(TrainingParamsKW.NUM_WORKERS, 0)
+    params = {'num_workers': num_workers}
+
+    seed = training_params.get(TrainingParamsKW.WORKER_SEED)
+    if seed is not None:
+        # Makes the shuffling and the base seed of the workers reproducible
+        generator = torch.Generator()
+        generator.manual_seed(seed)
+        params['generator'] = generator
+
+    if num_workers > 0:
+        params.update({
+            'prefetch_factor': training_params.get(TrainingParamsKW.PREFETCH_FACTOR, 2),
+            'persistent_workers': training_params.get(TrainingParamsKW.PERSISTENT_WORKERS, False),
+            'worker_init_fn': seed_worker
+        })
+    return params
+
+
+def seed_worker(worker_id: int) -> None:
+    """Seed the numpy and random generators of a DataLoader worker.
+
+    PyTorch seeds each worker with a different seed, but not numpy and random, which are used by the data augmentation:
+    without this, forked workers would share the same random state and produce identical augmentations.
+
+    Args:
+        worker_id (int): Worker index.
+    """
+    worker_seed = torch.initial_seed() % 2 ** 32
+    np.random.seed(worker_seed)
+    random.seed(worker_seed)
+
+
 def filter_roi(roi_data: np.ndarray, nb_nonzero_thr: int) -> bool:
     """Filter slices from dataset using ROI data.
 
@@ -301,8 +345,10 @@ def filter_roi(roi_data: np.ndarray, nb_nonzero_thr: int) -> bool:
 def orient_img_hwd(data: np.ndarray, slice_axis: int) -> np.ndarray:
     """Orient a given RAS image to height, width, depth according to slice axis.
 
+    Inverse of orient_img_ras.
+
     Args:
-        data (ndarray): RAS oriented data.
+        data (ndarray): RAS oriented data, optionally with the channels as first dimension.
         slice_axis (int): Indicates the axis used for the 2D slice extraction:
             Sagittal: 0, Coronal: 1, Axial: 2.
 
@@ -310,9 +356,9 @@ def orient_img_hwd(data: np.ndarray, slice_axis: int) -> np.ndarray:
         ndarray: Array oriented with the following dimensions: (height, width, depth).
     """
     if slice_axis == 0:
-        return data.transpose(2, 1, 0)
+        return data.transpose(2, 1, 0) if len(data.shape) == 3 else data.transpose(0, 3, 2, 1)
     elif slice_axis == 1:
-        return data.transpose(2, 0, 1)
+        return data.transpose(2, 0, 1) if len(data.shape) == 3 else data.transpose(0, 3, 1, 2)
     elif slice_axis == 2:
         return data
 
@@ -379,6 +425,93 @@ def update_metadata(metadata_src_lst: list, metadata_dest_lst: list) -> list:
     return metadata_dest_lst
 
 
+def get_sample_view(pair: dict) -> dict:
+    """Return a per-sample view of a cached pair (input, ground truth and their metadata).
+
+    Pixel data are not copied: the returned arrays are read-only views sharing memory with the cached ones, so the cost
+    of this function does not depend on the image size. Metadata are copied, so that the coordinates, the picked rater
+    and the transform parameters of a sample do not leak into the cached pair or into the following samples.
+
+    Args:
+        pair (dict): Cached pair, as returned by `SegmentationPair.get_pair_slice` or after preprocessing.
+
+    Returns:
+        dict: Per-sample pair with the same keys as `pair`.
+    """
+    def _view(data):
+        if data is None:
+            return None
+        if isinstance(data, list):
+            return [_view(d) for d in data]
+        view = np.asarray(data).view()
+        view.flags.writeable = False
+        return view
+
+    def _copy_metadata(metadata):
+        if metadata is None:
+            return None
+        if isinstance(metadata, list):
+            return [_copy_metadata(m) for m in metadata]
+        return metadata.copy()
+
+    return {key: _copy_metadata(value) if key.endswith('metadata') else _view(value)
+            for key, value in pair.items()}
+
+
+def get_window_starts(shape: tuple, length: list, stride: list) -> np.ndarray:
+    """Return the lower coordinates of the sliding windows covering an image.
+
+    Windows start every ``stride`` voxels along each dimension, and the last window along each dimension is shifted to
+    end at the image border: any stride smaller or equal to the window length covers the whole image, without
+    requiring the image size to be a multiple of the stride.
+
+    Args:
+        shape (tuple): Image shape.
+        length (list): Window size along each dimension, smaller or equal to the image size.
+        stride (list): Step between windows along each dimension.
+
+    Returns:
+        np.ndarray: Lower coordinates of the windows, shape (n_windows, len(shape)).
+    """
+    starts = [np.minimum(np.arange(0, size - window_length + window_stride, window_stride), size - window_length)
+              for window_length, window_stride, size in zip(length, stride, shape)]
+    return np.stack(np.meshgrid(*starts, indexing='ij'), axis=-1).reshape(-1, len(shape))
+
+
+def get_patch_index(starts: np.ndarray, length: list, handler_index: int) -> np.ndarray:
+    """Build the index of the patches (or subvolumes) of a handler.
+
+    The index is a structured array with one record per patch, holding the patch boundaries along each dimension
+    (``x_min``, ``x_max``, ``y_min``, ``y_max`` and for 3D ``z_min``, ``z_max``) and the ``handler_index``. It is much
+    more compact than a list of dicts when an image has millions of patches.
+
+    Args:
+        starts (ndarray): Lower coordinates of the patches, of shape (n_patches, n_dims) with n_dims 2 or 3.
+        length (list): Size of the patches along each dimension.
+        handler_index (int): Index of the handler the patches belong to.
+
+    Returns:
+        ndarray: Structured array of length n_patches.
+    """
+    starts = np.asarray(starts, dtype=np.int32).reshape(-1, len(length))
+    keys = [(SegmentationDatasetKW.X_MIN, SegmentationDatasetKW.X_MAX),
+            (SegmentationDatasetKW.Y_MIN, SegmentationDatasetKW.Y_MAX),
+            (SegmentationDatasetKW.Z_MIN, SegmentationDatasetKW.Z_MAX)][:len(length)]
+    dtype = [(key, np.int32) for key_pair in keys for key in key_pair] + \
+            [(SegmentationDatasetKW.HANDLER_INDEX, np.int32)]
+    index = np.empty(len(starts), dtype=dtype)
+    for dim, (key_min, key_max) in enumerate(keys):
+        index[key_min] = starts[:, dim]
+        index[key_max] = starts[:, dim] + length[dim]
+    index[SegmentationDatasetKW.HANDLER_INDEX] = handler_index
+    return index
+
+
+def get_patch_coord(patch: np.void) -> dict:
+    """Return the record of a patch index built by `get_patch_index` as a dict of Python ints."""
+    return {key: int(patch[key]) for key in patch.dtype.names}
+
+
 def reorient_image(arr: np.ndarray, slice_axis: int, nib_ref: nib, nib_ref_canonical: nib) -> nd.ndarray:
     """Reorient an image to match a reference image orientation.
 
@@ -404,6 +537,30 @@ def reorient_image(arr: np.ndarray, slice_axis: int, nib_ref: nib, nib_ref_canon
     return nib.orientations.apply_orientation(arr_ras, trans_orient)
 
 
+def get_hwd_view(arr: np.ndarray, slice_axis: int, affine_ref: np.ndarray) -> np.ndarray:
+    """Return a view of an array in the orientation of a reference image, in the orientation of the predictions.
+
+    Inverse of reorient_image, through axis permutations and flips only: writing a prediction with dimensions
+    (height, width, depth) in the view writes it in the orientation of the reference image in ``arr``, without copy.
+
+    Args:
+        arr (ndarray): Array in the orientation of the reference image, with dimensions (X, Y, Z) or (X, Y, Z, channel).
+        slice_axis (int): Indicates the axis used for the 2D slice extraction:
+            Sagittal: 0, Coronal: 1, Axial: 2.
+        affine_ref (ndarray): Affine of the reference image.
+
+    Returns:
+        ndarray: View of ``arr`` with dimensions (height, width, depth) or (channel, height, width, depth).
+    """
+    ref_orientation = nib.orientations.io_orientation(affine_ref)
+    ras_orientation = nib.orientations.axcodes2ornt(('R', 'A', 'S'))
+    arr_ras = nib.orientations.apply_orientation(arr, nib.orientations.ornt_transform(ref_orientation,
+                                                                                      ras_orientation))
+    if len(arr.shape) == 4:
+        arr_ras = np.moveaxis(arr_ras, -1, 0)
+    return orient_img_hwd(arr_ras, slice_axis)
+
+
 def get_file_extension(filename: str) -> Optional[str]:
     """ Get file extension if it is supported
     Args:
@@ -479,49 +636,62 @@ def dropout_input(seg_pair: dict) -> dict:
     return seg_pair
 
 
-def create_temp_directory() -> str:
-    """Creates a temporary directory and returns its path.
-    This temporary directory is only deleted when explicitly requested.
+class LRUCache(object):
+    """Bounded in-memory cache which discards the least recently used entries.
 
-    Returns:
-        str: Path of the temporary directory.
-    """
-    import datetime
-    time_stamp = datetime.datetime.now().isoformat().replace(":", "")
-    temp_folder_location = mkdtemp(prefix="ivadomed_", suffix=f"_{time_stamp}")
-    return temp_folder_location
+    Used by the lazy datasets to keep the decoded and preprocessed data of the last accessed subjects.
 
-def get_obj_size(obj) -> int:
+    Args:
+        max_size (int): Maximum number of entries.
+
+    Attributes:
+        max_size (int): Maximum number of entries.
     """
-    Returns the size of an object in bytes. Used to gauge whether storing object in memory vs write to disk.
 
-    Source: https://stackoverflow.com/a/53705610
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
 
-    Args:
-        obj:
+    def __len__(self) -> int:
+        return len(self._entries)
 
-    Returns:
+    def __contains__(self, key) -> bool:
+        return key in self._entries
 
-    """
-    marked = {id(obj)}
-    obj_q = [obj]
-    object_size = 0
+    def get(self, key, load_fn: Callable):
+        """Return the entry of key, calling load_fn(key) to create it if it is not in the cache."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        value = load_fn(key)
+        self._entries[key] = value
+        while len(self._entries) > max(self.max_size, 1):
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
 
-    while obj_q:
-        object_size += sum(map(sys.getsizeof, obj_q))
 
-        # Lookup all the object referred to by the object in obj_q.
-        # See: https://docs.python.org/3.7/library/gc.html#gc.get_referents
-        all_refr = ((id(o), o) for o in gc.get_referents(*obj_q))
+class LazyHandle(typing.NamedTuple):
+    """Handle of a sample which is not cached: its subject is decoded and preprocessed on access.
+
+    Attributes:
+        subject_index (int): Index of the subject in the filename_pairs of the dataset.
+        item_index (int): Index of the sample (e.g. slice) within the subject.
+    """
+    subject_index: int
+    item_index: int
 
-        # Filter object that are already marked.
-        # Using dict notation will prevent repeated objects.
-        new_refr = {o_id: o for o_id, o in all_refr if o_id not in marked and not isinstance(o, type)}
 
-        # The new obj_q will be the ones that were not marked,
-        # and we will update marked with their ids so we will
-        # not traverse them again.
-        obj_q = new_refr.values()
-        marked.update(new_refr.keys())
+def create_temp_directory() -> str:
+    """Creates a temporary directory and returns its path.
+    This temporary directory is only deleted when explicitly requested.
 
-    return object_size
+    Returns:
+        str: Path of the temporary directory.
+    """
+    import datetime
+    time_stamp = datetime.datetime.now().isoformat().replace(":", "")
+    temp_folder_location = mkdtemp(prefix="ivadomed_", suffix=f"_{time_stamp}")
+    return temp_folder_location
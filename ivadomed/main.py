@@ -21,7 +21,7 @@ from ivadomed import inference as imed_inference
 from ivadomed.loader import utils as imed_loader_utils, loader as imed_loader, film as imed_film
 from ivadomed.keywords import ConfigKW, ModelParamsKW, LoaderParamsKW, ContrastParamsKW, BalanceSamplesKW, \
     TrainingParamsKW, ObjectDetectionParamsKW, UncertaintyKW, PostprocessingKW, BinarizeProdictionKW, MetricsKW, \
-    MetadataKW, OptionKW, SplitDatasetKW
+    MetadataKW, OptionKW, SplitDatasetKW, SegmentPipelineKW
 from loguru import logger
 from pathlib import Path
 
@@ -158,6 +158,10 @@ def set_loader_params(context, is_train):
             context[ConfigKW.TRAINING_PARAMETERS][TrainingParamsKW.BALANCE_SAMPLES][BalanceSamplesKW.TYPE] != 'gt':
         loader_params.update({LoaderParamsKW.METADATA_TYPE:
                                   context[ConfigKW.TRAINING_PARAMETERS][TrainingParamsKW.BALANCE_SAMPLES][BalanceSamplesKW.TYPE]})
+
+    # DataLoader workers, accounted in the memory budget of the datasets
+    loader_params.update({TrainingParamsKW.NUM_WORKERS:
+                              context[ConfigKW.TRAINING_PARAMETERS].get(TrainingParamsKW.NUM_WORKERS, 0)})
     return loader_params
 
 
@@ -252,10 +256,27 @@ def run_segment_command(context, model_params, no_patch, overlap_2d):
     model_config[ConfigKW.POSTPROCESSING] = context.get(ConfigKW.POSTPROCESSING)
     with path_model_config.open(mode='w') as fp:
         json.dump(model_config, fp, indent=4)
+
+    # Add 'no_patch' and 'overlap-2d' argument to options
+    segmenter_options = {}
+    if no_patch:
+        segmenter_options[OptionKW.NO_PATCH] = no_patch
+    if overlap_2d:
+        segmenter_options[OptionKW.OVERLAP_2D] = overlap_2d
+    if context.get(ConfigKW.ONNX_RUNTIME):
+        segmenter_options[OptionKW.ONNX_RUNTIME] = context[ConfigKW.ONNX_RUNTIME]
+    if context.get(ConfigKW.TEST_TIME_AUGMENTATION):
+        segmenter_options[OptionKW.TEST_TIME_AUGMENTATION] = context[ConfigKW.TEST_TIME_AUGMENTATION]
+
+    # The model is loaded once for all the subjects
+    segmenter = imed_inference.Segmenter(str(path_model), gpu_id=context[ConfigKW.GPU_IDS][0],
+                                         options=segmenter_options)
     options = {}
 
     # Initialize a list of already seen subject ids for multichannel
     seen_subj_ids = []
+    # Subjects to segment, with their images and options
+    subjects, images_list, options_list = [], [], []
 
     for subject in bids_subjects:
         if context.get(ConfigKW.LOADER_PARAMETERS).get(LoaderParamsKW.MULTICHANNEL):
@@ -285,13 +306,13 @@ def run_segment_command(context, model_params, no_patch, overlap_2d):
         else:
             fname_img = bids_df.df[bids_df.df['filename'] == subject]['path'].to_list()
 
-        # Add film metadata to options for segment_volume
+        # Add film metadata to options of the subject
         if ModelParamsKW.FILM_LAYERS in model_params and any(model_params[ModelParamsKW.FILM_LAYERS]) \
                 and model_params[ModelParamsKW.METADATA]:
             metadata = bids_df.df[bids_df.df['filename'] == subject][model_params[ModelParamsKW.METADATA]].values[0]
             options[OptionKW.METADATA] = metadata
 
-        # Add microscopy pixel size and pixel size units metadata to options for segment_volume
+        # Add microscopy pixel size and pixel size units metadata to options of the subject
         if MetadataKW.PIXEL_SIZE in bids_df.df.columns:
             options[OptionKW.PIXEL_SIZE] = \
                 bids_df.df.loc[bids_df.df['filename'] == subject][MetadataKW.PIXEL_SIZE].values[0]
@@ -299,35 +320,43 @@ def run_segment_command(context, model_params, no_patch, overlap_2d):
             options[OptionKW.PIXEL_SIZE_UNITS] = \
                 bids_df.df.loc[bids_df.df['filename'] == subject][MetadataKW.PIXEL_SIZE_UNITS].values[0]
 
-        # Add 'no_patch' and 'overlap-2d' argument to options
-        if no_patch:
-            options[OptionKW.NO_PATCH] = no_patch
-        if overlap_2d:
-            options[OptionKW.OVERLAP_2D] = overlap_2d
-
         if fname_img:
-            pred_list, target_list = imed_inference.segment_volume(str(path_model),
-                                                                   fname_images=fname_img,
-                                                                   gpu_id=context[ConfigKW.GPU_IDS][0],
-                                                                   options=options)
-            pred_path = Path(context[ConfigKW.PATH_OUTPUT], "pred_masks")
-            if not pred_path.exists():
-                pred_path.mkdir(parents=True)
-
-            # Reformat target list to include class index and be compatible with multiple raters
-            target_list = ["_class-%d" % i for i in range(len(target_list))]
-
-            for pred, target in zip(pred_list, target_list):
-                filename = subject.split('.')[0] + target + "_pred" + ".nii.gz"
-                nib.save(pred, Path(pred_path, filename))
-
-            # For Microscopy PNG/TIF files (TODO: implement OMETIFF behavior)
-            extension = imed_loader_utils.get_file_extension(subject)
-            if "nii" not in extension:
-                imed_inference.pred_to_png(pred_list,
-                                           target_list,
-                                           str(Path(pred_path, subject)).replace(extension, ''),
-                                           suffix="_pred.png")
+            subjects.append(subject)
+            images_list.append(fname_img)
+            options_list.append(dict(options))
+
+    pred_path = Path(context[ConfigKW.PATH_OUTPUT], "pred_masks")
+    if subjects and not pred_path.exists():
+        pred_path.mkdir(parents=True)
+
+    def save_predictions(subject_index, pred_list, target_list):
+        subject = subjects[subject_index]
+
+        # Reformat target list to include class index and be compatible with multiple raters
+        target_list = ["_class-%d" % i for i in range(len(target_list))]
+
+        for pred, target in zip(pred_list, target_list):
+            filename = subject.split('.')[0] + target + "_pred" + ".nii.gz"
+            nib.save(pred, Path(pred_path, filename))
+
+        # For Microscopy PNG/TIF files (TODO: implement OMETIFF behavior)
+        extension = imed_loader_utils.get_file_extension(subject)
+        if "nii" not in extension:
+            imed_inference.pred_to_png(pred_list,
+                                       target_list,
+                                       str(Path(pred_path, subject)).replace(extension, ''),
+                                       suffix="_pred.png")
+
+    # Batches are filled with the slices of several subjects. The next subjects are decoded while the current ones
+    # are segmented, and the predictions are reconstructed and saved by a pool of threads as soon as each subject is
+    # completed.
+    pipeline_params = context.get(ConfigKW.SEGMENT_PIPELINE, {})
+    for _ in segmenter.segment_subjects(images_list, options_list,
+                                        subjects_per_dataset=pipeline_params.get(
+                                            SegmentPipelineKW.SUBJECTS_PER_DATASET, 4),
+                                        num_workers=pipeline_params.get(SegmentPipelineKW.NUM_WORKERS, 2),
+                                        write_fn=save_predictions):
+        pass
 
 
 def run_command(context, n_gif=0, thr_increment=None, resume_training=False, no_patch=False, overlap_2d=None):
@@ -418,6 +447,7 @@ def run_command(context, n_gif=0, thr_increment=None, resume_training=False, no_
     undo_transforms = imed_transforms.UndoCompose(imed_transforms.Compose(transformation_dict, requires_undo=True))
     testing_params = copy.deepcopy(context[ConfigKW.TRAINING_PARAMETERS])
     testing_params.update({ConfigKW.UNCERTAINTY: context[ConfigKW.UNCERTAINTY]})
+    testing_params.update({ConfigKW.TEST_TIME_AUGMENTATION: context.get(ConfigKW.TEST_TIME_AUGMENTATION)})
     testing_params.update({LoaderParamsKW.TARGET_SUFFIX: loader_params[LoaderParamsKW.TARGET_SUFFIX],
                            ConfigKW.UNDO_TRANSFORMS: undo_transforms,
                            LoaderParamsKW.SLICE_AXIS: loader_params[LoaderParamsKW.SLICE_AXIS]})
@@ -431,6 +461,10 @@ def run_command(context, n_gif=0, thr_increment=None, resume_training=False, no_
     # Check if multiple raters
     check_multiple_raters(command == "train", loader_params)
 
+    # The memory budget of the preprocessed data is shared by all the datasets
+    loader_params.update({'memory_planner': imed_loader.get_memory_planner(
+        loader_params.get(LoaderParamsKW.MAX_CACHE_GB), loader_params[TrainingParamsKW.NUM_WORKERS])})
+
     if command == 'train':
         # Get Validation dataset
         ds_valid = get_dataset(bids_df, loader_params, valid_lst, transform_valid_params, cuda_available, device,
@@ -466,7 +500,8 @@ def run_command(context, n_gif=0, thr_increment=None, resume_training=False, no_
             metric_fns=metric_fns,
             n_gif=n_gif,
             resume_training=resume_training,
-            debugging=context[ConfigKW.DEBUGGING])
+            debugging=context[ConfigKW.DEBUGGING],
+            gpu_ids=context[ConfigKW.GPU_IDS])
 
     if thr_increment:
         # LOAD DATASET
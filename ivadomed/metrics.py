@@ -2,6 +2,7 @@ from collections import defaultdict
 
 import matplotlib.pyplot as plt
 import numpy as np
+import torch
 from scipy import spatial
 
 
@@ -63,6 +64,137 @@ class MetricManager(object):
         self.result_dict = defaultdict(float)
 
 
+class DeviceMetricManager(MetricManager):
+    """Computes specified metrics on predictions on the device (e.g. GPU), without synchronising it at each batch.
+
+    The metrics computed from the soft true/false positives/negatives (see ``STATISTIC_METRICS``) are reduced on the
+    device to a few sums per sample, accumulated and copied to the host at each synchronisation. The other metrics
+    (e.g. ``hausdorff_score``) need the whole arrays: the predictions and ground truths are copied to pinned host
+    memory without blocking, and their metrics are computed once ``MAX_PENDING_BATCHES`` newer batches are pending,
+    which bounds the memory of the host copies whatever the number of batches.
+
+    Args:
+        metric_fns (list): List of metric functions.
+        sync_steps (int): Number of batches between two synchronisations of the sums of ``STATISTIC_METRICS``. If
+            None, they are only copied to the host when the results are requested.
+
+    Attributes:
+        metric_fns (list): List of metric functions.
+        result_dict (dict): Dictionary storing metrics.
+        num_samples (int): Number of samples.
+    """
+
+    MAX_PENDING_BATCHES = 2
+
+    def __init__(self, metric_fns, sync_steps=None):
+        super().__init__(metric_fns)
+        self.sync_steps = sync_steps
+        self._statistic_fns = [fn for fn in metric_fns if fn in STATISTIC_METRICS]
+        self._host_fns = [fn for fn in metric_fns if fn not in STATISTIC_METRICS]
+        self._statistics, self._pending = [], []
+        self._num_batches = 0
+
+    def __call__(self, prediction, ground_truth):
+        prediction, ground_truth = prediction.detach(), ground_truth.detach()
+        self.num_samples += len(prediction)
+        if self._statistic_fns:
+            self._statistics.append(get_statistics(prediction, ground_truth))
+        if self._host_fns:
+            self._pending.append((_to_host(prediction), _to_host(ground_truth), _record_event(prediction)))
+            while len(self._pending) > self.MAX_PENDING_BATCHES:
+                self._compute_host_metrics(*self._pending.pop(0))
+        self._num_batches += 1
+        if self.sync_steps and self._num_batches % self.sync_steps == 0:
+            self.synchronize()
+
+    def synchronize(self):
+        """Copy the accumulated statistics to the host and compute the metrics of the pending batches."""
+        if self._statistics:
+            statistics = torch.cat(self._statistics).cpu().numpy()
+            for metric_fn in self._statistic_fns:
+                self.result_dict[metric_fn.__name__].extend(STATISTIC_METRICS[metric_fn](statistics))
+        for pending in self._pending:
+            self._compute_host_metrics(*pending)
+        self._statistics, self._pending = [], []
+
+    def _compute_host_metrics(self, prediction, ground_truth, event):
+        """Compute the metrics which need the whole arrays of a batch, once its copy to the host is completed."""
+        if event is not None:
+            event.synchronize()
+        for metric_fn in self._host_fns:
+            for p, gt in zip(prediction.numpy(), ground_truth.numpy()):
+                self.result_dict[metric_fn.__name__].append(metric_fn(p, gt))
+
+    def all_gather(self):
+        """Gather the metrics of all the processes of a distributed training, in each process."""
+        self.synchronize()
+        gathered = [None] * torch.distributed.get_world_size()
+        torch.distributed.all_gather_object(gathered, (dict(self.result_dict), self.num_samples))
+        self.result_dict, self.num_samples = defaultdict(list), 0
+        for result_dict, num_samples in gathered:
+            for key, values in result_dict.items():
+                self.result_dict[key].extend(values)
+            self.num_samples += num_samples
+
+    def get_results(self):
+        self.synchronize()
+        return super().get_results()
+
+    def reset(self):
+        super().reset()
+        self.result_dict = defaultdict(list)
+        self._statistics, self._pending = [], []
+        self._num_batches = 0
+
+
+def _to_host(tensor):
+    """Copy a tensor to the host, without blocking if it is on a CUDA device (pinned memory)."""
+    if not tensor.is_cuda:
+        return tensor
+    buffer = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+    return buffer.copy_(tensor, non_blocking=True)
+
+
+def _record_event(tensor):
+    """Return a CUDA event marking the copies to the host queued so far on the device of tensor, None on the CPU."""
+    if not tensor.is_cuda:
+        return None
+    event = torch.cuda.Event()
+    event.record(torch.cuda.current_stream(tensor.device))
+    return event
+
+
+def get_statistics(prediction, groundtruth):
+    """Compute the soft sums of a batch used by the metrics of ``STATISTIC_METRICS``, on its device.
+
+    Args:
+        prediction (Tensor): Predictions, of shape batch size x number of classes x spatial dimensions.
+        groundtruth (Tensor): Ground truths, of the same shape.
+
+    Returns:
+        Tensor: For each sample (rows): sum of the prediction, sum of the ground truth, soft true positives and number
+            of voxels, then the same three sums for each class.
+    """
+    n_samples, n_classes = prediction.shape[:2]
+    prediction = prediction.reshape(n_samples, n_classes, -1)
+    groundtruth = groundtruth.reshape(n_samples, n_classes, -1).to(prediction.dtype)
+    sums = torch.stack([prediction.sum(-1, dtype=torch.float64),
+                        groundtruth.sum(-1, dtype=torch.float64),
+                        (prediction * groundtruth).sum(-1, dtype=torch.float64)], dim=1)
+    n_voxels = torch.full((n_samples, 1), prediction[0].numel(), dtype=torch.float64, device=prediction.device)
+    return torch.cat([sums.sum(-1), n_voxels, sums.reshape(n_samples, -1)], dim=1)
+
+
+def _divide(numerator, denominator, err_value):
+    """Divide element-wise, with err_value where the denominator is not positive."""
+    return np.where(denominator > 0, numerator / np.where(denominator > 0, denominator, 1), err_value)
+
+
+def _multi_class_dice_from_statistics(statistics):
+    sums = statistics[:, 4:].reshape(len(statistics), 3, -1)
+    return _divide(2 * sums[:, 2], sums[:, 0] + sums[:, 1], 1.0).mean(axis=1)
+
+
 def numeric_score(prediction, groundtruth):
     """Computation of statistical numerical scores:
 
@@ -338,3 +470,16 @@ def plot_dice_thr(thr_list, dice_list, opt_thr_idx, fname_out):
     plt.ylabel('Dice')
     plt.title('Threshold analysis')
     plt.savefig(fname_out)
+
+
+# Metrics computed from the soft sums of get_statistics (prediction, ground truth, true positives, number of voxels),
+# with the same results as the metric functions
+STATISTIC_METRICS = {
+    dice_score: lambda s: _divide(2 * s[:, 2], s[:, 0] + s[:, 1], np.nan),
+    multi_class_dice_score: _multi_class_dice_from_statistics,
+    precision_score: lambda s: _divide(s[:, 2], s[:, 0], 0.0),
+    recall_score: lambda s: _divide(s[:, 2], s[:, 1], 0.0),
+    specificity_score: lambda s: _divide(s[:, 3] - s[:, 0] - s[:, 1] + s[:, 2], s[:, 3] - s[:, 1], 0.0),
+    intersection_over_union: lambda s: _divide(s[:, 2], s[:, 0] + s[:, 1] - s[:, 2], 0.0),
+    accuracy_score: lambda s: _divide(s[:, 3] - s[:, 0] - s[:, 1] + 2 * s[:, 2], s[:, 3], 0.0),
+}
@@ -2,11 +2,68 @@ from collections import OrderedDict
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+import torch.utils.checkpoint
 from torch.nn import Module
 from torch.nn import init
 from pathlib import Path
 import torchvision.models
 
+# Non-reentrant checkpointing (torch>=1.11) supports the blocks called twice in a forward pass under
+# DistributedDataParallel, and the gradients of the parameters of blocks whose inputs do not require grad
+NON_REENTRANT_CHECKPOINT = tuple(int(v) for v in torch.__version__.split(".")[:2]) >= (1, 11)
+
+
+def checkpoint(function, *inputs):
+    """Run a block with activation checkpointing.
+
+    The intermediate activations of the block are not stored during the forward pass, they are recomputed during the
+    backward pass: this trades compute for memory. The random state is restored for the recomputation (dropout).
+
+    Args:
+        function (Callable): Block, called on the inputs.
+        *inputs: Inputs of the block.
+
+    Returns:
+        Output of the block.
+    """
+    if NON_REENTRANT_CHECKPOINT:
+        return torch.utils.checkpoint.checkpoint(function, *inputs, use_reentrant=False)
+    if not any(torch.is_tensor(x) and x.requires_grad for x in inputs):
+        # The gradients of the parameters of the block are only computed if one of its inputs requires grad
+        inputs = [x.detach().requires_grad_() if torch.is_tensor(x) and x.is_floating_point() else x for x in inputs]
+    return torch.utils.checkpoint.checkpoint(function, *inputs)
+
+
+def is_checkpointed(module):
+    """Return True if the blocks of a module are run with activation checkpointing, see set_activation_checkpointing.
+
+    Checkpointing only applies when training with gradients enabled.
+    """
+    return getattr(module, "activation_checkpointing", False) and module.training and torch.is_grad_enabled()
+
+
+def set_activation_checkpointing(model, applied=True):
+    """Enable the activation checkpointing of the convolution blocks of a model.
+
+    Applies to the encoder and decoder blocks of U-Net based models (``DownConv``, used by ``Unet``, ``FiLMedUnet``
+    and ``HeMISUnet``) and of ``Modified3DUNet``: larger inputs fit in the same memory, at the cost of a second
+    forward pass of the blocks during the backward pass. The running statistics of the batch normalization layers of
+    the blocks are updated by both forward passes.
+
+    Args:
+        model (nn.Module): Model.
+        applied (bool): If True, activation checkpointing is enabled, otherwise it is disabled.
+
+    Returns:
+        int: Number of modules with activation checkpointing.
+    """
+    n_modules = 0
+    for module in model.modules():
+        if isinstance(module, (DownConv, Modified3DUNet)):
+            module.activation_checkpointing = applied
+            n_modules += 1
+    return n_modules
+
 
 #Modified from torchvision.models.resnet.Resnet
 class ResNet(nn.Module):
@@ -252,6 +309,11 @@ class DownConv(Module):
         self.conv2_drop = dropout(dropout_rate)
 
     def forward(self, x):
+        if is_checkpointed(self):
+            return checkpoint(self._forward, x)
+        return self._forward(x)
+
+    def _forward(self, x):
         x = F.relu(self.conv1(x))
         x = self.conv1_bn(x)
         x = self.conv1_drop(x)
@@ -981,6 +1043,12 @@ class Modified3DUNet(nn.Module):
             nn.InstanceNorm3d(feat_out, momentum=self.momentum),
             nn.LeakyReLU())
 
+    def _block(self, block, x):
+        """Run a convolution block, with activation checkpointing if enabled (see set_activation_checkpointing)."""
+        if is_checkpointed(self):
+            return checkpoint(block, x)
+        return block(x)
+
     def forward(self, x, context=None, w_film=None):
         #  Level 1 context pathway
         out = self.conv3d_c1_1(x)
@@ -989,7 +1057,7 @@ class Modified3DUNet(nn.Module):
         out = self.lrelu(out)
         out = self.conv3d_c1_2(out)
         out = self.dropout3d(out)
-        out = self.lrelu_conv_c1(out)
+        out = self._block(self.lrelu_conv_c1, out)
         # Element Wise Summation
         out += residual_1
         out = self.lrelu(out)
@@ -1002,9 +1070,9 @@ class Modified3DUNet(nn.Module):
         # Level 2 context pathway
         out = self.conv3d_c2(out)
         residual_2 = out
-        out = self.norm_lrelu_conv_c2(out)
+        out = self._block(self.norm_lrelu_conv_c2, out)
         out = self.dropout3d(out)
-        out = self.norm_lrelu_conv_c2(out)
+        out = self._block(self.norm_lrelu_conv_c2, out)
         out += residual_2
         out = self.inorm3d_c2(out)
         out = self.lrelu(out)
@@ -1015,9 +1083,9 @@ class Modified3DUNet(nn.Module):
         # Level 3 context pathway
         out = self.conv3d_c3(out)
         residual_3 = out
-        out = self.norm_lrelu_conv_c3(out)
+        out = self._block(self.norm_lrelu_conv_c3, out)
         out = self.dropout3d(out)
-        out = self.norm_lrelu_conv_c3(out)
+        out = self._block(self.norm_lrelu_conv_c3, out)
         out += residual_3
         out = self.inorm3d_c3(out)
         out = self.lrelu(out)
@@ -1028,9 +1096,9 @@ class Modified3DUNet(nn.Module):
         # Level 4 context pathway
         out = self.conv3d_c4(out)
         residual_4 = out
-        out = self.norm_lrelu_conv_c4(out)
+        out = self._block(self.norm_lrelu_conv_c4, out)
         out = self.dropout3d(out)
-        out = self.norm_lrelu_conv_c4(out)
+        out = self._block(self.norm_lrelu_conv_c4, out)
         out += residual_4
         out = self.inorm3d_c4(out)
         out = self.lrelu(out)
@@ -1041,9 +1109,9 @@ class Modified3DUNet(nn.Module):
         # Level 5
         out = self.conv3d_c5(out)
         residual_5 = out
-        out = self.norm_lrelu_conv_c5(out)
+        out = self._block(self.norm_lrelu_conv_c5, out)
         out = self.dropout3d(out)
-        out = self.norm_lrelu_conv_c5(out)
+        out = self._block(self.norm_lrelu_conv_c5, out)
         out += residual_5
 
         if self.attention:
@@ -1058,9 +1126,9 @@ class Modified3DUNet(nn.Module):
         if hasattr(self, 'film_layer5') and self.film_layer5:
             out = self.norm_lrelu_0(out)
             out, w_film = self.film_layer5(out, context, w_film)
-            out = self.upscale_conv_norm_lrelu_0(out)
+            out = self._block(self.upscale_conv_norm_lrelu_0, out)
         else:
-            out = self.norm_lrelu_upscale_conv_norm_lrelu_l0(out)
+            out = self._block(self.norm_lrelu_upscale_conv_norm_lrelu_l0, out)
 
         out = self.conv3d_l0(out)
 
@@ -1071,34 +1139,34 @@ class Modified3DUNet(nn.Module):
 
         # Level 1 localization pathway
         out = torch.cat([out, context_4], dim=1)
-        out = self.conv_norm_lrelu_l1(out)
+        out = self._block(self.conv_norm_lrelu_l1, out)
         out = self.conv3d_l1(out)
-        out = self.norm_lrelu_upscale_conv_norm_lrelu_l1(out)
+        out = self._block(self.norm_lrelu_upscale_conv_norm_lrelu_l1, out)
         if hasattr(self, 'film_layer7') and self.film_layer7:
             out, w_film = self.film_layer7(out, context, w_film)
 
 
         # Level 2 localization pathway
         out = torch.cat([out, context_3], dim=1)
-        out = self.conv_norm_lrelu_l2(out)
+        out = self._block(self.conv_norm_lrelu_l2, out)
         ds2 = out
         out = self.conv3d_l2(out)
-        out = self.norm_lrelu_upscale_conv_norm_lrelu_l2(out)
+        out = self._block(self.norm_lrelu_upscale_conv_norm_lrelu_l2, out)
         if hasattr(self, 'film_layer8') and self.film_layer8:
             out, w_film = self.film_layer8(out, context, w_film)
 
         # Level 3 localization pathway
         out = torch.cat([out, context_2], dim=1)
-        out = self.conv_norm_lrelu_l3(out)
+        out = self._block(self.conv_norm_lrelu_l3, out)
         ds3 = out
         out = self.conv3d_l3(out)
-        out = self.norm_lrelu_upscale_conv_norm_lrelu_l3(out)
+        out = self._block(self.norm_lrelu_upscale_conv_norm_lrelu_l3, out)
         if hasattr(self, 'film_layer9') and self.film_layer9:
             out, w_film = self.film_layer9(out, context, w_film)
 
         # Level 4 localization pathway
         out = torch.cat([context_1, out], dim=1)
-        out = self.conv_norm_lrelu_l4(out)
+        out = self._block(self.conv_norm_lrelu_l4, out)
 
         out_pred = self.conv3d_l4(out)
 
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+"""
+Compare the CPU inference latency of a model with PyTorch and with ONNX Runtime.
+
+The model folder (e.g. a packaged model downloaded with ``ivadomed_download_data``) is run on random batches of the
+size of the model input with each available backend: PyTorch (``.pt`` model), ONNX Runtime with a default session and
+with the inference engine of ``ivadomed --segment`` (``.onnx`` model, see ``onnx_runtime`` in the configuration file).
+
+Usage example::
+
+    ivadomed_download_data -d t2_tumor
+    ivadomed_benchmark_onnx -m t2_tumor -b 4
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import onnxruntime
+import torch
+from loguru import logger
+
+from ivadomed import config_manager as imed_config_manager
+from ivadomed import inference as imed_inference
+from ivadomed import utils as imed_utils
+from ivadomed.keywords import ConfigKW, ModelParamsKW, LoaderParamsKW, ContrastParamsKW
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-m", "--model", dest="model", required=True, type=str,
+                        help="Folder of the model, containing the model (.pt and/or .onnx) and its configuration file.",
+                        metavar=imed_utils.Metavar.folder)
+    parser.add_argument("-b", "--batch-size", dest="batch_size", default=1, type=int,
+                        help="Number of samples per batch.", metavar=imed_utils.Metavar.int)
+    parser.add_argument("-s", "--size", dest="size", type=int, nargs="+",
+                        help="Spatial size of the inputs. Default: length_2D or length_3D of the model, otherwise "
+                             "256 x 256.", metavar=imed_utils.Metavar.int)
+    parser.add_argument("-n", "--n_channels", dest="n_channels", type=int,
+                        help="Number of input channels of the model. Default: number of testing contrasts for "
+                             "multichannel models, otherwise 1.", metavar=imed_utils.Metavar.int)
+    parser.add_argument("-r", "--repeats", dest="n_repeats", default=20, type=int,
+                        help="Number of timed batches per backend.", metavar=imed_utils.Metavar.int)
+    parser.add_argument("-t", "--threads", dest="intra_op_num_threads", default=0, type=int,
+                        help="Number of threads of PyTorch and ONNX Runtime. 0: default of each library.",
+                        metavar=imed_utils.Metavar.int)
+    return parser
+
+
+def get_input_shape(context: dict, batch_size: int = 1, size: list = None, n_channels: int = None) -> tuple:
+    """Return the shape of the input batches of a model, from its configuration.
+
+    Args:
+        context (dict): Configuration of the model.
+        batch_size (int): Number of samples per batch.
+        size (list): Spatial size of the inputs. If None, the patch size of the model, otherwise 256 x 256.
+        n_channels (int): Number of input channels. If None, the number of testing contrasts for multichannel
+            models, otherwise 1.
+
+    Returns:
+        tuple: Shape of the batches.
+    """
+    loader_params = context[ConfigKW.LOADER_PARAMETERS]
+    if n_channels is None:
+        n_channels = len(loader_params[LoaderParamsKW.CONTRAST_PARAMS][ContrastParamsKW.TESTING]) \
+            if loader_params.get(LoaderParamsKW.MULTICHANNEL) else 1
+    if size is None:
+        if context.get(ConfigKW.MODIFIED_3D_UNET, {}).get(ModelParamsKW.APPLIED):
+            size = context[ConfigKW.MODIFIED_3D_UNET][ModelParamsKW.LENGTH_3D]
+        else:
+            size = context[ConfigKW.DEFAULT_MODEL].get(ModelParamsKW.LENGTH_2D) or [256, 256]
+    return (batch_size, n_channels) + tuple(size)
+
+
+def time_model(model_fn, inputs: torch.Tensor, n_repeats: int = 20) -> dict:
+    """Return the latency of a model on a batch, after two warm-up runs.
+
+    Args:
+        model_fn (Callable): Model, called on the batch.
+        inputs (torch.Tensor): Batch of inputs.
+        n_repeats (int): Number of timed runs.
+
+    Returns:
+        dict: Median and 95th percentile of the latency in seconds ("median", "p95"), and the output of the model
+            ("output").
+    """
+    with torch.no_grad():
+        for _ in range(2):
+            output = model_fn(inputs)
+        latencies = []
+        for _ in range(n_repeats):
+            time_start = time.perf_counter()
+            model_fn(inputs)
+            latencies.append(time.perf_counter() - time_start)
+    return {'median': float(np.median(latencies)), 'p95': float(np.percentile(latencies, 95)), 'output': output}
+
+
+def benchmark_onnx(folder_model: str, batch_size: int = 1, size: list = None, n_channels: int = None,
+                   n_repeats: int = 20, intra_op_num_threads: int = 0) -> dict:
+    """Compare the CPU inference latency of a model with PyTorch and with ONNX Runtime.
+
+    The backends are run on the same random batch. Their outputs are compared to the output of the first backend.
+
+    Args:
+        folder_model (str): Folder of the model, containing the model (.pt and/or .onnx) and its configuration file.
+            Flag: ``--model``, ``-m``.
+        batch_size (int): Number of samples per batch. Flag: ``--batch-size``, ``-b``.
+        size (list): Spatial size of the inputs, see get_input_shape. Flag: ``--size``, ``-s``.
+        n_channels (int): Number of input channels, see get_input_shape. Flag: ``--n_channels``, ``-n``.
+        n_repeats (int): Number of timed batches per backend. Flag: ``--repeats``, ``-r``.
+        intra_op_num_threads (int): Number of threads of PyTorch and ONNX Runtime. 0: default of each library.
+            Flag: ``--threads``, ``-t``.
+
+    Returns:
+        dict: For each backend, the median and 95th percentile of the latency in seconds, and the maximum absolute
+            difference of its output with the output of the first backend.
+    """
+    name = Path(folder_model).name
+    fname_model_pt = Path(folder_model, name + '.pt')
+    fname_model_onnx = Path(folder_model, name + '.onnx')
+    context = imed_config_manager.ConfigurationManager(str(Path(folder_model, name + '.json'))).get_config()
+    if context.get(ConfigKW.FILMED_UNET, {}).get(ModelParamsKW.APPLIED) or \
+            context.get(ConfigKW.HEMIS_UNET, {}).get(ModelParamsKW.APPLIED):
+        raise ValueError("Models with metadata inputs (FiLM, HeMIS) are not supported.")
+
+    if intra_op_num_threads > 0:
+        torch.set_num_threads(intra_op_num_threads)
+    inputs = torch.randn(get_input_shape(context, batch_size, size, n_channels))
+    logger.info(f"Input batch: {tuple(inputs.shape)}, {n_repeats} repeats.")
+
+    backends = {}
+    if fname_model_pt.is_file():
+        model = torch.load(str(fname_model_pt), map_location='cpu')
+        model.eval()
+        backends['pytorch'] = model
+    if fname_model_onnx.is_file():
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = intra_op_num_threads
+        session = onnxruntime.InferenceSession(str(fname_model_onnx), session_options,
+                                               providers=['CPUExecutionProvider'])
+        backends['onnxruntime_session'] = \
+            lambda x: torch.tensor(session.run(None, {session.get_inputs()[0].name: np.array(x)})[0])
+        backends['onnxruntime_engine'] = imed_inference.OnnxEngine(str(fname_model_onnx),
+                                                                   intra_op_num_threads=intra_op_num_threads)
+    if not backends:
+        raise FileNotFoundError(f"Model files not found in model folder: '{fname_model_onnx}' or '{fname_model_pt}'")
+
+    results, reference = {}, None
+    for backend, model_fn in backends.items():
+        result = time_model(model_fn, inputs, n_repeats)
+        output = result.pop('output')
+        reference = output if reference is None else reference
+        result['max_abs_diff'] = float((output - reference).abs().max())
+        results[backend] = result
+        logger.info(f"{backend}: median {result['median'] * 1000:.1f} ms, 95th percentile {result['p95'] * 1000:.1f} "
+                    f"ms per batch, max. absolute difference {result['max_abs_diff']:.2e}.")
+    return results
+
+
+def main(args=None):
+    imed_utils.init_ivadomed()
+    parser = get_parser()
+    args = imed_utils.get_arguments(parser, args)
+    benchmark_onnx(args.model, batch_size=args.batch_size, size=args.size, n_channels=args.n_channels,
+                   n_repeats=args.n_repeats, intra_op_num_threads=args.intra_op_num_threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,9 @@
 import argparse
+from pathlib import Path
+
 import torch
+from loguru import logger
+
 from ivadomed import utils as imed_utils
 
 
@@ -15,10 +19,24 @@ def get_parser():
                         metavar=imed_utils.Metavar.int)
     parser.add_argument("-g", "--gpu_id", dest="gpu_id", default=0, type=str,
                         help="GPU number if available.", metavar=imed_utils.Metavar.int)
+    parser.add_argument("-s", "--size", dest="size", type=int, nargs="+",
+                        help="Spatial size of the sample input used for the export. The exported model accepts "
+                             "any batch and spatial size. Default: 96 along each axis.",
+                        metavar=imed_utils.Metavar.int)
+    parser.add_argument("--opset", dest="opset_version", default=11, type=int,
+                        help="ONNX opset version of the exported model.", metavar=imed_utils.Metavar.int)
+    parser.add_argument("--no-check", dest="no_check", action="store_true",
+                        help="Skip the comparison of the outputs of the ONNX model with the PyTorch model.")
+    parser.add_argument("--optimization-level", dest="optimization_level",
+                        choices=["basic", "extended", "all"],
+                        help="If provided, the model optimized by ONNX Runtime at this level is also saved, with the "
+                             "suffix '_optimized.onnx'. The 'extended' and 'all' levels are specific to the "
+                             "hardware of the conversion.")
     return parser
 
 
-def convert_pytorch_to_onnx(model, dimension, n_channels, gpu_id=0):
+def convert_pytorch_to_onnx(model, dimension, n_channels, gpu_id=0, size=None, opset_version=11, check_parity=True,
+                            optimization_level=None):
     """Convert PyTorch model to ONNX.
 
     The integration of Deep Learning models into the clinical routine requires cpu optimized models. To export the
@@ -26,12 +44,22 @@ def convert_pytorch_to_onnx(model, dimension, n_channels, gpu_id=0):
     `ONNX Runtime <https://github.com/microsoft/onnxruntime>`_ is a time and memory efficient way to answer this need.
 
     This function converts a model from PyTorch to ONNX format, with information of whether it is a 2D or 3D model
-    (``-d``).
+    (``-d``). The batch and spatial axes are dynamic: the ONNX model runs on any number of slices or subvolumes per
+    batch, and on inputs of any size supported by the model. The outputs of the ONNX model are then compared to the
+    outputs of the PyTorch model, on the sample input and on a batch of another shape.
 
     Args:
         model (string): Model filename. Flag: ``--model``, ``-m``.
         dimension (int): Indicates whether the model is 2D or 3D. Choice between 2 or 3. Flag: ``--dimension``, ``-d``
+        n_channels (int): Number of input channels of the model. Flag: ``--n_channels``, ``-n``
         gpu_id (string): GPU ID, if available. Flag: ``--gpu_id``, ``-g``
+        size (list of int): Spatial size of the sample input used for the export. Default: 96 along each axis.
+            Flag: ``--size``, ``-s``
+        opset_version (int): ONNX opset version. Flag: ``--opset``
+        check_parity (bool): If True, the outputs of the ONNX model are compared to the PyTorch model. Flag:
+            ``--no-check`` to skip it.
+        optimization_level (str): If not None, the model optimized by ONNX Runtime at this level ("basic",
+            "extended", "all") is also saved with the suffix "_optimized.onnx". Flag: ``--optimization-level``
     """
     if torch.cuda.is_available():
         device = "cuda:" + str(gpu_id)
@@ -39,9 +67,23 @@ def convert_pytorch_to_onnx(model, dimension, n_channels, gpu_id=0):
         device = "cpu"
 
     model_net = torch.load(model, map_location=device)
-    dummy_input = torch.randn(1, n_channels, 96, 96, device=device) if dimension == 2 \
-                  else torch.randn(1, n_channels, 96, 96, 96, device=device)
-    imed_utils.save_onnx_model(model_net, dummy_input, model.replace("pt", "onnx"))
+    if size is None:
+        size = [96] * dimension
+    if len(size) != dimension:
+        raise ValueError(f"The size of the sample input must have {dimension} values, got: {size}.")
+    dummy_input = torch.randn(1, n_channels, *size, device=device)
+    fname_onnx = str(Path(model).with_suffix('.onnx'))
+    imed_utils.save_onnx_model(model_net, dummy_input, fname_onnx, opset_version=opset_version,
+                               check_parity=check_parity)
+    logger.info(f"Model saved as '.onnx': {fname_onnx}")
+
+    if optimization_level is not None:
+        # The session saves the optimized model when it is created
+        from ivadomed import inference as imed_inference
+        fname_optimized = str(Path(model).with_suffix('')) + '_optimized.onnx'
+        imed_inference.OnnxEngine(fname_onnx, graph_optimization_level=optimization_level,
+                                  optimized_model_path=fname_optimized)
+        logger.info(f"Optimized model saved: {fname_optimized}")
 
 
 def main(args=None):
@@ -53,7 +95,9 @@ def main(args=None):
     gpu_id = str(args.gpu_id)
     n_channels = args.n_channels
 
-    convert_pytorch_to_onnx(fname_model, dimension, n_channels, gpu_id)
+    convert_pytorch_to_onnx(fname_model, dimension, n_channels, gpu_id, size=args.size,
+                            opset_version=args.opset_version, check_parity=not args.no_check,
+                            optimization_level=args.optimization_level)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+"""
+Quantize a packaged model for CPU inference with ONNX Runtime.
+
+The PyTorch model of the folder (``.pt`` and ``.json``) is exported to ONNX, then quantized, and saved next to the
+original model with the suffix ``_int8.onnx`` (dynamic or static int8 quantization) or ``_fp16.onnx`` (float16
+weights). Static quantization calibrates the activations on slices (or subvolumes) of the training split, drawn
+with the BIDS loader of the configuration file. The Dice score, the latency and the size of the quantized model are
+then compared to the original model on the validation split.
+
+Quantization requires the ``onnx`` package (and ``onnxconverter-common`` for float16), installed with
+``pip install ivadomed[quantization]``.
+
+Usage example::
+
+    ivadomed_quantize_model -m path/to/model -c path/to/config.json --method static
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from loguru import logger
+
+from ivadomed import config_manager as imed_config_manager
+from ivadomed import inference as imed_inference
+from ivadomed import main as imed_main
+from ivadomed import metrics as imed_metrics
+from ivadomed import transforms as imed_transforms
+from ivadomed import utils as imed_utils
+from ivadomed.keywords import ConfigKW, ModelParamsKW, LoaderParamsKW, SplitDatasetKW
+from ivadomed.loader import utils as imed_loader_utils
+from ivadomed.loader.bids_dataframe import BidsDataframe
+
+METHODS = ["dynamic", "static", "fp16"]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-m", "--model", dest="model", required=True, type=str,
+                        help="Folder of the model, containing the PyTorch model (.pt) and its configuration file.",
+                        metavar=imed_utils.Metavar.folder)
+    parser.add_argument("-c", "--config", dest="config", type=str,
+                        help="Configuration file of the data used for the calibration and the validation (loader "
+                             "parameters and split). Default: configuration file of the model.",
+                        metavar=imed_utils.Metavar.file)
+    parser.add_argument("--method", dest="method", default="dynamic", choices=METHODS,
+                        help="Dynamic int8 quantization (weights only, no calibration), static int8 quantization "
+                             "(weights and activations, calibrated), or float16 weights.")
+    parser.add_argument("-n", "--n-calibration", dest="n_calibration", default=32, type=int,
+                        help="Number of training samples used to calibrate the static quantization.",
+                        metavar=imed_utils.Metavar.int)
+    parser.add_argument("-v", "--n-validation", dest="n_validation", default=64, type=int,
+                        help="Maximum number of validation samples used to compare the models.",
+                        metavar=imed_utils.Metavar.int)
+    return parser
+
+
+def get_datasets(context: dict, path_output: str) -> tuple:
+    """Return the training and validation datasets of a configuration, with the validation transforms.
+
+    Args:
+        context (dict): Configuration.
+        path_output (str): Folder of the split files.
+
+    Returns:
+        Dataset, Dataset: Training and validation datasets.
+    """
+    context[ConfigKW.LOADER_PARAMETERS][LoaderParamsKW.PATH_DATA] = \
+        imed_utils.format_path_data(context[ConfigKW.LOADER_PARAMETERS][LoaderParamsKW.PATH_DATA])
+    loader_params = imed_main.set_loader_params(context, is_train=False)
+    _, transform_valid_params, _ = imed_transforms.get_subdatasets_transforms(context[ConfigKW.TRANSFORMATION])
+    _, loader_params = imed_main.set_model_params(context, loader_params)
+    bids_df = BidsDataframe(loader_params, path_output, derivatives=True,
+                            split_method=context[ConfigKW.SPLIT_DATASET][SplitDatasetKW.SPLIT_METHOD])
+    train_lst, valid_lst, _ = imed_loader_utils.get_subdatasets_subject_files_list(
+        context[ConfigKW.SPLIT_DATASET], bids_df.df, path_output,
+        context[ConfigKW.LOADER_PARAMETERS].get(LoaderParamsKW.SUBJECT_SELECTION))
+    device = torch.device("cpu")
+    ds_train = imed_main.get_dataset(bids_df, loader_params, train_lst, transform_valid_params, False, device,
+                                     'training')
+    ds_valid = imed_main.get_dataset(bids_df, loader_params, valid_lst, transform_valid_params, False, device,
+                                     'validation')
+    return ds_train, ds_valid
+
+
+def get_samples(ds, n_samples: int, seed: int = 0) -> list:
+    """Return a random subset of the samples of a dataset, with a batch dimension.
+
+    Args:
+        ds (Dataset): Dataset.
+        n_samples (int): Number of samples. All the samples if the dataset is smaller.
+        seed (int): Random seed of the selection.
+
+    Returns:
+        list: (input, gt) of each sample, as tensors of shape (1, channels, ...).
+    """
+    indexes = np.random.default_rng(seed).permutation(len(ds))[:n_samples]
+    samples = []
+    for index in sorted(indexes):
+        sample = ds[int(index)]
+        samples.append((sample['input'].unsqueeze(0).float(), sample['gt'].unsqueeze(0)))
+    return samples
+
+
+def quantize_onnx(fname_onnx: str, fname_out: str, method: str = "dynamic", calibration_inputs: list = None) -> None:
+    """Quantize an ONNX model.
+
+    Args:
+        fname_onnx (str): Filename of the float32 ONNX model.
+        fname_out (str): Filename of the quantized model.
+        method (str): "dynamic" (int8 weights, activations quantized on the fly), "static" (int8 weights and
+            activations, with ranges calibrated on ``calibration_inputs``) or "fp16" (float16 weights, float32 inputs
+            and outputs).
+        calibration_inputs (list): Input batches (numpy arrays) of the static quantization.
+    """
+    if method == "fp16":
+        try:
+            import onnx
+            from onnxconverter_common import float16
+        except ImportError as err:
+            raise ImportError("The float16 conversion requires the 'onnx' and 'onnxconverter-common' packages: "
+                              "pip install ivadomed[quantization]") from err
+        model_fp16 = float16.convert_float_to_float16(onnx.load(fname_onnx), keep_io_types=True)
+        onnx.save(model_fp16, fname_out)
+        return
+
+    try:
+        from onnxruntime import quantization as ort_quantization
+    except ImportError as err:
+        raise ImportError("The quantization requires the 'onnx' package: pip install ivadomed[quantization]") from err
+    if method == "dynamic":
+        ort_quantization.quantize_dynamic(fname_onnx, fname_out, weight_type=ort_quantization.QuantType.QInt8)
+    elif method == "static":
+        if not calibration_inputs:
+            raise ValueError("Static quantization requires calibration inputs.")
+
+        class CalibrationReader(ort_quantization.CalibrationDataReader):
+            def __init__(self):
+                self.inputs = iter([{'input': inputs} for inputs in calibration_inputs])
+
+            def get_next(self):
+                return next(self.inputs, None)
+
+        ort_quantization.quantize_static(fname_onnx, fname_out, CalibrationReader(),
+                                         quant_format=ort_quantization.QuantFormat.QDQ, per_channel=True,
+                                         weight_type=ort_quantization.QuantType.QInt8)
+    else:
+        raise ValueError(f"Unknown quantization method: {method}, choose between {METHODS}.")
+
+
+def evaluate(model_fn, samples: list, thr: float = 0.5) -> dict:
+    """Return the Dice score and the latency of a model on samples.
+
+    Args:
+        model_fn (Callable): Model, called on an input batch.
+        samples (list): (input, gt) of each sample, see get_samples.
+        thr (float): Binarization threshold of the predictions.
+
+    Returns:
+        dict: Mean Dice score ("dice", over the samples with a non-empty prediction or ground truth), and median
+            latency per sample in seconds ("latency").
+    """
+    dices, latencies = [], []
+    with torch.no_grad():
+        for inputs, gt in samples:
+            time_start = time.perf_counter()
+            preds = model_fn(inputs)
+            latencies.append(time.perf_counter() - time_start)
+            n_classes = min(preds.shape[1], gt.shape[1])
+            dices.append(imed_metrics.dice_score(preds[:, :n_classes].numpy() >= thr,
+                                                 gt[:, :n_classes].numpy() >= thr))
+    return {'dice': float(np.nanmean(dices)) if not np.all(np.isnan(dices)) else float('nan'),
+            'latency': float(np.median(latencies))}
+
+
+def quantize_model(folder_model: str, path_config: str = None, method: str = "dynamic", n_calibration: int = 32,
+                   n_validation: int = 64) -> dict:
+    """Quantize a packaged model and compare it to the original model.
+
+    The model is exported to ONNX with dynamic axes, quantized (see quantize_onnx) and saved in the model folder with
+    the suffix ``_int8.onnx`` or ``_fp16.onnx``. The float32 PyTorch and ONNX models and the quantized model are
+    then evaluated on the validation split: Dice score (binarized at 0.5) against the ground truth, median latency
+    per sample on CPU, and size of the model file.
+
+    Args:
+        folder_model (str): Folder of the model, containing the PyTorch model (.pt) and its configuration file.
+            Flag: ``--model``, ``-m``.
+        path_config (str): Configuration file of the data used for the calibration and the validation. If None, the
+            configuration file of the model. Flag: ``--config``, ``-c``.
+        method (str): "dynamic", "static" or "fp16". Flag: ``--method``.
+        n_calibration (int): Number of training samples used to calibrate the static quantization. Flag:
+            ``--n-calibration``, ``-n``.
+        n_validation (int): Maximum number of validation samples used to compare the models. Flag:
+            ``--n-validation``, ``-v``.
+
+    Returns:
+        dict: Filename of the quantized model ("fname_quantized"), and for each model ("pytorch", "onnx_fp32",
+            "quantized"), its Dice score, latency and size in MB, and the Dice score difference with the PyTorch
+            model ("dice_delta").
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown quantization method: {method}, choose between {METHODS}.")
+    name = Path(folder_model).name
+    fname_model = Path(folder_model, name + '.pt')
+    if not fname_model.is_file():
+        raise FileNotFoundError(f"PyTorch model not found: {fname_model}")
+    path_config = path_config if path_config is not None else str(Path(folder_model, name + '.json'))
+    context = imed_config_manager.ConfigurationManager(path_config).get_config()
+    if context.get(ConfigKW.FILMED_UNET, {}).get(ModelParamsKW.APPLIED) or \
+            context.get(ConfigKW.HEMIS_UNET, {}).get(ModelParamsKW.APPLIED):
+        raise ValueError("Models with metadata inputs (FiLM, HeMIS) are not supported.")
+
+    model = torch.load(str(fname_model), map_location='cpu')
+    model.eval()
+    suffix = '_fp16.onnx' if method == 'fp16' else '_int8.onnx'
+    fname_quantized = str(Path(folder_model, name + suffix))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ds_train, ds_valid = get_datasets(context, tmp_dir)
+        samples_valid = get_samples(ds_valid, n_validation)
+        if not samples_valid:
+            raise ValueError("The validation split is empty, the quantized model can't be evaluated.")
+        calibration_inputs = [inputs.numpy() for inputs, _ in get_samples(ds_train, n_calibration)] \
+            if method == 'static' else None
+        logger.info(f"{len(samples_valid)} validation samples"
+                    + (f", {len(calibration_inputs)} calibration samples." if calibration_inputs else "."))
+
+        fname_fp32 = str(Path(tmp_dir, name + '.onnx'))
+        imed_utils.save_onnx_model(model, samples_valid[0][0], fname_fp32, check_parity=True)
+        quantize_onnx(fname_fp32, fname_quantized, method=method, calibration_inputs=calibration_inputs)
+        logger.info(f"Quantized model saved: {fname_quantized}")
+
+        backends = {'pytorch': (model, fname_model),
+                    'onnx_fp32': (imed_inference.OnnxEngine(fname_fp32), fname_fp32),
+                    'quantized': (imed_inference.OnnxEngine(fname_quantized), fname_quantized)}
+        results = {'fname_quantized': fname_quantized}
+        for backend, (model_fn, fname) in backends.items():
+            result = evaluate(model_fn, samples_valid)
+            result['size_mb'] = Path(fname).stat().st_size / 1024 ** 2
+            results[backend] = result
+
+    for backend in ['pytorch', 'onnx_fp32', 'quantized']:
+        result = results[backend]
+        result['dice_delta'] = result['dice'] - results['pytorch']['dice']
+        logger.info(f"{backend}: Dice {result['dice']:.4f} ({result['dice_delta']:+.4f}), latency "
+                    f"{result['latency'] * 1000:.1f} ms per sample, model size {result['size_mb']:.1f} MB.")
+    logger.info(f"Quantized model: {results['onnx_fp32']['latency'] / results['quantized']['latency']:.2f}x faster "
+                f"and {results['onnx_fp32']['size_mb'] / results['quantized']['size_mb']:.2f}x smaller than the "
+                f"float32 ONNX model.")
+    return results
+
+
+def main(args=None):
+    imed_utils.init_ivadomed()
+    parser = get_parser()
+    args = imed_utils.get_arguments(parser, args)
+    quantize_model(args.model, path_config=args.config, method=args.method, n_calibration=args.n_calibration,
+                   n_validation=args.n_validation)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Segment a stream of images with a model kept loaded.
+
+Each line read on the standard input is a request, either image filenames separated by spaces (one per channel), or a
+JSON object with the keys "images" (list of filenames), and optionally "options" (options of the request, see
+``Segmenter.segment``) and "path_output" (folder of the predictions, default: folder of the first image).
+
+For each request, a JSON line is written on the standard output with the filenames of the predictions and the
+latency of each stage in seconds, or with the error if the segmentation failed.
+
+Usage example::
+
+    ivadomed_segment_daemon -m path/to/model < requests.txt
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import nibabel as nib
+from loguru import logger
+
+from ivadomed import inference as imed_inference
+from ivadomed import utils as imed_utils
+from ivadomed.keywords import OptionKW
+from ivadomed.loader import utils as imed_loader_utils
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-m", "--model", dest="model", required=True, type=str,
+                        help="Folder of the model, containing the model and its configuration file.",
+                        metavar=imed_utils.Metavar.folder)
+    parser.add_argument("-g", "--gpu_id", dest="gpu_id", default=0, type=int,
+                        help="GPU number if available.", metavar=imed_utils.Metavar.int)
+    parser.add_argument("--no-patch", dest="no_patch", action="store_true",
+                        help="2D patches are not used while segmenting with models trained with patches.")
+    parser.add_argument("--overlap-2d", dest="overlap_2d", type=int, nargs="+",
+                        help="Overlaps in pixels for 2D patching, in X and Y.", metavar=imed_utils.Metavar.int)
+    return parser
+
+
+def parse_request(line: str) -> dict:
+    """Parse a request line, either image filenames separated by spaces or a JSON object.
+
+    Args:
+        line (str): Request line.
+
+    Returns:
+        dict: Request with the keys "images", "options" and "path_output".
+    """
+    if line.startswith("{"):
+        request = json.loads(line)
+    else:
+        request = {"images": line.split()}
+    return {"images": request["images"],
+            "options": request.get("options"),
+            "path_output": request.get("path_output")}
+
+
+def save_predictions(pred_list: list, fname_image: str, path_output: str = None) -> list:
+    """Save the predictions of an image, with the suffixes of the ``segment`` command.
+
+    Args:
+        pred_list (list): Prediction of each class (nibabel objects).
+        fname_image (str): Filename of the (first) segmented image.
+        path_output (str): Folder of the predictions. If None, the folder of the image.
+
+    Returns:
+        list: Filenames of the predictions.
+    """
+    path_output = Path(path_output) if path_output is not None else Path(fname_image).parent
+    path_output.mkdir(parents=True, exist_ok=True)
+    extension = imed_loader_utils.get_file_extension(fname_image)
+    subject = Path(fname_image).name.replace(extension, '') if extension else Path(fname_image).stem
+    fnames_pred = []
+    for i_class, pred in enumerate(pred_list):
+        fname_pred = str(Path(path_output, f"{subject}_class-{i_class}_pred.nii.gz"))
+        nib.save(pred, fname_pred)
+        fnames_pred.append(fname_pred)
+    return fnames_pred
+
+
+def run_daemon(segmenter: imed_inference.Segmenter, stream_in=sys.stdin, stream_out=sys.stdout) -> None:
+    """Segment the requests read from stream_in until the end of the stream, and write the results to stream_out.
+
+    Args:
+        segmenter (Segmenter): Model kept loaded.
+        stream_in: Stream of requests, one per line.
+        stream_out: Stream of results, one JSON object per line.
+    """
+    for line in stream_in:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = parse_request(line)
+            pred_list, _ = segmenter.segment(request["images"], options=request["options"])
+            result = {
+                "images": request["images"],
+                "predictions": save_predictions(pred_list, request["images"][0], request["path_output"]),
+                "latency": segmenter.metrics[-1]
+            }
+        except Exception as err:
+            logger.exception(f"Unable to process the request: {line}")
+            result = {"request": line, "error": str(err)}
+        stream_out.write(json.dumps(result) + "\n")
+        stream_out.flush()
+
+    summary = segmenter.get_metrics_summary()
+    if summary:
+        logger.info(f"Segmented {len(segmenter.metrics)} images, total latency: mean "
+                    f"{summary['total']['mean']:.3f} s, median {summary['total']['median']:.3f} s, 95th percentile "
+                    f"{summary['total']['p95']:.3f} s.")
+
+
+def main(args=None):
+    imed_utils.init_ivadomed()
+    parser = get_parser()
+    args = imed_utils.get_arguments(parser, args)
+
+    options = {}
+    if args.no_patch:
+        options[OptionKW.NO_PATCH] = args.no_patch
+    if args.overlap_2d:
+        options[OptionKW.OVERLAP_2D] = args.overlap_2d
+
+    time_start = time.perf_counter()
+    segmenter = imed_inference.Segmenter(args.model, gpu_id=args.gpu_id, options=options)
+    logger.info(f"Model loaded in {time.perf_counter() - time_start:.2f} s, waiting for requests.")
+    run_daemon(segmenter)
+
+
+if __name__ == '__main__':
+    main()
@@ -45,7 +45,7 @@ def test(model_params, dataset_test, testing_params, path_output, device, cuda_a
     test_loader = DataLoader(dataset_test, batch_size=testing_params["batch_size"],
                              shuffle=False, pin_memory=True,
                              collate_fn=imed_loader_utils.imed_collate,
-                             num_workers=0)
+                             **imed_loader_utils.get_dataloader_params(testing_params))
 
     # LOAD TRAIN MODEL
     fname_model = Path(path_output, "best_model.pt")
@@ -73,9 +73,14 @@ def test(model_params, dataset_test, testing_params, path_output, device, cuda_a
         testing_params['uncertainty']['applied'] = False
         n_monteCarlo = 1
 
+    # TEST-TIME AUGMENTATION
+    tta = imed_inference.get_tta(testing_params.get(ConfigKW.TEST_TIME_AUGMENTATION))
+    if tta is not None and model_params[ModelParamsKW.NAME] == ConfigKW.HEMIS_UNET:
+        raise ValueError("Test-time augmentation is not available for HeMIS models.")
+
     for i_monteCarlo in range(n_monteCarlo):
         preds_npy, gt_npy = run_inference(test_loader, model, model_params, testing_params, str(path_3Dpred),
-                                          cuda_available, i_monteCarlo, postprocessing)
+                                          cuda_available, i_monteCarlo, postprocessing, tta=tta)
         metric_mgr(preds_npy, gt_npy)
         # If uncertainty computation, don't apply it on last iteration for prediction
         if testing_params['uncertainty']['applied'] and (n_monteCarlo - 2 == i_monteCarlo):
@@ -90,7 +95,7 @@ def test(model_params, dataset_test, testing_params, path_output, device, cuda_a
 
 
 def run_inference(test_loader, model, model_params, testing_params, ofolder, cuda_available,
-                  i_monte_carlo=None, postprocessing=None):
+                  i_monte_carlo=None, postprocessing=None, tta=None):
     """Run inference on the test data and save results as nibabel files.
 
     Args:
@@ -102,6 +107,8 @@ def run_inference(test_loader, model, model_params, testing_params, ofolder, cud
         cuda_available (bool): If True, CUDA is available.
         i_monte_carlo (int): i_th Monte Carlo iteration.
         postprocessing (dict): Indicates postprocessing steps.
+        tta (TestTimeAugmentation): If not None, the augmented copies of each batch are predicted in the same forward
+            pass and averaged, see :class:`ivadomed.inference.TestTimeAugmentation`.
 
     Returns:
         ndarray, ndarray: Prediction, Ground-truth of shape n_sample, n_label, h, w, d.
@@ -138,13 +145,17 @@ def run_inference(test_loader, model, model_params, testing_params, ofolder, cud
                     if m.__class__.__name__.startswith('Dropout'):
                         m.train()
 
+            # TEST-TIME AUGMENTATION: the augmented copies are extra entries of the batch
+            model_inputs = input_samples if tta is None else \
+                imed_utils.cuda(tta.augment(batch["input"]), cuda_available)
+
             # RUN MODEL
             if model_params[ModelParamsKW.NAME] == ConfigKW.HEMIS_UNET or \
                     (ModelParamsKW.FILM_LAYERS in model_params and any(model_params[ModelParamsKW.FILM_LAYERS])):
                 metadata = get_metadata(batch["input_metadata"], model_params)
-                preds = model(input_samples, metadata)
+                preds = model(model_inputs, metadata if tta is None else tta.repeat(metadata))
             else:
-                preds = model(input_samples)
+                preds = model(model_inputs)
 
         if model_params[ModelParamsKW.NAME] == ConfigKW.HEMIS_UNET:
             # Reconstruct image with only one modality
@@ -164,7 +175,7 @@ def run_inference(test_loader, model, model_params, testing_params, ofolder, cud
                                                                              model_params[ModelParamsKW.METADATA])
 
         # PREDS TO CPU
-        preds_cpu = preds.cpu()
+        preds_cpu = preds.cpu() if tta is None else tta.merge(preds)
 
         task = imed_utils.get_task(model_params[ModelParamsKW.NAME])
         if task == "classification":
@@ -363,7 +374,7 @@ def threshold_analysis(model_path, ds_lst, model_params, testing_params, metric=
     loader = DataLoader(ConcatDataset(ds_lst), batch_size=testing_params["batch_size"],
                         shuffle=False, pin_memory=True, sampler=None,
                         collate_fn=imed_loader_utils.imed_collate,
-                        num_workers=0)
+                        **imed_loader_utils.get_dataloader_params(testing_params))
 
     # Run inference
     preds_npy, gt_npy = run_inference(loader, model, model_params,
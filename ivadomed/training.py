@@ -1,6 +1,10 @@
+import contextlib
 import copy
 import datetime
+import queue
 import random
+import shutil
+import threading
 import time
 import os
 import numpy as np
@@ -9,11 +13,12 @@ import torch.backends.cudnn as cudnn
 import wandb
 from loguru import logger
 from torch import optim
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, DistributedSampler
 from torch.utils.tensorboard import SummaryWriter
 from tqdm import tqdm
 from pathlib import Path
 
+from ivadomed import distributed as imed_distributed
 from ivadomed import losses as imed_losses
 from ivadomed import mixup as imed_mixup
 from ivadomed import metrics as imed_metrics
@@ -21,16 +26,21 @@ from ivadomed import models as imed_models
 from ivadomed import utils as imed_utils
 from ivadomed import visualize as imed_visualize
 from ivadomed.loader import utils as imed_loader_utils
-from ivadomed.loader.balanced_sampler import BalancedSampler
-from ivadomed.keywords import ModelParamsKW, ConfigKW, BalanceSamplesKW, TrainingParamsKW, MetadataKW, WandbKW
+from ivadomed.loader.balanced_sampler import BalancedSampler, DistributedBalancedSampler
+from ivadomed.keywords import ModelParamsKW, ConfigKW, BalanceSamplesKW, TrainingParamsKW, MetadataKW, WandbKW, \
+    AmpKW, ValidationSubsetKW, DistributedKW
 
 cudnn.benchmark = True
 
 
 def train(model_params, dataset_train, dataset_val, training_params, path_output, device, wandb_params=None,
-          cuda_available=True, metric_fns=None, n_gif=0, resume_training=False, debugging=False):
+          cuda_available=True, metric_fns=None, n_gif=0, resume_training=False, debugging=False, gpu_ids=None):
     """Main command to train the network.
 
+    If the ``distributed`` training parameter is applied, the training is run in several processes, see
+    :mod:`ivadomed.distributed`: each process trains on its shard of the datasets, and only the first one logs and saves
+    the training outputs.
+
     Args:
         model_params (dict): Model's parameters.
         dataset_train (imed_loader): Training dataset.
@@ -47,16 +57,39 @@ def train(model_params, dataset_train, dataset_val, training_params, path_output
                                 training. This training state is saved everytime a new best model is saved in the log
                                 directory.
         debugging (bool): If True, extended verbosity and intermediate outputs.
+        gpu_ids (list): GPU IDs of the processes of the distributed training. If None, ``device`` is used.
 
     Returns:
         float, float, float, float: best_training_dice, best_training_loss, best_validation_dice,
-            best_validation_loss.
+            best_validation_loss. The Dice losses are NaN if ``log_dice_loss`` is false and the loss is not the Dice
+            loss.
     """
+    # DISTRIBUTED
+    distributed_params = training_params.get(TrainingParamsKW.DISTRIBUTED, {})
+    if distributed_params.get(DistributedKW.APPLIED) and not imed_distributed.is_initialized():
+        gpu_ids = (gpu_ids or [device.index or 0]) if cuda_available else None
+        world_size = distributed_params.get(DistributedKW.WORLD_SIZE) or (len(gpu_ids) if cuda_available else 1)
+        logger.info(f"Distributed training in {world_size} processes.")
+        return imed_distributed.launch(train, world_size, backend=distributed_params.get(DistributedKW.BACKEND),
+                                       gpu_ids=gpu_ids,
+                                       args=(model_params, dataset_train, dataset_val, training_params, path_output,
+                                             device),
+                                       kwargs={'wandb_params': wandb_params, 'cuda_available': cuda_available,
+                                               'metric_fns': metric_fns, 'n_gif': n_gif,
+                                               'resume_training': resume_training, 'debugging': debugging})
+    distributed = imed_distributed.is_initialized()
+    # Only the first process logs and saves the training outputs
+    is_main = imed_distributed.is_main_process()
+    if distributed and cuda_available:
+        device = torch.device("cuda", torch.cuda.current_device())
+    if not is_main:
+        n_gif = 0
+
     # Write the metrics, images, etc to TensorBoard format
-    writer = SummaryWriter(log_dir=path_output)
+    writer = SummaryWriter(log_dir=path_output) if is_main else None
 
     # Enable wandb tracking  if the required params are found in the config file and the api key is correct
-    wandb_tracking = imed_utils.initialize_wandb(wandb_params)
+    wandb_tracking = is_main and imed_utils.initialize_wandb(wandb_params)
 
     if wandb_tracking:
         # Collect all hyperparameters into a dictionary
@@ -77,26 +110,42 @@ def train(model_params, dataset_train, dataset_val, training_params, path_output
     conditions = all([training_params[TrainingParamsKW.BALANCE_SAMPLES][BalanceSamplesKW.APPLIED],
                       model_params[ModelParamsKW.NAME] != "HeMIS"])
     sampler_train, shuffle_train = get_sampler(dataset_train, conditions,
-                                               training_params[TrainingParamsKW.BALANCE_SAMPLES][BalanceSamplesKW.TYPE])
+                                               training_params[TrainingParamsKW.BALANCE_SAMPLES][BalanceSamplesKW.TYPE],
+                                               distributed=distributed)
 
     train_loader = DataLoader(dataset_train, batch_size=training_params[TrainingParamsKW.BATCH_SIZE],
                               shuffle=shuffle_train, pin_memory=True, sampler=sampler_train,
                               collate_fn=imed_loader_utils.imed_collate,
-                              num_workers=0)
+                              **imed_loader_utils.get_dataloader_params(training_params))
 
     gif_dict = {"image_path": [], "slice_id": [], "gif": []}
     if dataset_val:
-        sampler_val, shuffle_val = get_sampler(dataset_val, conditions,
-                                               training_params[TrainingParamsKW.BALANCE_SAMPLES][BalanceSamplesKW.TYPE])
+        # Fixed subset of the validation dataset, stratified on the labels of the samples
+        subset_params = training_params.get(TrainingParamsKW.VALIDATION_SUBSET, {})
+        if subset_params.get(ValidationSubsetKW.APPLIED):
+            indexes_val = get_validation_subset(dataset_val, subset_params[ValidationSubsetKW.N_SAMPLES],
+                                                subset_params.get(ValidationSubsetKW.TYPE, "gt"),
+                                                subset_params.get(ValidationSubsetKW.RANDOM_SEED, 6))
+            logger.info(f"Validation on a subset of {len(indexes_val)} of the {len(dataset_val)} samples.")
+            dataset_val = torch.utils.data.Subset(dataset_val, indexes_val)
+
+        if training_params.get(TrainingParamsKW.VALIDATION_MAX_BATCHES) is not None:
+            # The first batches are validated: they must be the same at each epoch
+            sampler_val, shuffle_val = get_fixed_sampler(dataset_val, distributed=distributed), False
+        else:
+            sampler_val, shuffle_val = get_sampler(
+                dataset_val, conditions, training_params[TrainingParamsKW.BALANCE_SAMPLES][BalanceSamplesKW.TYPE],
+                distributed=distributed, shuffle=not distributed)
 
         val_loader = DataLoader(dataset_val, batch_size=training_params[TrainingParamsKW.BATCH_SIZE],
                                 shuffle=shuffle_val, pin_memory=True, sampler=sampler_val,
                                 collate_fn=imed_loader_utils.imed_collate,
-                                num_workers=0)
+                                **imed_loader_utils.get_dataloader_params(training_params))
 
         # Init GIF
         if n_gif > 0:
-            indexes_gif = random.sample(range(len(dataset_val)), n_gif)
+            # The GIF slices are validated by the current process
+            indexes_gif = random.sample(list(sampler_val) if distributed else range(len(dataset_val)), n_gif)
         for i_gif in range(n_gif):
             random_metadata = dict(dataset_val[indexes_gif[i_gif]][MetadataKW.INPUT_METADATA][0])
             gif_dict["image_path"].append(random_metadata[MetadataKW.INPUT_FILENAMES])
@@ -125,8 +174,34 @@ def train(model_params, dataset_train, dataset_val, training_params, path_output
     if cuda_available:
         model.cuda()
 
+    # MIXED PRECISION
+    amp_dtype, channels_last = get_amp_params(training_params.get(TrainingParamsKW.AMP, {}), cuda_available)
+    memory_format = get_memory_format(model_params) if channels_last else torch.contiguous_format
+    if channels_last:
+        model = model.to(memory_format=memory_format)
+    # Dynamic loss scaling, to avoid the underflow of the float16 gradients
+    scaler = torch.cuda.amp.GradScaler(enabled=amp_dtype == torch.float16)
+
+    # MEMORY
+    if training_params.get(TrainingParamsKW.ACTIVATION_CHECKPOINTING):
+        n_blocks = imed_models.set_activation_checkpointing(model)
+        logger.info(f"Activation checkpointing of {n_blocks} blocks.")
+    # Number of batches (micro-batches) whose gradients are accumulated before each optimizer step
+    accumulation_steps = training_params.get(TrainingParamsKW.GRADIENT_ACCUMULATION_STEPS, 1)
+    if accumulation_steps < 1:
+        raise ValueError(f"gradient_accumulation_steps must be a positive integer, got {accumulation_steps}.")
+    if accumulation_steps > 1:
+        logger.info(f"Gradient accumulation over {accumulation_steps} batches: effective batch size of "
+                    f"{accumulation_steps * training_params[TrainingParamsKW.BATCH_SIZE]}.")
+
     num_epochs = training_params["training_time"]["num_epochs"]
 
+    # VALIDATION
+    validation_frequency = training_params.get(TrainingParamsKW.VALIDATION_FREQUENCY, 1)
+    if validation_frequency < 1:
+        raise ValueError(f"validation_frequency must be a positive integer, got {validation_frequency}.")
+    validation_max_batches = training_params.get(TrainingParamsKW.VALIDATION_MAX_BATCHES)
+
     # OPTIMIZER
     initial_lr = training_params["scheduler"]["initial_lr"]
     # filter out the parameters you are going to fine-tuning
@@ -144,14 +219,22 @@ def train(model_params, dataset_train, dataset_val, training_params, path_output
 
     # Resume
     start_epoch = 1
+    val_loss_total_avg = None
     resume_path = Path(path_output, "checkpoint.pth.tar")
+    # The checkpoints are copied to the host, then written without stalling the training
+    checkpoint_writer = CheckpointWriter(resume_path,
+                                         keep_last=training_params.get(TrainingParamsKW.CHECKPOINT_KEEP_LAST, 1),
+                                         asynchronous=training_params.get(TrainingParamsKW.ASYNC_CHECKPOINT, True)) \
+        if is_main else None
+    best_state_dict = None
     if resume_training:
         model, optimizer, gif_dict, start_epoch, val_loss_total_avg, scheduler, patience_count = load_checkpoint(
             model=model,
             optimizer=optimizer,
             gif_dict=gif_dict,
             scheduler=scheduler,
-            fname=str(resume_path))
+            fname=str(resume_path),
+            scaler=scaler)
         # Individually transfer the optimizer parts
         # TODO: check if following lines are needed
         for state in optimizer.state.values():
@@ -159,33 +242,47 @@ def train(model_params, dataset_train, dataset_val, training_params, path_output
                 if torch.is_tensor(v):
                     state[k] = v.to(device)
 
+    # The model of the training is replicated in each process, and its gradients are averaged between the processes
+    ddp_model = imed_distributed.wrap_model(model, cuda_available) if distributed else model
+
     # LOSS
     logger.info("Selected Loss: {}".format(training_params["loss"]["name"]))
     logger.info("\twith the parameters: {}".format(
         [training_params["loss"][k] for k in training_params["loss"] if k != "name"]))
     loss_fct = get_loss_function(copy.copy(training_params["loss"]))
     loss_dice_fct = imed_losses.DiceLoss()  # For comparison when another loss is used
+    # The Dice loss is the loss itself with the default DiceLoss, otherwise its computation can be skipped
+    dice_loss_is_loss = training_params["loss"] == {"name": "DiceLoss"}
+    log_dice_loss = dice_loss_is_loss or training_params.get(TrainingParamsKW.LOG_DICE_LOSS, True)
 
     # INIT TRAINING VARIABLES
     best_training_dice, best_training_loss = float("inf"), float("inf")
     best_validation_loss, best_validation_dice = float("inf"), float("inf")
     patience_count = 0
     begin_time = time.time()
+    # The last epoch is always validated, to select the best model among all the validated epochs
+    last_epoch = start_epoch + num_epochs - 1
+    last_validation_epoch = start_epoch - 1
 
     # EPOCH LOOP
-    for epoch in tqdm(range(num_epochs), desc="Training", initial=start_epoch):
+    for epoch in tqdm(range(num_epochs), desc="Training", initial=start_epoch, disable=not is_main):
         epoch = epoch + start_epoch
         start_time = time.time()
+        if distributed:
+            # The training samples of the processes change at each epoch
+            sampler_train.set_epoch(epoch)
 
         lr = scheduler.get_last_lr()[0]
-        writer.add_scalar('learning_rate', lr, epoch)
+        if is_main:
+            writer.add_scalar('learning_rate', lr, epoch)
         if wandb_tracking:
             wandb.log({"learning_rate": lr})
 
         # Training loop -----------------------------------------------------------
-        model.train()
+        ddp_model.train()
         train_loss_total, train_dice_loss_total = 0.0, 0.0
         num_steps = 0
+        optimizer.zero_grad()
         for i, batch in enumerate(train_loader):
             # GET SAMPLES
             if model_params[ModelParamsKW.NAME] == ConfigKW.HEMIS_UNET:
@@ -198,30 +295,48 @@ def train(model_params, dataset_train, dataset_val, training_params, path_output
             if training_params["mixup_alpha"]:
                 input_samples, gt_samples = imed_mixup.mixup(input_samples, gt_samples, training_params["mixup_alpha"],
                                                              debugging and epoch == 1, path_output)
-
-            # RUN MODEL
-            if model_params[ModelParamsKW.NAME] == ConfigKW.HEMIS_UNET or \
-                    (ModelParamsKW.FILM_LAYERS in model_params and any(model_params[ModelParamsKW.FILM_LAYERS])):
-                metadata = get_metadata(batch[MetadataKW.INPUT_METADATA], model_params)
-                preds = model(input_samples, metadata)
-            else:
-                preds = model(input_samples)
-
-            # LOSS
-            loss = loss_fct(preds, gt_samples)
-            train_loss_total += loss.item()
-            train_dice_loss_total += loss_dice_fct(preds, gt_samples).item()
+            if channels_last and torch.is_tensor(input_samples):
+                input_samples = input_samples.contiguous(memory_format=memory_format)
+
+            # The gradients are averaged over the micro-batches of the step (fewer at the end of the epoch)
+            step_start = i - i % accumulation_steps
+            step_size = min(accumulation_steps, len(train_loader) - step_start)
+            is_step = i + 1 == step_start + step_size
+            # The gradients are only synchronised between the processes at the last micro-batch of the step, this is
+            # decided in the forward pass
+            no_sync = ddp_model.no_sync() if distributed and not is_step else contextlib.nullcontext()
+
+            with no_sync, autocast(amp_dtype, cuda_available):
+                # RUN MODEL
+                if model_params[ModelParamsKW.NAME] == ConfigKW.HEMIS_UNET or \
+                        (ModelParamsKW.FILM_LAYERS in model_params and any(model_params[ModelParamsKW.FILM_LAYERS])):
+                    metadata = get_metadata(batch[MetadataKW.INPUT_METADATA], model_params)
+                    preds = ddp_model(input_samples, metadata)
+                else:
+                    preds = ddp_model(input_samples)
+                # The losses are computed in float32, their reductions are not stable in half precision
+                preds = preds.float()
+
+                # LOSS
+                loss = loss_fct(preds, gt_samples)
+                # The losses are accumulated on the device, and only copied to the host at the end of the epoch
+                train_loss_total += loss.detach()
+                if log_dice_loss:
+                    train_dice_loss_total += loss.detach() if dice_loss_is_loss else \
+                        loss_dice_fct(preds.detach(), gt_samples)
 
             # UPDATE OPTIMIZER
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
-            if step_scheduler_batch:
-                scheduler.step()
+            scaler.scale(loss / step_size).backward()
+            if is_step:
+                scaler.step(optimizer)
+                scaler.update()
+                optimizer.zero_grad()
+                if step_scheduler_batch:
+                    scheduler.step()
             num_steps += 1
 
             # Save image at every 50th step if debugging is true
-            if i%50 == 0 and debugging:
+            if i%50 == 0 and debugging and is_main:
                 imed_visualize.save_img(writer, epoch, "Train", input_samples, gt_samples, preds,
                                                 wandb_tracking=wandb_tracking,
                                                 is_three_dim=not model_params[ModelParamsKW.IS_2D])
@@ -230,13 +345,16 @@ def train(model_params, dataset_train, dataset_val, training_params, path_output
             scheduler.step()
 
         # TRAINING LOSS
-        train_loss_total_avg = train_loss_total / num_steps
+        # Averaged over the batches of all the processes
+        train_loss_total_avg = imed_distributed.average(train_loss_total, num_steps)
         msg = "Epoch {} training loss: {:.4f}.".format(epoch, train_loss_total_avg)
-        train_dice_loss_total_avg = train_dice_loss_total / num_steps
-        if training_params["loss"]["name"] != "DiceLoss":
+        train_dice_loss_total_avg = imed_distributed.average(train_dice_loss_total, num_steps) if log_dice_loss \
+            else float("nan")
+        if training_params["loss"]["name"] != "DiceLoss" and log_dice_loss:
             msg += "\tDice training loss: {:.4f}.".format(train_dice_loss_total_avg)
         logger.info(msg)
-        tqdm.write(msg)
+        if is_main:
+            tqdm.write(msg)
 
         # CURRICULUM LEARNING
         if model_params[ModelParamsKW.NAME] == ConfigKW.HEMIS_UNET:
@@ -248,16 +366,21 @@ def train(model_params, dataset_train, dataset_val, training_params, path_output
         model.eval()
         val_loss_total, val_dice_loss_total = 0.0, 0.0
         num_steps = 0
-        metric_mgr = imed_metrics.MetricManager(metric_fns)
-        if dataset_val:
+        metric_mgr = imed_metrics.DeviceMetricManager(metric_fns,
+                                                      sync_steps=training_params.get(TrainingParamsKW.METRICS_SYNC_STEPS))
+        if dataset_val and (epoch % validation_frequency == 0 or epoch == last_epoch):
             for i, batch in enumerate(val_loader):
-                with torch.no_grad():
+                if validation_max_batches is not None and i >= validation_max_batches:
+                    break
+                with torch.no_grad(), autocast(amp_dtype, cuda_available):
                     # GET SAMPLES
                     if model_params[ModelParamsKW.NAME] == ConfigKW.HEMIS_UNET:
                         input_samples = imed_utils.cuda(imed_utils.unstack_tensors(batch["input"]), cuda_available)
                     else:
                         input_samples = imed_utils.cuda(batch["input"], cuda_available)
                     gt_samples = imed_utils.cuda(batch["gt"], cuda_available, non_blocking=True)
+                    if channels_last and torch.is_tensor(input_samples):
+                        input_samples = input_samples.contiguous(memory_format=memory_format)
 
                     # RUN MODEL
                     if model_params[ModelParamsKW.NAME] == ConfigKW.HEMIS_UNET or \
@@ -266,46 +389,49 @@ def train(model_params, dataset_train, dataset_val, training_params, path_output
                         preds = model(input_samples, metadata)
                     else:
                         preds = model(input_samples)
+                    preds = preds.float()
 
                     # LOSS
                     loss = loss_fct(preds, gt_samples)
-                    val_loss_total += loss.item()
-                    val_dice_loss_total += loss_dice_fct(preds, gt_samples).item()
+                    val_loss_total += loss
+                    if log_dice_loss:
+                        val_dice_loss_total += loss if dice_loss_is_loss else loss_dice_fct(preds, gt_samples)
 
-                    # Add frame to GIF
-                    for i_ in range(len(input_samples)):
-                        im, pr, met = input_samples[i_].cpu().numpy()[0], preds[i_].cpu().numpy()[0], \
-                                      batch[MetadataKW.INPUT_METADATA][i_][0]
+                    # Add frame to GIF, only the samples of the GIFs are copied to the host
+                    for i_ in range(len(input_samples) if n_gif > 0 else 0):
+                        met = batch[MetadataKW.INPUT_METADATA][i_][0]
                         for i_gif in range(n_gif):
                             if gif_dict["image_path"][i_gif] == met.__getitem__('input_filenames') and \
                                     gif_dict["slice_id"][i_gif] == met.__getitem__('slice_index'):
+                                im, pr = input_samples[i_].cpu().numpy()[0], preds[i_].cpu().numpy()[0]
                                 overlap = imed_visualize.overlap_im_seg(im, pr)
                                 gif_dict["gif"][i_gif].add(overlap, label=str(epoch))
 
                 num_steps += 1
 
                 # METRICS COMPUTATION
-                gt_npy = gt_samples.cpu().numpy()
-                preds_npy = preds.data.cpu().numpy()
-                metric_mgr(preds_npy, gt_npy)
+                metric_mgr(preds, gt_samples)
 
                 # Save image at every 10th step if debugging is true
-                if i%50 == 0 and debugging:
+                if i%50 == 0 and debugging and is_main:
                     imed_visualize.save_img(writer, epoch, "Validation", input_samples, gt_samples, preds,
                                             wandb_tracking=wandb_tracking, 
                                             is_three_dim=not model_params[ModelParamsKW.IS_2D])
 
             # METRICS COMPUTATION FOR CURRENT EPOCH
             val_loss_total_avg_old = val_loss_total_avg if epoch > 1 else None
+            if distributed:
+                metric_mgr.all_gather()
             metrics_dict = metric_mgr.get_results()
             metric_mgr.reset()
-            val_loss_total_avg = val_loss_total / num_steps
+            val_loss_total_avg = imed_distributed.average(val_loss_total, num_steps)
             # log losses on Tensorboard by default
-            writer.add_scalars('Validation/Metrics', metrics_dict, epoch)
-            writer.add_scalars('losses', {
-                'train_loss': train_loss_total_avg,
-                'val_loss': val_loss_total_avg,
-            }, epoch)
+            if is_main:
+                writer.add_scalars('Validation/Metrics', metrics_dict, epoch)
+                writer.add_scalars('losses', {
+                    'train_loss': train_loss_total_avg,
+                    'val_loss': val_loss_total_avg,
+                }, epoch)
             # log on wandb if the corresponding dictionary is provided
             if wandb_tracking:
                 wandb.log({"validation-metrics": metrics_dict})
@@ -314,8 +440,9 @@ def train(model_params, dataset_train, dataset_val, training_params, path_output
                     'val_loss': val_loss_total_avg,
                 }})
             msg = "Epoch {} validation loss: {:.4f}.".format(epoch, val_loss_total_avg)
-            val_dice_loss_total_avg = val_dice_loss_total / num_steps
-            if training_params["loss"]["name"] != "DiceLoss":
+            val_dice_loss_total_avg = imed_distributed.average(val_dice_loss_total, num_steps) if log_dice_loss \
+                else float("nan")
+            if training_params["loss"]["name"] != "DiceLoss" and log_dice_loss:
                 msg += "\tDice validation loss: {:.4f}.".format(val_dice_loss_total_avg)
             logger.info(msg)
             end_time = time.time()
@@ -325,42 +452,51 @@ def train(model_params, dataset_train, dataset_val, training_params, path_output
 
             # UPDATE BEST RESULTS
             if val_loss_total_avg < best_validation_loss:
-                # Save checkpoint
-                state = {'epoch': epoch + 1,
-                         'state_dict': model.state_dict(),
-                         'optimizer': optimizer.state_dict(),
-                         'gif_dict': gif_dict,
-                         'scheduler': scheduler,
-                         'patience_count': patience_count,
-                         'validation_loss': val_loss_total_avg}
-                torch.save(state, resume_path)
-
-                # Save best model file
-                model_path = Path(path_output, "best_model.pt")
-                torch.save(model, model_path)
+                # Save checkpoint, the best model file is saved from its state at the end of the training
+                if is_main:
+                    state = checkpoint_writer.save({'epoch': epoch + 1,
+                                                    'state_dict': model.state_dict(),
+                                                    'optimizer': optimizer.state_dict(),
+                                                    'scaler': scaler.state_dict(),
+                                                    'gif_dict': gif_dict,
+                                                    'scheduler': scheduler.state_dict(),
+                                                    'patience_count': patience_count,
+                                                    'validation_loss': val_loss_total_avg})
+                    best_state_dict = state['state_dict']
 
                 # Update best scores
                 best_validation_loss, best_training_loss = val_loss_total_avg, train_loss_total_avg
                 best_validation_dice, best_training_dice = val_dice_loss_total_avg, train_dice_loss_total_avg
 
             # EARLY STOPPING
-            if epoch > 1:
+            # Compared to the previous validation, the patience is counted in epochs whatever the validation frequency
+            if val_loss_total_avg_old is not None:
                 val_diff = (val_loss_total_avg_old - val_loss_total_avg) * 100 / abs(val_loss_total_avg)
                 if val_diff < training_params["training_time"]["early_stopping_epsilon"]:
-                    patience_count += 1
+                    patience_count += epoch - last_validation_epoch
                 if patience_count >= training_params["training_time"]["early_stopping_patience"]:
                     logger.info("Stopping training due to {} epochs without improvements".format(patience_count))
                     break
+            last_validation_epoch = epoch
+
+    if not is_main:
+        # The training outputs are saved by the first process
+        return best_training_dice, best_training_loss, best_validation_dice, best_validation_loss
 
     # Save final model
     final_model_path = Path(path_output, "final_model.pt")
     torch.save(model, final_model_path)
 
+    # Wait for the last checkpoint to be written
+    checkpoint_writer.close()
+
     # Save best model in output path
-    if resume_path.is_file():
-        state = torch.load(resume_path)
+    if best_state_dict is None and resume_path.is_file():
+        # No improvement since the training was resumed
+        best_state_dict = torch.load(resume_path, map_location='cpu')['state_dict']
+    if best_state_dict is not None:
         model_path = Path(path_output, "best_model.pt")
-        model.load_state_dict(state['state_dict'])
+        model.load_state_dict(best_state_dict)
         torch.save(model, model_path)
         # Save best model as ONNX in the model directory
         try:
@@ -401,23 +537,137 @@ def train(model_params, dataset_train, dataset_val, training_params, path_output
     return best_training_dice, best_training_loss, best_validation_dice, best_validation_loss
 
 
-def get_sampler(ds, balance_bool, metadata):
+def get_amp_params(params, cuda_available):
+    """Get the automatic mixed precision parameters.
+
+    Args:
+        params (dict): Mixed precision parameters: ``applied``, ``dtype`` ("float16" or "bfloat16", default: float16
+            on GPU and bfloat16 on CPU) and ``channels_last``.
+        cuda_available (bool): If True, CUDA is available.
+
+    Returns:
+        torch.dtype, bool: Data type of the operations run in autocast, None if mixed precision is not applied. If the
+            channels last memory format is used.
+    """
+    channels_last = bool(params.get(AmpKW.CHANNELS_LAST, False))
+    if not params.get(AmpKW.APPLIED, False):
+        return None, channels_last
+    if not hasattr(torch, 'autocast'):
+        raise RuntimeError("Mixed precision training requires torch>=1.10.")
+
+    dtype_name = params.get(AmpKW.DTYPE) or ("float16" if cuda_available else "bfloat16")
+    if dtype_name not in ["float16", "bfloat16"]:
+        raise ValueError(f"Unknown mixed precision data type: {dtype_name}, choose between 'float16' and 'bfloat16'.")
+    if dtype_name == "float16" and not cuda_available:
+        logger.warning("Mixed precision with float16 is not available on CPU, bfloat16 is used instead.")
+        dtype_name = "bfloat16"
+    logger.info(f"Mixed precision training with {dtype_name}{', channels last' if channels_last else ''}.")
+    return getattr(torch, dtype_name), channels_last
+
+
+def autocast(dtype, cuda_available):
+    """Get the context manager running the operations of a model in mixed precision.
+
+    Args:
+        dtype (torch.dtype): Data type of the operations run in autocast, see get_amp_params. If None, the
+            operations run in float32.
+        cuda_available (bool): If True, CUDA is available.
+
+    Returns:
+        Context manager.
+    """
+    if dtype is None:
+        return contextlib.nullcontext()
+    return torch.autocast(device_type='cuda' if cuda_available else 'cpu', dtype=dtype)
+
+
+def get_memory_format(model_params):
+    """Get the channels last memory format of the inputs and the convolution weights of a model.
+
+    Args:
+        model_params (dict): Model's parameters.
+
+    Returns:
+        torch.memory_format: channels_last for 2D models, channels_last_3d for 3D models.
+    """
+    return torch.channels_last if model_params.get(ModelParamsKW.IS_2D, True) else torch.channels_last_3d
+
+
+def get_sampler(ds, balance_bool, metadata, distributed=False, shuffle=True):
     """Get sampler.
 
     Args:
         ds (BidsDataset): BidsDataset object.
         balance_bool (bool): If True, a sampler is generated that balance positive and negative samples.
+        metadata (str): Indicates which metadata to use to balance the sampler.
+        distributed (bool): If True, the sampler only draws the samples of the current process of the distributed
+            training.
+        shuffle (bool): If False, the samples of the distributed training are not shuffled.
 
     Returns:
         If balance_bool is True: Returns BalancedSampler, Bool: Sampler and boolean for shuffling (set to False).
+        If distributed: Returns DistributedBalancedSampler or DistributedSampler, and False.
         Otherwise: Returns None and True.
     """
+    if distributed:
+        if balance_bool:
+            return DistributedBalancedSampler(ds, metadata), False
+        return DistributedSampler(ds, shuffle=shuffle), False
     if balance_bool:
         return BalancedSampler(ds, metadata), False
     else:
         return None, True
 
 
+def get_fixed_sampler(ds, distributed=False, random_seed=6):
+    """Get a sampler drawing the samples in the same random order at each iteration, without balancing.
+
+    Args:
+        ds (BidsDataset): BidsDataset object.
+        distributed (bool): If True, the sampler only draws the samples of the current process of the distributed
+            training.
+        random_seed (int): Seed of the order of the samples.
+
+    Returns:
+        DistributedSampler or list: Sampler, or list of the indexes of the samples in their order.
+    """
+    if distributed:
+        # The order only changes with set_epoch, which is not called
+        return DistributedSampler(ds, shuffle=True, seed=random_seed)
+    return torch.randperm(len(ds), generator=torch.Generator().manual_seed(random_seed)).tolist()
+
+
+def get_validation_subset(ds, n_samples, metadata="gt", random_seed=6):
+    """Select a fixed subset of a dataset, stratified on the labels of the samples.
+
+    The samples are labelled as in :class:`ivadomed.loader.balanced_sampler.BalancedSampler`: empty or non-empty ground
+    truth, or value of a metadata. Each label is represented in proportion to its frequency in the dataset.
+
+    Args:
+        ds (BidsDataset): BidsDataset object.
+        n_samples (int): Number of samples of the subset.
+        metadata (str): Indicates which metadata to use to label the samples.
+        random_seed (int): Seed of the selection, the subset is the same for a given dataset and seed.
+
+    Returns:
+        list: Sorted indexes of the samples of the subset.
+    """
+    if n_samples >= len(ds):
+        return list(range(len(ds)))
+    labels = np.array(BalancedSampler(ds, metadata).labels)
+    label_values, counts = np.unique(labels, return_counts=True)
+    # Largest remainder allocation of the samples to the labels
+    quotas = counts * n_samples / len(labels)
+    n_samples_label = np.floor(quotas).astype(int)
+    order = np.argsort(n_samples_label - quotas, kind="stable")
+    n_samples_label[order[:n_samples - n_samples_label.sum()]] += 1
+
+    rng = np.random.RandomState(random_seed)
+    indexes = [rng.choice(np.flatnonzero(labels == label), n, replace=False)
+               for label, n in zip(label_values, n_samples_label)]
+    return sorted(np.concatenate(indexes).tolist())
+
+
 def get_scheduler(params, optimizer, num_epochs=0):
     """Get scheduler.
 
@@ -491,7 +741,124 @@ def get_metadata(metadata, model_params):
                 for k in range(len(metadata))]
 
 
-def load_checkpoint(model, optimizer, gif_dict, scheduler, fname):
+def to_cpu(obj):
+    """Copy the tensors of a (nested) state to the host.
+
+    The tensors are copied even if they already are on the host, and the other objects are deep copied: the copy is not
+    modified by the training.
+
+    Args:
+        obj: Tensor, or dict, list or tuple of tensors and other objects, e.g. the state dict of a model or optimizer.
+
+    Returns:
+        Copy of obj, with its tensors on the host.
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: to_cpu(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(to_cpu(value) for value in obj)
+    return copy.deepcopy(obj)
+
+
+class CheckpointWriter:
+    """Write training checkpoints in a background thread.
+
+    A checkpoint is copied to the host when it is saved, then written while the training goes on. It is written to a
+    temporary file first and renamed once complete, so that the checkpoint file is never partially written. The previous
+    checkpoints are kept as ``<fname>.1`` (most recent), ``<fname>.2``, etc. The checkpoint file is replaced last, so
+    that it is never missing if the training is interrupted while the checkpoints are rotated.
+
+    Args:
+        fname (str): Checkpoint filename.
+        keep_last (int): Number of checkpoints kept, including the last one.
+        asynchronous (bool): If False, the checkpoints are written by :meth:`save` itself.
+        max_pending (int): Number of checkpoints waiting to be written, beyond which :meth:`save` waits for the writes.
+
+    Attributes:
+        fname (Path): Checkpoint filename.
+        keep_last (int): Number of checkpoints kept, including the last one.
+        error (Exception): First error raised by the background thread, raised again by :meth:`save` or :meth:`close`.
+    """
+
+    def __init__(self, fname, keep_last=1, asynchronous=True, max_pending=1):
+        if keep_last < 1:
+            raise ValueError(f"checkpoint_keep_last must be a positive integer, got {keep_last}.")
+        self.fname = Path(fname)
+        self.keep_last = keep_last
+        self.error = None
+        self.queue = queue.Queue(maxsize=max_pending) if asynchronous else None
+        self.thread = None
+        if asynchronous:
+            self.thread = threading.Thread(target=self._run, name="CheckpointWriter", daemon=True)
+            self.thread.start()
+
+    def save(self, state):
+        """Copy a checkpoint to the host and write it.
+
+        Args:
+            state (dict): Checkpoint, e.g. with the state dicts of the model and of the optimizer.
+
+        Returns:
+            dict: Copy of the checkpoint on the host, which is written.
+        """
+        self._raise_error()
+        state = to_cpu(state)
+        if self.queue is None:
+            self._write(state)
+        else:
+            self.queue.put(state)
+        return state
+
+    def close(self):
+        """Wait for the pending checkpoints to be written and stop the background thread."""
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self._raise_error()
+
+    def get_fname(self, index=0):
+        """Return the filename of a checkpoint: 0 for the last one, 1 for the previous one, etc."""
+        return self.fname if index == 0 else self.fname.with_name(f"{self.fname.name}.{index}")
+
+    def _run(self):
+        while True:
+            state = self.queue.get()
+            if state is None:
+                break
+            try:
+                self._write(state)
+            except Exception as e:
+                self.error = self.error or e
+
+    def _write(self, state):
+        fname_tmp = self.fname.with_name(self.fname.name + ".tmp")
+        with open(fname_tmp, 'wb') as f:
+            torch.save(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        for index in range(self.keep_last - 1, 1, -1):
+            if self.get_fname(index - 1).is_file():
+                os.replace(self.get_fname(index - 1), self.get_fname(index))
+        if self.keep_last > 1 and self.fname.is_file():
+            # The previous checkpoint is linked (or copied) rather than renamed: the checkpoint file stays in place
+            fname_previous = self.get_fname(1)
+            if fname_previous.is_file():
+                fname_previous.unlink()
+            try:
+                os.link(self.fname, fname_previous)
+            except OSError:
+                shutil.copyfile(self.fname, fname_previous)
+        os.replace(fname_tmp, self.fname)
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError(f"Failed to write the checkpoint '{self.fname}'.") from error
+
+
+def load_checkpoint(model, optimizer, gif_dict, scheduler, fname, scaler=None):
     """Load checkpoint.
 
     This function check if a checkpoint is available. If so, it updates the state of the input objects.
@@ -502,6 +869,8 @@ def load_checkpoint(model, optimizer, gif_dict, scheduler, fname):
         gif_dict (dict): Dictionary containing a GIF of the training.
         scheduler (_LRScheduler): Learning rate scheduler.
         fname (str): Checkpoint filename.
+        scaler (torch.cuda.amp.GradScaler): Loss scaler of mixed precision training, updated in place if its state is
+            in the checkpoint.
 
     Return:
         nn.Module, torch, dict, int, float, _LRScheduler, int
@@ -516,9 +885,15 @@ def load_checkpoint(model, optimizer, gif_dict, scheduler, fname):
         model.load_state_dict(checkpoint['state_dict'])
         optimizer.load_state_dict(checkpoint['optimizer'])
         validation_loss = checkpoint['validation_loss']
-        scheduler = checkpoint['scheduler']
+        if isinstance(checkpoint['scheduler'], dict):
+            scheduler.load_state_dict(checkpoint['scheduler'])
+        else:
+            # The checkpoints of previous versions store the scheduler object
+            scheduler = checkpoint['scheduler']
         gif_dict = checkpoint['gif_dict']
         patience_count = checkpoint['patience_count']
+        if scaler is not None and 'scaler' in checkpoint:
+            scaler.load_state_dict(checkpoint['scaler'])
         logger.info("... Resume training from epoch #{}".format(start_epoch))
     except:
         logger.warning("\nNo checkpoint found at: {}".format(fname))
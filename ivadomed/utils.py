@@ -117,31 +117,108 @@ def generate_sha_256(context: dict, df, file_lst: List[str]) -> None:
         # so df_sub is the row with matching filename=file
         df_sub = df.loc[df['filename'] == file]
         file_path = df_sub['path'].values[0]
-        sha256_hash = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-            context[ConfigKW.TRAINING_SHA256][file] = sha256_hash.hexdigest()
+        context[ConfigKW.TRAINING_SHA256][file] = get_file_sha256(file_path)
 
 
-def save_onnx_model(model, inputs, model_path):
+def get_file_sha256(file_path: str) -> str:
+    """Compute the sha256 of a file content.
+
+    Args:
+        file_path (str): Path of the file.
+
+    Returns:
+        str: Hexadecimal sha256 digest.
+    """
+    sha256_hash = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for byte_block in iter(lambda: f.read(4096), b""):
+            sha256_hash.update(byte_block)
+    return sha256_hash.hexdigest()
+
+
+def get_dynamic_axes(n_dims: int) -> dict:
+    """Return the names of the dynamic axes of a tensor of an exported ONNX model: batch, channels and spatial axes.
+
+    Args:
+        n_dims (int): Number of dimensions of the tensor.
+
+    Returns:
+        dict: Name of each axis.
+    """
+    axes_names = ['batch', 'num_channels', 'height', 'width', 'depth']
+    return {axis: axes_names[axis] for axis in range(min(n_dims, len(axes_names)))}
+
+
+def save_onnx_model(model, inputs, model_path, opset_version=11, check_parity=False, rtol=1e-3, atol=1e-5):
     """Convert PyTorch model to ONNX model and save it as `model_path`.
 
+    The batch and spatial axes of the input and the output are exported as dynamic axes: the ONNX model runs on batches
+    of any size and on inputs of any spatial size supported by the model, not only on the shape of `inputs`.
+
     Args:
         model (nn.Module): PyTorch model.
         inputs (Tensor): Tensor, used to inform shape and axes.
         model_path (str): Output filename for the ONNX model.
+        opset_version (int): ONNX opset version of the exported model.
+        check_parity (bool): If True, the outputs of the ONNX model are compared to the outputs of the PyTorch model,
+            see check_onnx_parity.
+        rtol (float): Relative tolerance of the parity check.
+        atol (float): Absolute tolerance of the parity check.
     """
     import torch
     model.eval()
-    dynamic_axes = {0: 'batch', 1: 'num_channels', 2: 'height', 3: 'width', 4: 'depth'}
-    if len(inputs.shape) == 4:
-        del dynamic_axes[4]
+    with torch.no_grad():
+        n_dims_output = model(inputs).dim()
     torch.onnx.export(model, inputs, model_path,
-                      opset_version=11,
+                      opset_version=opset_version,
                       input_names=['input'],
                       output_names=['output'],
-                      dynamic_axes={'input': dynamic_axes, 'output': dynamic_axes})
+                      dynamic_axes={'input': get_dynamic_axes(inputs.dim()),
+                                    'output': get_dynamic_axes(n_dims_output)})
+    if check_parity:
+        max_diff = check_onnx_parity(model, model_path, inputs, rtol=rtol, atol=atol)
+        logger.info(f"ONNX model matches the PyTorch model, maximum absolute difference: {max_diff:.2e}.")
+
+
+def check_onnx_parity(model, model_path, inputs, rtol=1e-3, atol=1e-5):
+    """Check that an exported ONNX model gives the same outputs as the PyTorch model, with ONNX Runtime on CPU.
+
+    The models are compared on `inputs`, and on a random batch with one more sample and 16 more voxels along each
+    spatial axis, to check the dynamic axes: a shape frozen at export time fails the check.
+
+    Args:
+        model (nn.Module): PyTorch model.
+        model_path (str): Filename of the ONNX model.
+        inputs (Tensor): Tensor used for the export.
+        rtol (float): Relative tolerance.
+        atol (float): Absolute tolerance.
+
+    Returns:
+        float: Maximum absolute difference between the outputs.
+
+    Raises:
+        RuntimeError: If the outputs differ, or if the ONNX model fails on the batch of a different shape.
+    """
+    import onnxruntime
+    import torch
+    model.eval()
+    session = onnxruntime.InferenceSession(str(model_path), providers=['CPUExecutionProvider'])
+    shape_other = (inputs.shape[0] + 1, inputs.shape[1]) + tuple(size + 16 for size in inputs.shape[2:])
+    max_diff = 0.
+    for inputs_check in [inputs, torch.randn(shape_other, dtype=inputs.dtype, device=inputs.device)]:
+        with torch.no_grad():
+            output_pt = model(inputs_check).cpu().numpy()
+        try:
+            output_onnx = session.run(None, {session.get_inputs()[0].name: inputs_check.cpu().numpy()})[0]
+        except Exception as err:
+            raise RuntimeError(f"ONNX model {model_path} fails on inputs of shape {tuple(inputs_check.shape)}: "
+                               f"{err}") from err
+        if output_onnx.shape != output_pt.shape or not np.allclose(output_onnx, output_pt, rtol=rtol, atol=atol):
+            diff = np.abs(output_onnx - output_pt).max() if output_onnx.shape == output_pt.shape else np.inf
+            raise RuntimeError(f"ONNX model {model_path} differs from the PyTorch model on inputs of shape "
+                               f"{tuple(inputs_check.shape)}: maximum absolute difference {diff:.2e}.")
+        max_diff = max(max_diff, float(np.abs(output_onnx - output_pt).max()))
+    return max_diff
 
 
 def define_device(gpu_id):
@@ -40,6 +40,10 @@ extra_requirements = {
     'contrib': [
         'pre-commit>=2.10.1',
         'flake8',
+    ],
+    'quantization': [
+        'onnx',
+        'onnxconverter-common',
     ]
 }
 
@@ -80,7 +84,10 @@ setup(
             'ivadomed_extract_small_dataset=ivadomed.scripts.extract_small_dataset:main',
             'ivadomed_download_data=ivadomed.scripts.download_data:main',
             'ivadomed_training_curve=ivadomed.scripts.training_curve:main',
-            'ivadomed_visualize_and_compare_testing_models=ivadomed.scripts.visualize_and_compare_testing_models:main'
+            'ivadomed_visualize_and_compare_testing_models=ivadomed.scripts.visualize_and_compare_testing_models:main',
+            'ivadomed_segment_daemon=ivadomed.scripts.segment_daemon:main',
+            'ivadomed_benchmark_onnx=ivadomed.scripts.benchmark_onnx:main',
+            'ivadomed_quantize_model=ivadomed.scripts.quantize_model:main'
         ],
     },
 )
@@ -0,0 +1,44 @@
+import json
+import logging
+import torch
+from pathlib import Path
+from ivadomed import models as imed_models
+from ivadomed import utils as imed_utils
+from ivadomed.scripts import benchmark_onnx
+from testing.functional_tests.t_utils import create_tmp_dir, __tmp_dir__
+from testing.common_testing_util import remove_tmp_dir
+
+logger = logging.getLogger(__name__)
+
+PATH_MODEL = Path(__tmp_dir__, "model_test")
+
+
+def setup_function():
+    create_tmp_dir(copy_data_testing_dir=False)
+
+
+def test_benchmark_onnx():
+    model = imed_models.Unet(in_channel=1, out_channel=1, depth=2)
+    PATH_MODEL.mkdir(parents=True, exist_ok=True)
+    torch.save(model, Path(PATH_MODEL, "model_test.pt"))
+    imed_utils.save_onnx_model(model, torch.randn(1, 1, 64, 64), str(Path(PATH_MODEL, "model_test.onnx")))
+    with open(Path(PATH_MODEL, "model_test.json"), 'w') as fp:
+        json.dump({"default_model": {"name": "Unet", "is_2d": True}}, fp)
+
+    results = benchmark_onnx.benchmark_onnx(str(PATH_MODEL), batch_size=2, size=[64, 48], n_repeats=2)
+    assert list(results) == ['pytorch', 'onnxruntime_session', 'onnxruntime_engine']
+    for result in results.values():
+        assert result['median'] > 0 and result['max_abs_diff'] < 1e-3
+
+
+def test_benchmark_onnx_main():
+    model = imed_models.Unet(in_channel=1, out_channel=1, depth=2)
+    PATH_MODEL.mkdir(parents=True, exist_ok=True)
+    imed_utils.save_onnx_model(model, torch.randn(1, 1, 64, 64), str(Path(PATH_MODEL, "model_test.onnx")))
+    with open(Path(PATH_MODEL, "model_test.json"), 'w') as fp:
+        json.dump({"default_model": {"name": "Unet", "is_2d": True, "length_2D": [32, 32]}}, fp)
+    benchmark_onnx.main(args=['-m', str(PATH_MODEL), '-r', '1', '-t', '1'])
+
+
+def teardown_function():
+    remove_tmp_dir()
@@ -20,6 +20,18 @@ def test_convert_to_onnx(download_functional_test_files):
     assert Path(__data_testing_dir__, 'spinegeneric_model.onnx').exists()
 
 
+def test_convert_to_onnx_options(download_functional_test_files):
+    convert_to_onnx.main(args=['-m', f'{__model_path__}', '-d', '2', '-s', '64', '80', '--opset', '13',
+                               '--optimization-level', 'basic'])
+    assert Path(__data_testing_dir__, 'spinegeneric_model.onnx').exists()
+    assert Path(__data_testing_dir__, 'spinegeneric_model_optimized.onnx').exists()
+
+
+def test_convert_to_onnx_wrong_size(download_functional_test_files):
+    with pytest.raises(ValueError, match=r"must have 2 values"):
+        convert_to_onnx.main(args=['-m', f'{__model_path__}', '-d', '2', '-s', '64', '64', '64'])
+
+
 def test_convert_to_onnx_no_model():
     with pytest.raises(ArgParseException, match=r"Error parsing args"):
         convert_to_onnx.main(args=['-d', '2'])
@@ -0,0 +1,68 @@
+import json
+import logging
+import pytest
+import torch
+from pathlib import Path
+from ivadomed import models as imed_models
+from ivadomed.scripts import quantize_model
+from testing.functional_tests.t_utils import create_tmp_dir, __data_testing_dir__, __tmp_dir__, \
+    download_functional_test_files
+from testing.common_testing_util import remove_tmp_dir
+
+logger = logging.getLogger(__name__)
+
+PATH_MODEL = Path(__tmp_dir__, "model_test")
+
+
+def setup_function():
+    create_tmp_dir()
+
+
+def _create_model_folder():
+    model = imed_models.Unet(in_channel=1, out_channel=1, depth=2, dropout_rate=0.3, bn_momentum=0.1)
+    PATH_MODEL.mkdir(parents=True, exist_ok=True)
+    torch.save(model, Path(PATH_MODEL, "model_test.pt"))
+    config = {
+        "loader_parameters": {
+            "path_data": [__data_testing_dir__],
+            "target_suffix": ["_seg-manual"],
+            "contrast_params": {
+                "training_validation": ["T1w", "T2w"],
+                "testing": ["T1w", "T2w"],
+                "balance": {}
+            },
+            "slice_axis": "axial"
+        },
+        "transformation": {
+            "Resample": {"wspace": 0.75, "hspace": 0.75},
+            "CenterCrop": {"size": [48, 48]},
+            "NumpyToTensor": {},
+            "NormalizeInstance": {"applied_to": ["im"]}
+        },
+        "default_model": {"name": "Unet", "dropout_rate": 0.3, "bn_momentum": 0.1, "depth": 2, "is_2d": True}
+    }
+    with open(Path(PATH_MODEL, "model_test.json"), 'w') as fp:
+        json.dump(config, fp)
+
+
+@pytest.mark.parametrize('method', ['dynamic', 'static'])
+def test_quantize_model(download_functional_test_files, method):
+    pytest.importorskip("onnx")
+    _create_model_folder()
+    results = quantize_model.quantize_model(str(PATH_MODEL), method=method, n_calibration=4, n_validation=4)
+    assert Path(results['fname_quantized']) == Path(PATH_MODEL, "model_test_int8.onnx")
+    assert Path(results['fname_quantized']).is_file()
+    assert results['quantized']['size_mb'] < results['onnx_fp32']['size_mb']
+    for backend in ['pytorch', 'onnx_fp32', 'quantized']:
+        assert results[backend]['latency'] > 0
+        assert 'dice_delta' in results[backend]
+
+
+def test_quantize_model_no_pt():
+    PATH_MODEL.mkdir(parents=True, exist_ok=True)
+    with pytest.raises(FileNotFoundError, match=r"PyTorch model not found"):
+        quantize_model.main(args=['-m', str(PATH_MODEL)])
+
+
+def teardown_function():
+    remove_tmp_dir()
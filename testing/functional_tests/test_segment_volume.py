@@ -1,11 +1,14 @@
+import io
 import json
 import shutil
+import threading
 import nibabel as nib
 import numpy as np
 import pytest
 import torch
 from ivadomed import models as imed_models
 from ivadomed import inference as imed_inference
+from ivadomed.scripts import segment_daemon
 from testing.functional_tests.t_utils import create_tmp_dir, __data_testing_dir__, __tmp_dir__, download_functional_test_files
 from testing.common_testing_util import remove_tmp_dir
 from pathlib import Path
@@ -133,6 +136,57 @@ def test_segment_volume_2d(download_functional_test_files):
     shutil.rmtree(PATH_MODEL)
 
 
+def test_segment_volume_2d_object_detection_prior(download_functional_test_files):
+    model = imed_models.Unet(in_channel=1,
+                             out_channel=1,
+                             depth=2,
+                             dropout_rate=DROPOUT,
+                             bn_momentum=BN)
+
+    if not PATH_MODEL.exists():
+        PATH_MODEL.mkdir(parents=True, exist_ok=True)
+
+    torch.save(model, Path(PATH_MODEL, "model_test.pt"))
+    config = {
+        "loader_parameters": {
+            "slice_filter_params": {
+                "filter_empty_mask": False,
+                "filter_empty_input": False
+            },
+            "roi_params": {
+                "suffix": None,
+                "slice_filter_roi": None
+            },
+            "slice_axis": "axial"
+        },
+        # The bounding box of the prior is stored in the metadata of each image
+        "object_detection_params": {
+            "object_detection_path": "object_detection",
+            "safety_factor": [1.0, 1.0, 1.0]
+        },
+        "transformation": {
+            "NormalizeInstance": {"applied_to": ["im"]}
+        },
+        "postprocessing": {},
+        "training_parameters": {
+            "batch_size": BATCH_SIZE
+        }
+    }
+
+    PATH_CONFIG = Path(PATH_MODEL, 'model_test.json')
+    with PATH_CONFIG.open(mode='w') as fp:
+        json.dump(config, fp)
+
+    nib_lst, _ = imed_inference.segment_volume(str(PATH_MODEL), [str(PATH_IMAGE)],
+                                               options={'fname_prior': str(PATH_ROI), 'pixel_size': [0.5, 0.5],
+                                                        'pixel_size_units': 'mm'})
+    nib_img = nib_lst[0]
+    assert np.squeeze(nib_img.get_fdata()).shape == nib.load(PATH_IMAGE).shape
+    assert (nib_img.dataobj.max() <= 1.0) and (nib_img.dataobj.min() >= 0.0)
+
+    shutil.rmtree(PATH_MODEL)
+
+
 def test_segment_volume_2d_no_prepro_transform(download_functional_test_files):
     model = imed_models.Unet(in_channel=1,
                              out_channel=1,
@@ -367,6 +421,94 @@ def test_segment_volume_3d(download_functional_test_files, center_crop):
     shutil.rmtree(PATH_MODEL)
 
 
+def test_segmenter(download_functional_test_files):
+    model = imed_models.Unet(in_channel=1,
+                             out_channel=1,
+                             depth=2,
+                             dropout_rate=DROPOUT,
+                             bn_momentum=BN)
+
+    if not PATH_MODEL.exists():
+        PATH_MODEL.mkdir()
+
+    torch.save(model, Path(PATH_MODEL, "model_test.pt"))
+    config = {
+        "loader_parameters": {
+            "slice_filter_params": {
+                "filter_empty_mask": False,
+                "filter_empty_input": False
+            },
+            "roi_params": {
+                "suffix": None,
+                "slice_filter_roi": None
+            },
+            "slice_axis": "axial"
+        },
+        "transformation": {
+            "NormalizeInstance": {"applied_to": ["im"]}
+        },
+        "postprocessing": {},
+        "training_parameters": {
+            # Batches spanning several subjects
+            "batch_size": 3
+        }
+    }
+
+    PATH_CONFIG = Path(PATH_MODEL, 'model_test.json')
+    with PATH_CONFIG.open(mode='w') as fp:
+        json.dump(config, fp)
+
+    nib_lst, _ = imed_inference.segment_volume(str(PATH_MODEL), [str(PATH_IMAGE)])
+
+    # Same predictions from a filename and from an image in memory, with the model loaded once
+    segmenter = imed_inference.Segmenter(str(PATH_MODEL))
+    for image in [str(PATH_IMAGE), nib.load(PATH_IMAGE)]:
+        nib_lst_segmenter, _ = segmenter.segment([image])
+        assert np.allclose(nib_lst_segmenter[0].get_fdata(), nib_lst[0].get_fdata())
+    assert len(segmenter.metrics) == 2
+    assert set(segmenter.get_metrics_summary()) == {'load', 'inference', 'reconstruction', 'write', 'total'}
+
+    # Several subjects in a single pass, each prediction being yielded once the subject is completed
+    images_list = [[str(PATH_IMAGE)], [nib.load(PATH_IMAGE)], [str(PATH_IMAGE)]]
+    results = list(segmenter.segment_subjects(images_list))
+    assert sorted(subject_index for subject_index, _, _ in results) == [0, 1, 2]
+    for _, nib_lst_subject, _ in results:
+        assert np.allclose(nib_lst_subject[0].get_fdata(), nib_lst[0].get_fdata())
+    assert len(segmenter.metrics) == 3
+
+    # Pipelined: datasets of 2 subjects loaded ahead, predictions reconstructed and written by 2 threads
+    written = {}
+    results = list(segmenter.segment_subjects(images_list, subjects_per_dataset=2, num_workers=2,
+                                              write_fn=lambda i, pred_list, _: written.update({i: pred_list})))
+    assert sorted(written) == sorted(subject_index for subject_index, _, _ in results) == [0, 1, 2]
+    for nib_lst_subject in written.values():
+        assert np.allclose(nib_lst_subject[0].get_fdata(), nib_lst[0].get_fdata())
+    assert all(segmenter.metrics[-1][stage] > 0 for stage in ['load', 'inference', 'reconstruction', 'write'])
+
+    # Closing the pipeline early stops the thread loading the next datasets
+    n_threads = threading.active_count()
+    results = segmenter.segment_subjects(images_list * 2, subjects_per_dataset=1)
+    next(results)
+    results.close()
+    assert threading.active_count() == n_threads
+
+    # Daemon mode: one request per line, one JSON result per line
+    path_output = Path(__tmp_dir__, "daemon_output")
+    stream_in = io.StringIO(f"{PATH_IMAGE}\n"
+                            f"{json.dumps({'images': [str(PATH_IMAGE)], 'path_output': str(path_output)})}\n"
+                            f"missing_image.nii.gz\n")
+    stream_out = io.StringIO()
+    segment_daemon.run_daemon(segmenter, stream_in, stream_out)
+    results = [json.loads(line) for line in stream_out.getvalue().splitlines()]
+    assert len(results) == 3
+    assert Path(results[1]['predictions'][0]) == Path(path_output, "sub-unf01_T1w_class-0_pred.nii.gz")
+    assert np.allclose(nib.load(results[1]['predictions'][0]).get_fdata(), nib_lst[0].get_fdata())
+    assert 'error' in results[2]
+
+    Path(results[0]['predictions'][0]).unlink()
+    shutil.rmtree(PATH_MODEL)
+
+
 def teardown_function():
     remove_tmp_dir()
 
@@ -0,0 +1,57 @@
+import json
+import logging
+import os
+import pytest
+from pytest_console_scripts import script_runner
+from pathlib import Path
+from testing.functional_tests.t_utils import __tmp_dir__, create_tmp_dir, __data_testing_dir__, \
+    download_functional_test_files
+from testing.common_testing_util import remove_tmp_dir
+from ivadomed import config_manager as imed_config_manager
+from ivadomed.keywords import ConfigKW, TrainingParamsKW, DistributedKW
+
+
+logger = logging.getLogger(__name__)
+
+
+def setup_function():
+    create_tmp_dir()
+
+
+@pytest.mark.script_launch_mode('subprocess')
+def test_training_distributed_cpu(download_functional_test_files, script_runner):
+
+    # Load automate training config as context
+    file_config = os.path.join(__data_testing_dir__, 'automate_training_config.json')
+    context = imed_config_manager.ConfigurationManager(file_config).get_config()
+
+    # Train in 2 processes on the CPU
+    context[ConfigKW.TRAINING_PARAMETERS][TrainingParamsKW.DISTRIBUTED] = {
+        DistributedKW.APPLIED: True,
+        DistributedKW.WORLD_SIZE: 2,
+        DistributedKW.BACKEND: "gloo"
+    }
+    context[ConfigKW.TRAINING_PARAMETERS]["training_time"]["num_epochs"] = 2
+
+    # Write temporary config file for given test
+    file_config_updated = os.path.join(__tmp_dir__, "data_functional_testing", "config_distributed_training.json")
+    with Path(file_config_updated).open(mode='w') as fp:
+        json.dump(context, fp, indent=4)
+
+    # Set output directory
+    __output_dir__ = Path(__tmp_dir__, 'results')
+
+    # Run ivadomed
+    ret = script_runner.run('ivadomed', '-c', f'{file_config_updated}',
+                            '--path-data', f'{__data_testing_dir__}',
+                            '--path-output', f'{__output_dir__}')
+    logger.debug(f"{ret.stdout}")
+    logger.debug(f"{ret.stderr}")
+    assert ret.success
+    # The models are only saved by the first process
+    assert Path(__output_dir__, "best_model.pt").is_file()
+    assert Path(__output_dir__, "checkpoint.pth.tar").is_file()
+
+
+def teardown_function():
+    remove_tmp_dir()
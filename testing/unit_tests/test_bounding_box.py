@@ -1,6 +1,5 @@
 import json
 import shutil
-import pickle
 from pathlib import Path
 
 import numpy as np
@@ -104,20 +103,12 @@ def test_bounding_box(download_data_testing_test_files, train_lst, target_lst, c
     for index in range(len(handler)):
 
         if "Modified3DUNet" in config:
-            if ds.disk_cache:
-                path_seg_pair, _ = handler[index]
-                with path_seg_pair.open('rb') as f:
-                    seg_pair = pickle.load(f)
-            else:
-                seg_pair, _ = handler[index]
+            seg_pair, _ = ds._get_cached_pairs(index)
+        else:
+            seg_pair, _ = ds._get_cached_item(handler[index])
+        if "Modified3DUNet" in config:
             assert seg_pair['input'][0].shape[-3:] == (mx2 - mx1, my2 - my1, mz2 - mz1)
         else:
-            if ds.disk_cache:
-                path_seg_pair = handler[index]
-                with path_seg_pair.open('rb') as f:
-                    seg_pair, _ = pickle.load(f)
-            else:
-                seg_pair, _ = handler[index]
             assert seg_pair['input'][0].shape[-2:] == (mx2 - mx1, my2 - my1)
 
     shutil.rmtree(PATH_OUTPUT)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import torch
+import torch.distributed as dist
+
+from ivadomed import distributed as imed_distributed
+from ivadomed import metrics as imed_metrics
+from ivadomed import models as imed_models
+from ivadomed.loader.balanced_sampler import DistributedBalancedSampler
+
+WORLD_SIZE = 2
+# 3 empty and 7 non-empty ground truths
+DATASET = [{'gt': [np.full((4, 4), float(i >= 3))]} for i in range(10)]
+
+
+def _check_distributed():
+    """Run by each process of the distributed tests."""
+    rank, world_size = imed_distributed.get_rank(), imed_distributed.get_world_size()
+    assert imed_distributed.is_main_process() == (rank == 0)
+
+    # Each process draws its share of the same weighted samples
+    sampler = DistributedBalancedSampler(DATASET)
+    sampler.set_epoch(1)
+    samples = [None] * world_size
+    dist.all_gather_object(samples, list(sampler))
+    assert len(sampler) == 5 and all(len(s) == len(sampler) for s in samples)
+    assert samples[rank] == list(sampler)
+
+    # The losses are averaged over the batches of all the processes: (1 + 2) / (1 + 2)
+    loss_avg = imed_distributed.average(torch.tensor(float(rank + 1)), rank + 1)
+    assert loss_avg == pytest.approx(1.)
+
+    # The metrics of all the processes are gathered
+    metric_mgr = imed_metrics.DeviceMetricManager(imed_metrics.get_metric_fns("segmentation"))
+    metric_mgr(torch.full((rank + 1, 1, 4, 4), 0.5), torch.ones(rank + 1, 1, 4, 4))
+    metric_mgr.all_gather()
+    assert metric_mgr.num_samples == 3
+
+    # The gradients of the replicas are averaged, their parameters stay equal
+    torch.manual_seed(rank)
+    model = imed_distributed.wrap_model(imed_models.Unet(in_channel=1, out_channel=1, depth=2, n_filters=4), False)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    model(torch.rand(2, 1, 16, 16)).mean().backward()
+    optimizer.step()
+    parameters = [None] * world_size
+    dist.all_gather_object(parameters, [p.detach() for p in model.parameters()])
+    assert all(torch.equal(p0, p1) for p0, p1 in zip(*parameters))
+
+    # Modified3DUNet calls some of its checkpointed blocks twice in a forward pass
+    model = imed_models.Modified3DUNet(in_channel=1, out_channel=1, n_filters=4)
+    assert imed_models.set_activation_checkpointing(model) > 0
+    model = imed_distributed.wrap_model(model, False)
+    model(torch.rand(1, 1, 32, 32, 16)).mean().backward()
+    assert next(model.parameters()).grad is not None
+    return {'world_size': world_size, 'samples': samples}
+
+
+@pytest.mark.skipif(not dist.is_available(), reason="torch.distributed is not available.")
+def test_launch():
+    result = imed_distributed.launch(_check_distributed, WORLD_SIZE, backend="gloo")
+    assert result['world_size'] == WORLD_SIZE
+    # The samples of the processes are distinct draws of the weighted sampler
+    assert sum(len(s) for s in result['samples']) == len(DATASET)
+    assert not imed_distributed.is_initialized() and imed_distributed.get_world_size() == 1
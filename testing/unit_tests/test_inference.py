@@ -0,0 +1,147 @@
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import pytest
+import torch
+
+from ivadomed import inference as imed_inference
+from ivadomed import transforms as imed_transforms
+from ivadomed.keywords import ConfigKW, MetadataKW, ModelParamsKW, OptionKW
+from ivadomed.loader import utils as imed_loader_utils
+from ivadomed.loader.mri2d_segmentation_dataset import MRI2DSegmentationDataset
+from ivadomed.loader.mri3d_subvolume_segmentation_dataset import MRI3DSubVolumeSegmentationDataset
+from testing.unit_tests.t_utils import create_tmp_dir, __tmp_dir__
+from testing.common_testing_util import remove_tmp_dir
+
+
+def setup_function():
+    create_tmp_dir(copy_data_testing_dir=False)
+
+
+def test_get_window_starts():
+    starts = imed_loader_utils.get_window_starts((10, 8), [4, 8], [3, 8])
+    # The last window is shifted to end at the border
+    assert starts.tolist() == [[0, 0], [3, 0], [6, 0]]
+    assert len(imed_loader_utils.get_window_starts((32, 20, 17), [16, 16, 16], [12, 12, 12])) == 3 * 2 * 2
+
+
+@pytest.mark.parametrize('importance', ['gaussian', 'constant'])
+@pytest.mark.parametrize('dtype', [torch.float32, torch.float16])
+@pytest.mark.parametrize('shape, length, stride', [((20, 14), [8, 6], [5, 4]),
+                                                   ((300, 260), [128, 128], [100, 100]),
+                                                   ((100, 90, 80), [64, 64, 64], [48, 48, 48])])
+def test_sliding_window_accumulator(importance, dtype, shape, length, stride):
+    importance_map = imed_inference.get_importance_map(tuple(length), importance, dtype)
+    assert importance_map.shape == tuple(length) and importance_map.max() == 1
+    # The weights of the window borders are not rounded to zero, even in float16
+    assert importance_map.min() >= imed_inference.IMPORTANCE_MIN / 2
+
+    # Blending a constant prediction gives the same constant, whatever the weights, including the voxels covered by
+    # the borders of the windows only
+    accumulator = imed_inference.SlidingWindowAccumulator(2, shape, importance=importance, dtype=dtype)
+    for starts in imed_loader_utils.get_window_starts(shape, length, stride):
+        accumulator.add(torch.full((2, *length), 0.3), starts)
+    result = accumulator.get_result()
+    assert result.dtype == torch.float32 and result.shape == (2, *shape)
+    assert torch.allclose(result, torch.full((2, *shape), 0.3), atol=1e-2)
+
+
+def test_subvolumes_arbitrary_stride():
+    """Subvolumes cover volumes whose size is not a multiple of the stride, and are blended back into the volume."""
+    data = np.random.rand(20, 18, 17).astype(np.float32)
+    path_im = Path(__tmp_dir__, "sub-01_T2w.nii.gz")
+    path_gt = Path(__tmp_dir__, "sub-01_T2w_seg-manual.nii.gz")
+    nib.save(nib.Nifti1Image(data, np.eye(4)), path_im)
+    nib.save(nib.Nifti1Image((data > 0.5).astype(np.float32), np.eye(4)), path_gt)
+    transform, undo_transform = imed_transforms.prepare_transforms({"NumpyToTensor": {}})
+    ds = MRI3DSubVolumeSegmentationDataset([([str(path_im)], [str(path_gt)], None, [{}])], transform=transform,
+                                           length=(16, 16, 16), stride=(12, 8, 12), disk_cache=False)
+    assert len(ds) == 2 * 2 * 2
+
+    volume, pred_undo = None, None
+    for index in range(len(ds)):
+        sample = ds[index]
+        batch = {'input_metadata': [sample['input_metadata']], 'gt_metadata': [sample['gt_metadata']]}
+        pred_undo, _, last_sample_bool, volume, _ = imed_inference.volume_reconstruction(
+            batch, sample['input'].unsqueeze(0), undo_transform, 0, volume)
+        assert last_sample_bool == (index == len(ds) - 1)
+    assert np.allclose(np.array(pred_undo)[0], data, atol=1e-5)
+
+
+@pytest.mark.parametrize('length', [[], [16, 16]])
+def test_set_film_metadata(length):
+    """The FiLM metadata of each subject is added to its slices, or to the images of its patches."""
+    filename_pairs = []
+    for subject_index in range(2):
+        path_im = Path(__tmp_dir__, f"sub-0{subject_index}_T2w.nii.gz")
+        nib.save(nib.Nifti1Image(np.random.rand(20, 18, 3).astype(np.float32), np.eye(4)), path_im)
+        filename_pairs.append(([str(path_im)], None, None, [{MetadataKW.SUBJECT_INDEX: subject_index}]))
+    transform, _ = imed_transforms.prepare_transforms({"NumpyToTensor": {}})
+    ds = MRI2DSegmentationDataset(filename_pairs, length=length, stride=length, transform=transform, disk_cache=False)
+    ds.load_filenames()
+
+    context = {ConfigKW.FILMED_UNET: {ModelParamsKW.METADATA: "contrasts"}}
+    options = [{OptionKW.METADATA: "T1w"}, {OptionKW.METADATA: "T2w"}]
+    imed_inference.set_film_metadata(context, {"T2w": 0}, options, ds)
+    for index in range(len(ds)):
+        input_metadata = ds[index]['input_metadata'][0]
+        assert input_metadata["contrasts"] == options[input_metadata[MetadataKW.SUBJECT_INDEX]][OptionKW.METADATA]
+        assert input_metadata[MetadataKW.METADATA_DICT] == {"T2w": 0}
+
+
+@pytest.mark.parametrize('slice_axis', [0, 1, 2])
+def test_pred_to_nib(slice_axis):
+    # Reference image in LPI-like orientation, with axes swapped
+    affine = np.array([[0, -1, 0, 0], [0, 0, 2, 0], [-1.5, 0, 0, 0], [0, 0, 0, 1]])
+    nib_ref = nib.Nifti1Image(np.zeros((5, 6, 7), dtype=np.float32), affine)
+    nib_ref_can = nib.as_closest_canonical(nib_ref)
+    height, width, depth = imed_loader_utils.orient_img_hwd(np.zeros(nib_ref_can.shape), slice_axis).shape
+    slices = [np.random.rand(2, height, width).astype(np.float32) for _ in range(depth)]
+    z_lst = list(range(depth))
+    # The last slice is missing
+    expected = np.stack(slices[:-1] + [np.zeros((2, height, width))], axis=-1)
+    expected = np.stack([imed_loader_utils.reorient_image(expected[i], slice_axis, nib_ref, nib_ref_can)
+                         for i in range(2)], axis=-1)
+
+    nib_pred = imed_inference.pred_to_nib(slices[:-1], z_lst[:-1], nib_ref, None, slice_axis, bin_thr=-1,
+                                          discard_noise=False)
+    assert np.asanyarray(nib_pred.dataobj).dtype == np.float32
+    assert np.allclose(nib_pred.get_fdata(), expected)
+
+    nib_pred = imed_inference.pred_to_nib(slices[:-1], z_lst[:-1], nib_ref, None, slice_axis, bin_thr=0.5)
+    assert np.asanyarray(nib_pred.dataobj).dtype == np.uint8
+    assert np.array_equal(nib_pred.get_fdata(), expected >= 0.5)
+
+    # Streaming the slices in any order gives the same prediction
+    writer = imed_inference.NiftiPredictionWriter(nib_ref, slice_axis, discard_noise=False)
+    for z in reversed(z_lst[:-1]):
+        writer.write_slice(z, list(slices[z]))
+    assert np.allclose(writer.get_nib().get_fdata(), expected)
+
+
+@pytest.mark.parametrize('shape, flip_axes, rotation_degrees', [((3, 2, 24, 24), [0, 1], [90, 180, 270]),
+                                                                 ((2, 1, 12, 10, 6), [0, 1, 2], [180])])
+def test_test_time_augmentation(shape, flip_axes, rotation_degrees):
+    inputs = torch.rand(shape)
+    tta = imed_inference.TestTimeAugmentation(flip_axes=flip_axes, rotation_degrees=rotation_degrees)
+    assert len(tta) == len(flip_axes) + len(rotation_degrees) + 1
+    batch_sizes = []
+
+    def model_fn(x):
+        batch_sizes.append(len(x))
+        return x
+
+    # The augmented copies are predicted in a single forward pass, and an equivariant model gives back its inputs
+    preds = tta(model_fn, inputs)
+    assert batch_sizes == [len(tta) * shape[0]]
+    assert preds.shape == shape
+    assert torch.allclose(preds, inputs, atol=1e-4)
+
+    with pytest.raises(ValueError):
+        imed_inference.TestTimeAugmentation(flip_axes=[3])
+    assert imed_inference.get_tta({"applied": False}) is None
+
+
+def teardown_function():
+    remove_tmp_dir()
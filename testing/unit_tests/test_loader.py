@@ -1,11 +1,15 @@
 import os
+import copy
+import tracemalloc
 from pathlib import Path
 import shutil
 
 import pytest
+from torch.utils.data import DataLoader, Dataset
 import csv_diff
 import torch
 import numpy as np
+import nibabel as nib
 from loguru import logger
 
 from ivadomed.loader.bids_dataframe import BidsDataframe
@@ -15,7 +19,13 @@ from ivadomed import utils as imed_utils
 from ivadomed.loader import loader as imed_loader
 import ivadomed.loader.utils as imed_loader_utils
 from ivadomed.loader import mri2d_segmentation_dataset as imed_loader_mri2dseg
-from ivadomed.keywords import LoaderParamsKW, MetadataKW, ModelParamsKW, TransformationKW
+from ivadomed.loader.segmentation_pair import SegmentationPair
+from ivadomed.loader.slice_filter import SliceFilter
+from ivadomed.loader.patch_filter import PatchFilter
+from ivadomed.loader.preprocessing_cache import PreprocessingCache
+from ivadomed import transforms as imed_transforms
+from ivadomed.loader.sample_meta_data import SampleMetadata
+from ivadomed.keywords import LoaderParamsKW, MetadataKW, ModelParamsKW, TransformationKW, TrainingParamsKW
 
 
 
@@ -440,5 +450,136 @@ def test_create_cache_folder():
     assert(os.path.exists(path_cache))
     shutil.rmtree(path_cache)
 
+def test_iter_pair_slices():
+    """Check that slices are extracted from a volume decoded only once and match get_pair_slice."""
+    data = np.random.rand(10, 12, 6).astype(np.float32)
+    path_im = Path(__tmp_dir__, "sub-01_T2w.nii.gz")
+    path_gt = Path(__tmp_dir__, "sub-01_T2w_seg-manual.nii.gz")
+    nib.save(nib.Nifti1Image(data, np.eye(4)), path_im)
+    nib.save(nib.Nifti1Image((data > 0.5).astype(np.float32), np.eye(4)), path_gt)
+
+    seg_pair = SegmentationPair([str(path_im)], [str(path_gt)], metadata=[{}], slice_axis=2, cache=True)
+    slices = list(seg_pair.iter_pair_slices())
+    assert len(slices) == data.shape[2]
+    # Volumes are oriented once and the same arrays are returned by the following calls
+    assert seg_pair.oriented_data is not None
+    assert seg_pair.get_pair_data() is seg_pair.oriented_data
+
+    for idx_slice, slice_pair in slices:
+        expected = seg_pair.get_pair_slice(idx_slice)
+        assert np.array_equal(slice_pair['input'][0], expected['input'][0])
+        assert np.array_equal(slice_pair['gt'][0], expected['gt'][0])
+        assert slice_pair[MetadataKW.INPUT_METADATA][0][MetadataKW.SLICE_INDEX] == idx_slice
+
+    seg_pair_no_cache = SegmentationPair([str(path_im)], [str(path_gt)], metadata=[{}], slice_axis=2, cache=False)
+    seg_pair_no_cache.get_pair_data()
+    assert seg_pair_no_cache.oriented_data is None
+
+
+
+def test_lazy_dataset():
+    """Check that a lazy dataset has the same samples as an eagerly loaded one, with a bounded subject cache."""
+    filename_pairs = []
+    for subject in range(3):
+        data = np.random.rand(24, 20, 6).astype(np.float32)
+        # Empty slice, discarded by the slice filter
+        data[..., 2] = 0
+        path_im = Path(__tmp_dir__, f"sub-0{subject}_T2w.nii.gz")
+        path_gt = Path(__tmp_dir__, f"sub-0{subject}_T2w_seg-manual.nii.gz")
+        nib.save(nib.Nifti1Image(data, np.eye(4)), path_im)
+        nib.save(nib.Nifti1Image((data > 0.9).astype(np.float32), np.eye(4)), path_gt)
+        filename_pairs.append(([str(path_im)], [str(path_gt)], None, [{}]))
+    transform, _ = imed_transforms.prepare_transforms({"NumpyToTensor": {}})
+    preprocessing_cache = PreprocessingCache(str(Path(__tmp_dir__, "preprocessing_cache")))
+
+    def _get_dataset(**kwargs):
+        ds = imed_loader_mri2dseg.MRI2DSegmentationDataset(filename_pairs, length=[12, 12], stride=[6, 6],
+                                                           transform=transform,
+                                                           slice_filter_fn=SliceFilter(filter_empty_input=True),
+                                                           patch_filter_fn=PatchFilter(filter_empty_mask=True,
+                                                                                       is_train=True),
+                                                           disk_cache=False, **kwargs)
+        ds.load_filenames()
+        return ds
+
+    ds = _get_dataset()
+    for ds_lazy in [_get_dataset(lazy=True, max_cached_subjects=1),
+                    # The index is built, then read from the preprocessing cache
+                    _get_dataset(lazy=True, max_cached_subjects=1, preprocessing_cache=preprocessing_cache),
+                    _get_dataset(lazy=True, max_cached_subjects=1, preprocessing_cache=preprocessing_cache)]:
+        assert len(ds_lazy) == len(ds) > 0
+        assert np.array_equal(ds_lazy.indexes, ds.indexes)
+        for index in range(len(ds)):
+            sample, sample_lazy = ds[index], ds_lazy[index]
+            assert torch.equal(sample['input'], sample_lazy['input'])
+            assert torch.equal(sample['gt'], sample_lazy['gt'])
+            assert len(ds_lazy._subject_cache) <= 1
+
+
+def test_get_sample_view():
+    """Check that per-sample access shares pixel data with the cached pair and only copies metadata."""
+    volume = np.random.rand(2, 128, 128, 64).astype(np.float32)
+    pair = {
+        'input': [volume[0], volume[1]],
+        'gt': [[volume[0] > 0.5, volume[1] > 0.5]],
+        MetadataKW.INPUT_METADATA: [SampleMetadata({MetadataKW.CROP_PARAMS: {}}) for _ in range(2)],
+        MetadataKW.GT_METADATA: [[SampleMetadata({MetadataKW.CROP_PARAMS: {}}) for _ in range(2)]],
+    }
+
+    # Bytes allocated per item, before (deepcopy of the cached pair) and after (views + metadata copies)
+    tracemalloc.start()
+    copy.deepcopy(pair)
+    _, bytes_deepcopy = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tracemalloc.start()
+    sample = imed_loader_utils.get_sample_view(pair)
+    _, bytes_view = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    logger.info(f"Bytes allocated per item: {bytes_deepcopy} with deepcopy, {bytes_view} with views.")
+    assert bytes_view < 0.01 * volume.nbytes < bytes_deepcopy
+
+    # Pixel data are shared and read-only
+    assert np.shares_memory(sample['input'][0], volume)
+    assert not sample['input'][0].flags.writeable
+    assert isinstance(sample['gt'][0], list) and len(sample['gt'][0]) == 2
+
+    # Metadata are independent from the cached ones
+    sample[MetadataKW.INPUT_METADATA][0][MetadataKW.CROP_PARAMS]['CenterCrop'] = (0, 0, 0, 0)
+    sample[MetadataKW.GT_METADATA][0] = sample[MetadataKW.GT_METADATA][0][1]
+    assert pair[MetadataKW.INPUT_METADATA][0][MetadataKW.CROP_PARAMS] == {}
+    assert isinstance(pair[MetadataKW.GT_METADATA][0], list)
+
+
+class RandomDataset(Dataset):
+    """Dataset returning a number drawn with numpy, as data augmentation does."""
+
+    def __len__(self):
+        return 8
+
+    def __getitem__(self, index):
+        return np.random.rand()
+
+
+def test_get_dataloader_params():
+    # Default: data is loaded in the main process
+    assert imed_loader_utils.get_dataloader_params({TrainingParamsKW.BATCH_SIZE: 2}) == {'num_workers': 0}
+
+    training_params = {TrainingParamsKW.NUM_WORKERS: 2, TrainingParamsKW.PREFETCH_FACTOR: 4,
+                       TrainingParamsKW.PERSISTENT_WORKERS: True, TrainingParamsKW.WORKER_SEED: 42}
+    params = imed_loader_utils.get_dataloader_params(training_params)
+    assert params['num_workers'] == 2
+    assert params['prefetch_factor'] == 4
+    assert params['persistent_workers']
+
+    # Each worker draws different numbers, and the draws are the same from one run to the other
+    runs = []
+    for _ in range(2):
+        loader = DataLoader(RandomDataset(), batch_size=1,
+                            **imed_loader_utils.get_dataloader_params(training_params))
+        runs.append([float(x) for x in loader])
+    assert runs[0] == runs[1]
+    assert len(set(runs[0])) == len(runs[0])
+
+
 def teardown_function():
     remove_tmp_dir()
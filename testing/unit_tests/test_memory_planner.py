@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+from pathlib import Path
+
+import nibabel as nib
+import numpy as np
+import torch
+
+from ivadomed import transforms as imed_transforms
+from ivadomed.loader import loader as imed_loader
+from ivadomed.loader import memory_planner as imed_memory_planner
+from ivadomed.loader import mri2d_segmentation_dataset as imed_loader_mri2dseg
+from ivadomed.loader.memory_planner import MemoryPlanner, get_nbytes, RAM, MEMMAP, DECODE
+from ivadomed.loader.utils import LazyHandle
+from testing.unit_tests.t_utils import create_tmp_dir, __tmp_dir__
+from testing.common_testing_util import remove_tmp_dir
+
+
+def setup_function():
+    create_tmp_dir(copy_data_testing_dir=False)
+
+
+def test_get_nbytes():
+    volume = np.zeros((2, 16, 16), dtype=np.float32)
+    seg_pair = {'input': [volume[0], volume[1]], 'gt': [np.zeros((16, 16), dtype=np.uint8)], 'input_metadata': None}
+    # The input arrays shared with roi_pair are counted once
+    roi_pair = {'input': seg_pair['input'], 'gt': None}
+    assert get_nbytes((seg_pair, roi_pair)) == volume.nbytes + 16 * 16
+
+
+def test_memory_planner(monkeypatch):
+    planner = MemoryPlanner(max_cache_gb=2.5 * 1024 / 1024 ** 3, path_disk=__tmp_dir__)
+    assert [planner.place(1024) for _ in range(3)] == [RAM, RAM, MEMMAP]
+
+    # Not enough free disk space
+    monkeypatch.setattr(imed_memory_planner.shutil, "disk_usage", lambda path: SimpleNamespace(total=0, used=0, free=0))
+    assert planner.place(1024) == DECODE
+    assert planner.footprint == {RAM: [2, 2048], MEMMAP: [1, 1024], DECODE: [1, 1024]}
+    planner.report()
+
+
+def test_memory_planner_splits():
+    assert imed_loader.get_memory_planner(None) is None
+    # The budget is shared by the splits, the footprint is logged for each split
+    planner = imed_loader.get_memory_planner(2.5 * 1024 / 1024 ** 3)
+    planner.dataset_type = "validation"
+    assert [planner.place(1024) for _ in range(2)] == [RAM, RAM]
+    planner.dataset_type = "training"
+    assert planner.place(1024) == MEMMAP
+    assert planner.footprints["validation"][RAM] == [2, 2048] and planner.footprint[RAM] == [0, 0]
+    assert planner.ram_nbytes == 2048
+    planner.report()
+
+
+def test_dataset_memory_planner(monkeypatch):
+    """Check that the samples of a dataset do not depend on where the memory planner keeps each subject."""
+    filename_pairs = []
+    for subject in range(3):
+        data = np.random.rand(24, 20, 6).astype(np.float32)
+        path_im = Path(__tmp_dir__, f"sub-0{subject}_T2w.nii.gz")
+        path_gt = Path(__tmp_dir__, f"sub-0{subject}_T2w_seg-manual.nii.gz")
+        nib.save(nib.Nifti1Image(data, np.eye(4)), path_im)
+        nib.save(nib.Nifti1Image((data > 0.5).astype(np.float32), np.eye(4)), path_gt)
+        filename_pairs.append(([str(path_im)], [str(path_gt)], None, [{}]))
+    transform, _ = imed_transforms.prepare_transforms({"NumpyToTensor": {}})
+
+    def _get_dataset(**kwargs):
+        ds = imed_loader_mri2dseg.MRI2DSegmentationDataset(filename_pairs, transform=transform, **kwargs)
+        ds.load_filenames()
+        return ds
+
+    ds = _get_dataset(disk_cache=False)
+    # Room for the slices of one subject
+    nbytes = get_nbytes(ds._load_subject(0))
+    planner = MemoryPlanner(max_cache_gb=1.5 * nbytes / 1024 ** 3, path_disk=__tmp_dir__)
+    ds_planned = _get_dataset(memory_planner=planner)
+    assert planner.footprint[RAM][0] == 1 and planner.footprint[MEMMAP][0] == 2
+    assert isinstance(ds_planned.indexes[0], tuple) and isinstance(ds_planned.indexes[-1], int)
+
+    monkeypatch.setattr(imed_memory_planner.shutil, "disk_usage", lambda path: SimpleNamespace(total=0, used=0, free=0))
+    planner = MemoryPlanner(max_cache_gb=0, path_disk=__tmp_dir__)
+    ds_decoded = _get_dataset(memory_planner=planner, max_cached_subjects=1)
+    assert planner.footprint[DECODE][0] == 3
+    assert all(isinstance(handle, LazyHandle) for handle in ds_decoded.indexes)
+
+    for ds_other in [ds_planned, ds_decoded]:
+        assert len(ds_other) == len(ds) > 0
+        for index in range(len(ds)):
+            sample, sample_other = ds[index], ds_other[index]
+            assert torch.equal(sample['input'], sample_other['input'])
+            assert torch.equal(sample['gt'], sample_other['gt'])
+    assert len(ds_decoded._subject_cache) <= 1
+
+
+def teardown_function():
+    remove_tmp_dir()
@@ -1,6 +1,7 @@
 import ivadomed.metrics as imed_metrics
 import numpy as np
 import pytest
+import torch
 import logging
 from testing.unit_tests.t_utils import create_tmp_dir,  __tmp_dir__
 from testing.common_testing_util import remove_tmp_dir
@@ -77,5 +78,32 @@ def test_dice_plot():
     assert __output_file__.is_file()
 
 
+@pytest.mark.parametrize("shape", [(4, 1, 12, 10), (3, 2, 8, 6, 4)])
+@pytest.mark.parametrize("sync_steps", [None, 2])
+def test_device_metric_manager(shape, sync_steps):
+    metric_fns = imed_metrics.get_metric_fns("segmentation")
+    metric_mgr = imed_metrics.MetricManager(metric_fns)
+    device_metric_mgr = imed_metrics.DeviceMetricManager(metric_fns, sync_steps=sync_steps)
+    for i in range(3):
+        preds = torch.rand(shape)
+        gt = (torch.rand(shape) > 0.7).float()
+        # Empty prediction and ground truth
+        preds[0], gt[0] = 0, 0
+        metric_mgr(preds.numpy(), gt.numpy())
+        device_metric_mgr(preds, gt)
+        # The host copies of the batches are only kept until their metrics are computed
+        assert len(device_metric_mgr._pending) <= device_metric_mgr.MAX_PENDING_BATCHES
+    results = metric_mgr.get_results()
+    device_results = device_metric_mgr.get_results()
+    assert device_metric_mgr.num_samples == 3 * shape[0]
+    assert results.keys() == device_results.keys()
+    for key in results:
+        assert results[key] == pytest.approx(device_results[key], rel=1e-5)
+
+    device_metric_mgr.reset()
+    device_metric_mgr(preds, gt)
+    assert device_metric_mgr.num_samples == shape[0]
+
+
 def teardown_function():
     remove_tmp_dir()
@@ -1,3 +1,4 @@
+import pytest
 import ivadomed.models as imed_model
 import torch
 import torchvision
@@ -54,3 +55,23 @@ def test_film_generator():
     assert (len(inf[1]) == 2)
     assert (type(inf[1][0]) == torch.nn.parameter.Parameter)
     assert (type(inf[1][1]) == torch.nn.parameter.Parameter)
+
+
+@pytest.mark.parametrize('model, inputs', [
+    (imed_model.Unet(in_channel=1, out_channel=1, depth=2, n_filters=8), torch.rand(2, 1, 32, 32)),
+    (imed_model.Modified3DUNet(in_channel=1, out_channel=1, n_filters=4, attention=True), torch.rand(1, 1, 32, 32, 16))
+])
+def test_activation_checkpointing(model, inputs):
+    model.train()
+    grads = []
+    for applied in [False, True]:
+        assert imed_model.set_activation_checkpointing(model, applied) > 0
+        model.zero_grad()
+        # Same dropout masks for both runs
+        torch.manual_seed(0)
+        model(inputs).sum().backward()
+        grads.append([p.grad.clone() for p in model.parameters() if p.grad is not None])
+    # All the parameters get the same gradients with checkpointing
+    assert len(grads[0]) == len(grads[1])
+    for grad, grad_checkpointing in zip(*grads):
+        assert torch.allclose(grad, grad_checkpointing, atol=1e-5)
@@ -1,8 +1,11 @@
 import nibabel as nib
 import torch
 import numpy as np
+import os
 import shutil
 import logging
+import onnxruntime
+import pytest
 from ivadomed import utils as imed_utils
 from ivadomed import inference as imed_inference
 from ivadomed import models as imed_models
@@ -43,5 +46,69 @@ def test_onnx(download_data_testing_test_files):
     assert np.allclose(out_pt, out_onnx, rtol=1e-3)
 
 
+def test_get_model():
+    model = imed_models.Modified3DUNet(1, 1)
+    PATH_MODEL.mkdir(exist_ok=True)
+    torch.save(model, PATH_MODEL_PT)
+    imed_utils.save_onnx_model(model, torch.randn(1, 1, 32, 32, 32), str(PATH_MODEL_ONNX))
+    device = torch.device("cpu")
+
+    for fname_model in [str(PATH_MODEL_PT), str(PATH_MODEL_ONNX)]:
+        # Loaded once, then reused
+        loaded = imed_inference.get_model(fname_model, device)
+        assert imed_inference.get_model(fname_model, device) is loaded
+        if fname_model.endswith('.pt'):
+            assert not loaded.training
+
+        # Loaded again once the file is modified
+        stat = os.stat(fname_model)
+        os.utime(fname_model, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert imed_inference.get_model(fname_model, device) is not loaded
+
+    imed_inference.clear_model_cache()
+    shutil.rmtree(PATH_MODEL)
+
+
+def test_save_onnx_model_parity():
+    model = imed_models.Unet(in_channel=2, out_channel=3, depth=2)
+    PATH_MODEL.mkdir(exist_ok=True)
+    # The model runs on batches and slices of other shapes than the sample input
+    imed_utils.save_onnx_model(model, torch.randn(1, 2, 32, 48), str(PATH_MODEL_ONNX), opset_version=13,
+                               check_parity=True)
+    ort_session = onnxruntime.InferenceSession(str(PATH_MODEL_ONNX), providers=['CPUExecutionProvider'])
+    out_onnx = ort_session.run(None, {'input': np.random.rand(5, 2, 64, 32).astype(np.float32)})[0]
+    assert out_onnx.shape == (5, 3, 64, 32)
+
+    # An ONNX model of another model fails the check
+    with pytest.raises(RuntimeError, match=r"differs from the PyTorch model"):
+        imed_utils.check_onnx_parity(imed_models.Unet(in_channel=2, out_channel=3, depth=2), str(PATH_MODEL_ONNX),
+                                     torch.randn(1, 2, 32, 48))
+    shutil.rmtree(PATH_MODEL)
+
+
+def test_onnx_engine():
+    model = imed_models.Modified3DUNet(1, 2)
+    model.eval()
+    PATH_MODEL.mkdir(exist_ok=True)
+    imed_utils.save_onnx_model(model, torch.randn(1, 1, 32, 32, 32), str(PATH_MODEL_ONNX))
+    path_optimized = Path(PATH_MODEL, 'model_optimized.onnx')
+
+    engine = imed_inference.OnnxEngine(str(PATH_MODEL_ONNX), intra_op_num_threads=1, inter_op_num_threads=2,
+                                       graph_optimization_level='extended', optimized_model_path=str(path_optimized))
+    assert path_optimized.is_file()
+    # The first batch sets the output shape, the next ones are written in a preallocated output, with any batch size
+    for batch_size in [1, 1, 3]:
+        inputs = torch.randn(batch_size, 1, 32, 32, 16)
+        out_onnx = engine(inputs)
+        out_pt = model(inputs).detach()
+        assert out_onnx.shape == out_pt.shape
+        assert np.allclose(out_pt.numpy(), out_onnx.numpy(), rtol=1e-3, atol=1e-5)
+
+    # The optimized model can be loaded without optimization
+    engine_optimized = imed_inference.OnnxEngine(str(path_optimized), graph_optimization_level='disable')
+    assert np.allclose(engine_optimized(inputs).numpy(), out_onnx.numpy(), rtol=1e-3, atol=1e-5)
+    shutil.rmtree(PATH_MODEL)
+
+
 def teardown_function():
     remove_tmp_dir()
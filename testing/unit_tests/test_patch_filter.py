@@ -8,6 +8,7 @@ from loguru import logger
 from ivadomed.loader.bids_dataframe import BidsDataframe
 from ivadomed import utils as imed_utils
 from ivadomed.loader import utils as imed_loader_utils, loader as imed_loader
+from ivadomed.loader.patch_filter import PatchFilter
 from testing.unit_tests.t_utils import create_tmp_dir,  __data_testing_dir__, __tmp_dir__, download_data_testing_test_files, path_repo_root
 from testing.common_testing_util import remove_tmp_dir
 
@@ -89,3 +90,33 @@ def test_patch_filter(download_data_testing_test_files, transforms_dict, train_l
 
 def teardown_function():
     remove_tmp_dir()
+
+
+@pytest.mark.parametrize('patch_filter_params', [
+    {"filter_empty_mask": True, "filter_empty_input": True},
+    {"filter_empty_mask": False, "filter_absent_class": True, "filter_empty_input": False},
+])
+def test_filter_patches(patch_filter_params):
+    # The batched filter must keep the same patches as the filter called on each patch
+    rng = np.random.default_rng(0)
+    input_img = [rng.random((40, 50)).astype(np.float32) for _ in range(2)]
+    input_img[0][:16, :20] = 0.
+    input_img[1][24:, 30:] = 3.
+    # Constant patch whose std is not exactly 0
+    input_img[1][24:32, 20:30] = 0.1
+    gt_img = [np.zeros((40, 50), dtype=np.uint8) for _ in range(2)]
+    gt_img[0][10:14, 15:25] = 1
+    gt_img[1][12:30, 22:40] = 1
+
+    patch_filter = PatchFilter(**patch_filter_params, is_train=True)
+    length = [8, 10]
+    starts = np.stack(np.meshgrid(np.arange(0, 33, 4), np.arange(0, 41, 5), indexing='ij'), axis=-1).reshape(-1, 2)
+    keep = patch_filter.filter_patches(input_img, gt_img, starts, length)
+
+    expected = [patch_filter({'input': [img[x:x + length[0], y:y + length[1]] for img in input_img],
+                              'gt': [mask[x:x + length[0], y:y + length[1]] for mask in gt_img]})
+                for x, y in starts]
+    assert keep.tolist() == expected
+    assert 0 < keep.sum() < len(starts)
+    if patch_filter.filter_empty_input:
+        assert not keep[starts.tolist().index([24, 20])]
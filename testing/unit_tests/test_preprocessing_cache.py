@@ -0,0 +1,93 @@
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ivadomed.loader.preprocessing_cache import PreprocessingCache
+from ivadomed.loader.sample_meta_data import SampleMetadata
+from ivadomed.keywords import MetadataKW
+from testing.unit_tests.t_utils import create_tmp_dir, __tmp_dir__
+from testing.common_testing_util import remove_tmp_dir
+
+
+def setup_function():
+    create_tmp_dir(copy_data_testing_dir=False)
+
+
+def _write_file(filename, content):
+    path_file = Path(__tmp_dir__, filename)
+    path_file.write_bytes(content)
+    return str(path_file)
+
+
+def _get_samples(n_samples=3):
+    samples = []
+    for _ in range(n_samples):
+        seg_pair = {
+            'input': [np.random.rand(32, 32).astype(np.float32)],
+            'gt': [np.random.randint(0, 2, (32, 32)).astype(np.uint8)],
+            MetadataKW.INPUT_METADATA: [SampleMetadata({MetadataKW.ZOOMS: (0.5, 0.5, 1.)})],
+            MetadataKW.GT_METADATA: [SampleMetadata({MetadataKW.ZOOMS: (0.5, 0.5, 1.)})]
+        }
+        samples.append((seg_pair, None))
+    return samples
+
+
+def test_preprocessing_cache_key():
+    cache = PreprocessingCache(str(Path(__tmp_dir__, "cache")))
+    path_im = _write_file("im.nii.gz", b"image")
+    path_gt = _write_file("gt.nii.gz", b"mask")
+
+    key = cache.get_key([[path_im], [path_gt], None], slice_axis=2, transforms={'im': [('Resample', {'hspace': 1})]})
+    assert key == cache.get_key([[path_im], [path_gt], None], slice_axis=2,
+                                transforms={'im': [('Resample', {'hspace': 1})]})
+    # Any change in the parameters or in the files content changes the key
+    assert key != cache.get_key([[path_im], [path_gt], None], slice_axis=1,
+                                transforms={'im': [('Resample', {'hspace': 1})]})
+    assert key != cache.get_key([[path_im], [path_gt], None], slice_axis=2,
+                                transforms={'im': [('Resample', {'hspace': 0.5})]})
+    time.sleep(0.01)
+    _write_file("gt.nii.gz", b"other mask")
+    assert key != cache.get_key([[path_im], [path_gt], None], slice_axis=2,
+                                transforms={'im': [('Resample', {'hspace': 1})]})
+
+
+def test_preprocessing_cache_save_load():
+    cache = PreprocessingCache(str(Path(__tmp_dir__, "cache")))
+    samples = _get_samples()
+    assert cache.load("key") is None
+    cache.save("key", samples)
+
+    # A new cache object, e.g. in another run, finds the entry
+    cached_samples = PreprocessingCache(str(Path(__tmp_dir__, "cache"))).load("key")
+    assert len(cached_samples) == len(samples)
+    for (seg_pair, roi_pair), (cached_seg_pair, cached_roi_pair) in zip(samples, cached_samples):
+        assert roi_pair is None and cached_roi_pair is None
+        assert np.array_equal(seg_pair['input'][0], cached_seg_pair['input'][0])
+        assert np.array_equal(seg_pair['gt'][0], cached_seg_pair['gt'][0])
+        assert cached_seg_pair[MetadataKW.INPUT_METADATA][0][MetadataKW.ZOOMS] == (0.5, 0.5, 1.)
+        # Samples are loaded in memory and can be modified
+        assert not isinstance(cached_seg_pair['input'][0], np.memmap)
+        assert cached_seg_pair['input'][0].flags.writeable
+
+
+def test_preprocessing_cache_lru():
+    path_cache = Path(__tmp_dir__, "cache")
+    cache = PreprocessingCache(str(path_cache))
+    for key in ["a", "b", "c"]:
+        cache.save(key, _get_samples())
+    size_entry = sum(f.stat().st_size for f in Path(path_cache, "a").iterdir())
+
+    # "a" is the oldest entry, but it is used again: "b" becomes the least recently used
+    for key, mtime in zip(["a", "b", "c"], [100, 200, 300]):
+        os.utime(Path(path_cache, key), (mtime, mtime))
+    assert cache.load("a") is not None
+
+    cache.max_size_gb = 2.5 * size_entry / 1024 ** 3
+    cache.evict()
+    assert sorted(p.name for p in path_cache.iterdir()) == ["a", "c"]
+
+
+def teardown_function():
+    remove_tmp_dir()
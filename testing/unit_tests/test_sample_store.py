@@ -0,0 +1,104 @@
+import gc
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from ivadomed.loader.sample_store import SampleStore
+from ivadomed.loader.sample_meta_data import SampleMetadata
+from ivadomed.keywords import MetadataKW
+from testing.unit_tests.t_utils import create_tmp_dir, __tmp_dir__
+from testing.common_testing_util import remove_tmp_dir
+
+
+def setup_function():
+    create_tmp_dir(copy_data_testing_dir=False)
+
+
+def _get_item():
+    volume = np.random.rand(2, 32, 32, 16).astype(np.float32)
+    seg_pair = {
+        'input': [volume[0], volume[1]],
+        'gt': [[(volume[0] > 0.5).astype(np.uint8), (volume[1] > 0.5).astype(np.uint8)]],
+        MetadataKW.INPUT_METADATA: [SampleMetadata({MetadataKW.CROP_PARAMS: {}}) for _ in range(2)],
+        MetadataKW.GT_METADATA: [[SampleMetadata({MetadataKW.CROP_PARAMS: {}}) for _ in range(2)]],
+    }
+    roi_pair = {
+        'input': seg_pair['input'],
+        'gt': [(volume[0] > 0.2).astype(np.uint8)],
+        MetadataKW.INPUT_METADATA: seg_pair[MetadataKW.INPUT_METADATA],
+        MetadataKW.GT_METADATA: None,
+    }
+    return seg_pair, roi_pair
+
+
+def test_sample_store():
+    # Small shards to check that samples are distributed across several files
+    store = SampleStore(shard_size=100000)
+    items = [_get_item() for _ in range(4)]
+    handles = [store.append(item) for item in items]
+    assert handles == list(range(4))
+    assert len(list(store.path.glob("shard_*.bin"))) > 1
+
+    for item, handle in zip(items, handles):
+        seg_pair, roi_pair = store[handle]
+        assert np.array_equal(seg_pair['input'][1], item[0]['input'][1])
+        assert seg_pair['gt'][0][1].dtype == np.uint8
+        assert np.array_equal(seg_pair['gt'][0][1], item[0]['gt'][0][1])
+        assert np.array_equal(roi_pair['gt'][0], item[1]['gt'][0])
+        assert roi_pair[MetadataKW.GT_METADATA] is None
+        assert MetadataKW.CROP_PARAMS in seg_pair[MetadataKW.INPUT_METADATA][0]
+        # Arrays are read-only memory maps
+        assert isinstance(seg_pair['input'][0].base, np.memmap)
+        assert not seg_pair['input'][0].flags.writeable
+
+    # The store can be sent to DataLoader workers
+    store_copy = pickle.loads(pickle.dumps(store))
+    assert np.array_equal(store_copy[2][0]['input'][0], items[2][0]['input'][0])
+
+    # Temporary stores are removed with the store
+    path_store = store.path
+    del store, store_copy, seg_pair, roi_pair
+    gc.collect()
+    assert not path_store.exists()
+
+
+def test_sample_store_reuse():
+    path_store = Path(__tmp_dir__, "sample_store")
+    item = _get_item()
+    store = SampleStore(str(path_store))
+    store.append(item)
+    store.flush()
+    del store
+
+    store = SampleStore(str(path_store))
+    assert len(store) == 1
+    assert np.array_equal(store[0][0]['input'][0], item[0]['input'][0])
+    store.append(item)
+    assert np.array_equal(store[1][1]['gt'][0], item[1]['gt'][0])
+    store.cleanup()
+    assert not path_store.exists()
+
+
+def test_sample_store_reopen_unflushed():
+    path_store = Path(__tmp_dir__, "sample_store")
+    items = [_get_item() for _ in range(3)]
+    store = SampleStore(str(path_store), shard_size=100000)
+    store.append(items[0])
+    store.flush()
+    # Samples appended after the last flush, e.g. by an interrupted run, are not indexed
+    store.append(items[1])
+    store.append(items[1])
+    del store
+
+    store = SampleStore(str(path_store), shard_size=100000)
+    assert len(store) == 1
+    assert store.append(items[2]) == 1
+    for handle, item in enumerate([items[0], items[2]]):
+        assert np.array_equal(store[handle][0]['input'][1], item[0]['input'][1])
+        assert np.array_equal(store[handle][1]['gt'][0], item[1]['gt'][0])
+    store.cleanup()
+
+
+def teardown_function():
+    remove_tmp_dir()
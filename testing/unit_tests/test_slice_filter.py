@@ -1,5 +1,6 @@
 import pytest
 import numpy as np
+import torch
 import torch.backends.cudnn as cudnn
 from torch.utils.data import DataLoader
 from loguru import logger
@@ -7,6 +8,8 @@ from loguru import logger
 from ivadomed.loader.bids_dataframe import BidsDataframe
 from ivadomed import utils as imed_utils
 from ivadomed.loader import utils as imed_loader_utils, loader as imed_loader
+from ivadomed.loader.slice_filter import SliceFilter
+from pathlib import Path
 from testing.unit_tests.t_utils import create_tmp_dir,  __data_testing_dir__, __tmp_dir__, download_data_testing_test_files
 from testing.common_testing_util import remove_tmp_dir
 
@@ -90,5 +93,59 @@ def test_slice_filter(download_data_testing_test_files, transforms_dict, train_l
     logger.info(f"\tNumber of Neg/Pos slices in GT: {cmpt_neg/cmpt_pos}")
 
 
+
+@pytest.mark.parametrize('slice_filter_params', [
+    {"filter_empty_mask": True, "filter_empty_input": True},
+    {"filter_empty_mask": False, "filter_absent_class": True, "filter_empty_input": False}])
+def test_filter_volume(slice_filter_params):
+    # The batched filter must keep the same slices as the filter called on each slice
+    rng = np.random.default_rng(0)
+    input_data = [rng.random((20, 24, 12)).astype(np.float32) for _ in range(2)]
+    input_data[0][..., 0] = 0.
+    input_data[1][..., 5] = 2.
+    # Constant slice whose std is not exactly 0
+    input_data[1][..., 7] = 0.1
+    # Two classes, annotated by two raters
+    gt_data = [[np.zeros((20, 24, 12), dtype=np.float32) for _ in range(2)] for _ in range(2)]
+    gt_data[0][0][5:10, 5:10, :8] = 1.
+    gt_data[1][0][10:15, 3:6, 4:6] = 1.
+    gt_data[1][1][10:15, 3:6, 0:2] = 1.
+
+    slice_filter = SliceFilter(**slice_filter_params)
+    keep = slice_filter.filter_volume(input_data, gt_data)
+
+    expected = [slice_filter({'input': [img[..., i] for img in input_data],
+                              'gt': [[rater[..., i] for rater in mask] for mask in gt_data]})
+                for i in range(12)]
+    assert keep.tolist() == expected
+    assert 0 < keep.sum() < 12
+    if slice_filter.filter_empty_input:
+        assert not keep[7]
+
+
+
+class MeanClassifier(torch.nn.Module):
+    """Classifier that is positive for the images with a mean intensity above 0.5."""
+    def forward(self, x):
+        return (x.mean(dim=(1, 2, 3)) > 0.5).float()
+
+
+def test_filter_volume_classification():
+    # Batched classification must keep the same slices as the classifier run on each slice
+    rng = np.random.default_rng(0)
+    input_data = [rng.random((16, 16, 10)).astype(np.float32) * rng.random(10).astype(np.float32) * 2
+                  for _ in range(2)]
+    classifier_path = str(Path(__tmp_dir__, "classifier.pt"))
+    torch.save(MeanClassifier(), classifier_path)
+
+    slice_filter = SliceFilter(filter_empty_input=False, filter_classification=True, classifier_path=classifier_path,
+                               classifier_batch_size=3, classifier_num_threads=1, cuda_available=False)
+    keep = slice_filter.filter_volume(input_data)
+
+    expected = [slice_filter({'input': [img[..., i] for img in input_data], 'gt': []}) for i in range(10)]
+    assert keep.tolist() == expected
+    assert 0 < keep.sum() < 10
+
+
 def teardown_function():
     remove_tmp_dir()
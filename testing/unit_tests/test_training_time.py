@@ -1,15 +1,19 @@
+import os
 import time
 import numpy as np
 import pytest
+import torch
 import torch.backends.cudnn as cudnn
 from torch import optim
 from torch.utils.data import DataLoader
 from tqdm import tqdm
 from loguru import logger
+from pathlib import Path
 
 from ivadomed.loader.bids_dataframe import BidsDataframe
 from ivadomed import losses as imed_losses
 from ivadomed import models as imed_models
+from ivadomed import training as imed_training
 from ivadomed import utils as imed_utils
 from ivadomed.loader import utils as imed_loader_utils, loader as imed_loader
 from testing.unit_tests.t_utils import create_tmp_dir,  __data_testing_dir__, __tmp_dir__, download_data_testing_test_files
@@ -209,5 +213,140 @@ def test_unet_time(download_data_testing_test_files, train_lst, target_lst, conf
     logger.info(f"Mean SD scheduler {np.mean(schedule_lst)} -- {np.std(schedule_lst)}")
 
 
+def _get_activation_bytes(model, inputs, dtype):
+    """Return the size of the tensors saved by a forward pass for the backward pass (activations)."""
+    n_bytes = []
+
+    def pack(x):
+        n_bytes.append(x.numel() * x.element_size())
+        return x
+
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda x: x), imed_training.autocast(dtype, False):
+        model(inputs)
+    return sum(n_bytes)
+
+
+@pytest.mark.skipif(not hasattr(torch, 'autocast'), reason="Mixed precision requires torch>=1.10.")
+@pytest.mark.parametrize('model_params, input_shape', [
+    ({"name": "Unet", "is_2d": True}, (8, 1, 64, 64)),
+    ({"name": "Modified3DUNet", "is_2d": False, "length_3D": [32, 32, 16], "n_filters": 8}, (2, 1, 32, 32, 16))
+])
+def test_amp_cpu_bfloat16(model_params, input_shape):
+    loss_fct = imed_losses.DiceLoss()
+    inputs = torch.rand(input_shape)
+    gt = (torch.rand(input_shape) > 0.5).float()
+    results = {}
+    for amp_params in [{"applied": False}, {"applied": True, "dtype": "bfloat16", "channels_last": True}]:
+        torch.manual_seed(0)
+        model = getattr(imed_models, model_params["name"])(in_channel=1, out_channel=1, **MODEL_DEFAULT,
+                                                          **model_params)
+        dtype, channels_last = imed_training.get_amp_params(amp_params, cuda_available=False)
+        memory_format = imed_training.get_memory_format(model_params)
+        x = inputs.contiguous(memory_format=memory_format) if channels_last else inputs
+        if channels_last:
+            model = model.to(memory_format=memory_format)
+        optimizer = optim.Adam(model.parameters(), lr=INIT_LR)
+        scaler = torch.cuda.amp.GradScaler(enabled=dtype == torch.float16)
+
+        n_steps = 3
+        start = time.perf_counter()
+        for _ in range(n_steps):
+            with imed_training.autocast(dtype, False):
+                preds = model(x).float()
+                loss = loss_fct(preds, gt)
+            optimizer.zero_grad()
+            scaler.scale(loss).backward()
+            scaler.step(optimizer)
+            scaler.update()
+        throughput = n_steps * input_shape[0] / (time.perf_counter() - start)
+        assert torch.isfinite(loss)
+        name = str(dtype).replace("torch.", "") if dtype else "float32"
+        results[name] = {"throughput": throughput, "activations": _get_activation_bytes(model, x, dtype)}
+        logger.info(f"{model_params['name']} {name}{' channels last' if channels_last else ''}: "
+                    f"{throughput:.1f} samples/s, activations {results[name]['activations'] / 1024 ** 2:.1f} MB.")
+
+    # The activations saved for the backward pass are stored in half precision
+    assert results["bfloat16"]["activations"] < results["float32"]["activations"]
+
+
+def test_load_checkpoint_scaler():
+    model = imed_models.Unet(in_channel=1, out_channel=1, **MODEL_DEFAULT)
+    optimizer = optim.Adam(model.parameters(), lr=INIT_LR)
+    scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, N_EPOCHS)
+    scaler = torch.cuda.amp.GradScaler(enabled=False)
+    fname = str(Path(__tmp_dir__, "checkpoint.pth.tar"))
+    torch.save({'epoch': 3, 'state_dict': model.state_dict(), 'optimizer': optimizer.state_dict(),
+                'scaler': scaler.state_dict(), 'gif_dict': {}, 'scheduler': scheduler, 'patience_count': 1,
+                'validation_loss': 0.5}, fname)
+    _, _, _, start_epoch, validation_loss, _, patience_count = imed_training.load_checkpoint(
+        model, optimizer, {}, scheduler, fname, scaler=scaler)
+    assert (start_epoch, validation_loss, patience_count) == (3, 0.5, 1)
+
+
+
+@pytest.mark.parametrize('asynchronous', [True, False])
+def test_checkpoint_writer(asynchronous):
+    model = imed_models.Unet(in_channel=1, out_channel=1, **MODEL_DEFAULT)
+    optimizer = optim.Adam(model.parameters(), lr=INIT_LR)
+    scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, N_EPOCHS)
+    writer = imed_training.CheckpointWriter(Path(__tmp_dir__, "checkpoint.pth.tar"), keep_last=2,
+                                            asynchronous=asynchronous)
+    for epoch in range(1, 4):
+        state = writer.save({'epoch': epoch, 'state_dict': model.state_dict(), 'optimizer': optimizer.state_dict(),
+                             'gif_dict': {}, 'scheduler': scheduler.state_dict(), 'patience_count': 0,
+                             'validation_loss': 1. / epoch})
+        # The saved copy is not modified by the training
+        with torch.no_grad():
+            next(model.parameters()).add_(1)
+        assert not torch.equal(next(iter(state['state_dict'].values())), next(iter(model.state_dict().values())))
+    writer.close()
+
+    # Only the last two checkpoints are kept
+    assert [torch.load(writer.get_fname(i))['epoch'] for i in range(2)] == [3, 2]
+    assert not writer.get_fname(2).is_file()
+    _, _, _, start_epoch, validation_loss, _, _ = imed_training.load_checkpoint(
+        model, optimizer, {}, scheduler, str(writer.fname))
+    assert (start_epoch, validation_loss) == (3, 1. / 3)
+    assert all(torch.equal(value, state['state_dict'][key]) for key, value in model.state_dict().items())
+
+
+def test_checkpoint_writer_interrupted(monkeypatch):
+    writer = imed_training.CheckpointWriter(Path(__tmp_dir__, "checkpoint.pth.tar"), keep_last=3, asynchronous=False)
+    for epoch in range(1, 3):
+        writer.save({'epoch': epoch})
+
+    # Interruption before the new checkpoint is renamed: the checkpoint file is still the previous one
+    replace = os.replace
+
+    def _replace(src, dst):
+        if str(src).endswith(".tmp"):
+            raise KeyboardInterrupt
+        replace(src, dst)
+
+    monkeypatch.setattr(imed_training.os, "replace", _replace)
+    with pytest.raises(KeyboardInterrupt):
+        writer.save({'epoch': 3})
+    assert [torch.load(writer.get_fname(i))['epoch'] for i in range(3)] == [2, 2, 1]
+
+
+@pytest.mark.parametrize('n_samples', [10, 7, 200])
+def test_get_validation_subset(n_samples):
+    # 20 empty and 80 non-empty ground truths
+    dataset = [{'gt': [np.full((4, 4), float(i >= 20))]} for i in range(100)]
+    indexes = imed_training.get_validation_subset(dataset, n_samples)
+    assert len(indexes) == min(n_samples, len(dataset)) and indexes == sorted(set(indexes))
+    # The labels are represented in proportion to their frequency, and the subset is fixed
+    assert sum(i < 20 for i in indexes) == round(len(indexes) * 0.2)
+    assert indexes == imed_training.get_validation_subset(dataset, n_samples)
+
+
+def test_get_fixed_sampler():
+    dataset = list(range(50))
+    sampler = imed_training.get_fixed_sampler(dataset)
+    # The samples are drawn in a random order, which is the same at each epoch
+    assert sorted(sampler) != list(sampler) and sorted(sampler) == dataset
+    assert list(sampler) == list(sampler) == imed_training.get_fixed_sampler(dataset)
+
+
 def teardown_function():
     remove_tmp_dir()